@@ -0,0 +1,406 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+import threading
+from collections import deque
+import gi
+gi.require_version('Gst', '1.0')
+from gi.repository import GObject, GLib, Gst
+
+try:
+    import pyds
+except ImportError:
+    pyds = None
+
+from batch_meta_iter import backend_for, iter_frames, iter_objects
+
+PGIE_CLASS_ID_FACE = 0
+VIDEO_EXTENSIONS = (".mp4", ".mkv", ".avi", ".mov", ".ts", ".h264", ".h265")
+CONFIG_PATH = "/opt/nvidia/deepstream/deepstream/samples/configs/deepstream-app/config_infer_primary.txt"
+
+
+def collect_files(pattern):
+    """Expand a directory or glob into a sorted list of video files"""
+    if os.path.isdir(pattern):
+        return sorted(os.path.join(pattern, name) for name in os.listdir(pattern)
+                      if name.lower().endswith(VIDEO_EXTENSIONS))
+    return sorted(path for path in glob.glob(pattern) if os.path.isfile(path))
+
+
+class FileJob:
+    def __init__(self, index, path, output_dir):
+        self.index = index
+        self.path = path
+        self.name = os.path.basename(path)
+        # The index keeps a.mp4 / a.mkv and same-named files from different directories apart
+        self.log_path = os.path.join(output_dir, f"{index:04d}_{self.name}.detections.jsonl")
+        self.bin = None
+        self.ghost = None
+        self.slot = None
+        self.log = None
+        # Frames handed to the muxer, and frames seen after nvinfer
+        self.pushed = 0
+        self.frames = 0
+        self.faces = 0
+        self.input_done = False
+        self.detached = False
+        self.last_pts = 0
+        self.duration_ns = 0
+        self.started = 0.0
+        self.finished = 0.0
+        self.error = None
+
+    @property
+    def media_seconds(self):
+        return max(self.duration_ns, self.last_pts) / Gst.SECOND
+
+    @property
+    def wall_seconds(self):
+        return (self.finished or time.monotonic()) - self.started
+
+
+class FileBatchDetection:
+    """Decodes up to `parallelism` files at once into one batched nvstreammux and nvinfer
+
+    Each file is a source bin on its own muxer sink pad; frame_meta.source_id
+    is that pad's index, which routes detections to the file's log. A file's
+    EOS is dropped before the muxer, so the shared pipeline keeps running:
+    the pad is released and reused by the next file. Frames already in the
+    muxer or nvinfer still belong to the old file, so each pad keeps a FIFO
+    of its files and a file ends once as many frames have come out of
+    nvinfer as went into the muxer.
+    """
+
+    def __init__(self, paths, parallelism=4, output_dir="output/batch", config_path=CONFIG_PATH,
+                 width=1920, height=1080, drain_timeout=10):
+        GObject.threads_init()
+        Gst.init(None)
+        self.paths = paths
+        self.parallelism = max(1, parallelism)
+        self.output_dir = output_dir
+        self.config_path = config_path
+        self.width = width
+        self.height = height
+        self.drain_timeout = drain_timeout
+        self.loop = None
+        self.pipeline = None
+        self.streammux = None
+        self.queue = []
+        self.active = {}
+        self.done = []
+        self.free_slots = list(range(self.parallelism))
+        # Muxer pad index -> files whose frames are still coming out of nvinfer, oldest first
+        self.slot_jobs = {slot: deque() for slot in range(self.parallelism)}
+        self.lock = threading.Lock()
+        self.started = 0.0
+
+    def create_pipeline(self):
+        pipeline = Gst.Pipeline.new("batch")
+        streammux = Gst.ElementFactory.make("nvstreammux", "streammux")
+        pgie = Gst.ElementFactory.make("nvinfer", "primary-inference")
+        sink = Gst.ElementFactory.make("fakesink", "fakesink")
+        if not all([streammux, pgie, sink]):
+            print("Unable to create pipeline elements")
+            return None
+
+        # Offline input: no live pacing anywhere, so the pipeline runs as fast as decode and inference allow
+        streammux.set_property("width", self.width)
+        streammux.set_property("height", self.height)
+        streammux.set_property("batch-size", self.parallelism)
+        streammux.set_property("batched-push-timeout", 40000)
+        streammux.set_property("live-source", 0)
+
+        pgie.set_property("config-file-path", self.config_path)
+        pgie.set_property("batch-size", self.parallelism)
+
+        sink.set_property("sync", False)
+        sink.set_property("async", False)
+
+        for element in [streammux, pgie, sink]:
+            pipeline.add(element)
+        streammux.link(pgie)
+        pgie.link(sink)
+
+        pgiesrcpad = pgie.get_static_pad("src")
+        pgiesrcpad.add_probe(Gst.PadProbeType.BUFFER, self.pgie_src_pad_buffer_probe, 0)
+
+        bus = pipeline.get_bus()
+        bus.add_signal_watch()
+        bus.connect("message", self.on_message)
+        self.streammux = streammux
+        return pipeline
+
+    def create_source_bin(self, job):
+        source_bin = Gst.Bin.new(f"file-{job.index}")
+        source = Gst.ElementFactory.make("filesrc", "file-source")
+        decoder = Gst.ElementFactory.make("decodebin", "decoder")
+        nvvidconv_src = Gst.ElementFactory.make("nvvideoconvert", "nvvidconv_src")
+        caps_nvmm = Gst.ElementFactory.make("capsfilter", "nvmm_caps")
+        if not all([source, decoder, nvvidconv_src, caps_nvmm]):
+            print(f"Unable to create source elements for {job.name}")
+            return None
+
+        source.set_property("location", job.path)
+        caps_nvmm.set_property("caps", Gst.Caps.from_string("video/x-raw(memory:NVMM)"))
+        for element in [source, decoder, nvvidconv_src, caps_nvmm]:
+            source_bin.add(element)
+        source.link(decoder)
+        nvvidconv_src.link(caps_nvmm)
+        decoder.connect("pad-added", self.on_decoder_pad_added, nvvidconv_src)
+
+        job.ghost = Gst.GhostPad.new("src", caps_nvmm.get_static_pad("src"))
+        source_bin.add_pad(job.ghost)
+        job.ghost.add_probe(Gst.PadProbeType.BUFFER | Gst.PadProbeType.EVENT_DOWNSTREAM, self.source_probe, job)
+        return source_bin
+
+    def on_decoder_pad_added(self, decoder, pad, nvvidconv_src):
+        caps = pad.get_current_caps() or pad.query_caps(None)
+        if not caps.get_structure(0).get_name().startswith("video/"):
+            return
+        sinkpad = nvvidconv_src.get_static_pad("sink")
+        if not sinkpad.is_linked():
+            pad.link(sinkpad)
+
+    def source_probe(self, pad, info, job):
+        """Counts frames a file hands to the muxer and keeps its EOS from reaching the muxer"""
+        if info.type & Gst.PadProbeType.BUFFER:
+            with self.lock:
+                job.pushed += 1
+            return Gst.PadProbeReturn.OK
+        event = info.get_event()
+        if event is not None and event.type == Gst.EventType.EOS:
+            self.end_of_input(job)
+            GLib.idle_add(self.detach, job)
+            return Gst.PadProbeReturn.DROP
+        return Gst.PadProbeReturn.OK
+
+    def end_of_input(self, job):
+        with self.lock:
+            job.input_done = True
+            self._check_drained(job)
+
+    def _check_drained(self, job):
+        """With self.lock held: hand a file whose frames have all come out of nvinfer to finish()"""
+        if job.input_done and job.frames >= job.pushed:
+            jobs = self.slot_jobs[job.slot]
+            if jobs and jobs[0] is job:
+                jobs.popleft()
+                GLib.idle_add(self.finish, job)
+
+    def pgie_src_pad_buffer_probe(self, pad, info, u_data):
+        gst_buffer = info.get_buffer()
+        if not gst_buffer or pyds is None:
+            return Gst.PadProbeReturn.OK
+
+        backend = backend_for(pyds)
+        batch_meta = backend.batch_meta(gst_buffer)
+        for frame_meta in iter_frames(batch_meta, backend):
+            faces = []
+            for obj_meta in iter_objects(frame_meta, backend, PGIE_CLASS_ID_FACE):
+                rect = obj_meta.rect_params
+                faces.append([round(rect.left), round(rect.top), round(rect.width), round(rect.height),
+                              round(obj_meta.confidence, 3)])
+
+            # The log line goes out before the drain check can hand the file to finish(), which closes the log
+            with self.lock:
+                jobs = self.slot_jobs.get(frame_meta.source_id)
+                job = jobs[0] if jobs else None
+                if job is None:
+                    continue
+                job.frames += 1
+                job.last_pts = max(job.last_pts, frame_meta.buf_pts)
+                if faces:
+                    job.faces += len(faces)
+                    job.log.write(json.dumps({"frame": job.frames - 1,
+                                              "pts": frame_meta.buf_pts / Gst.SECOND,
+                                              "faces": faces}) + "\n")
+                self._check_drained(job)
+
+        return Gst.PadProbeReturn.OK
+
+    def attach(self, job, slot):
+        job.bin = self.create_source_bin(job)
+        if job.bin is None:
+            return False
+        job.slot = slot
+        self.pipeline.add(job.bin)
+        sinkpad = self.streammux.get_request_pad(f"sink_{slot}")
+        if job.ghost.link(sinkpad) != Gst.PadLinkReturn.OK:
+            print(f"Unable to link {job.name} to the muxer")
+            self.streammux.release_request_pad(sinkpad)
+            self.pipeline.remove(job.bin)
+            return False
+        with self.lock:
+            self.slot_jobs[slot].append(job)
+        job.bin.sync_state_with_parent()
+        return True
+
+    def detach(self, job):
+        """Take a file's source bin out of the pipeline and free its muxer pad for the next file"""
+        if job.detached:
+            return False
+        job.detached = True
+        ok, duration = job.ghost.query_duration(Gst.Format.TIME)
+        if ok and duration > 0:
+            job.duration_ns = duration
+        sinkpad = job.ghost.get_peer()
+        job.bin.set_state(Gst.State.NULL)
+        if sinkpad is not None:
+            job.ghost.unlink(sinkpad)
+            self.streammux.release_request_pad(sinkpad)
+        self.pipeline.remove(job.bin)
+        job.bin = None
+        self.free_slots.append(job.slot)
+        GLib.timeout_add_seconds(self.drain_timeout, self.drain_timed_out, job)
+        self.start_next()
+        return False
+
+    def drain_timed_out(self, job):
+        """Frames the muxer never batched would hold a file open forever"""
+        if not job.finished:
+            with self.lock:
+                jobs = self.slot_jobs[job.slot]
+                if job in jobs:
+                    jobs.remove(job)
+            self.finish(job, job.error or f"{job.pushed - job.frames} frames never came out of nvinfer")
+        return False
+
+    def start_next(self):
+        while self.queue and self.free_slots:
+            job = self.queue.pop(0)
+            slot = self.free_slots.pop(0)
+            job.log = open(job.log_path, 'w')
+            job.started = time.monotonic()
+            if not self.attach(job, slot):
+                self.free_slots.append(slot)
+                job.log.close()
+                job.error = "source creation failed"
+                job.finished = time.monotonic()
+                self.done.append(job)
+                continue
+            self.active[job.index] = job
+            print(f"▶️  [{job.index + 1}/{len(self.paths)}] {job.name} on sink_{slot}")
+        if not self.queue and not self.active:
+            self.loop.quit()
+
+    def finish(self, job, error=None):
+        if job.finished:
+            return False
+        job.finished = time.monotonic()
+        job.error = job.error or error
+        with self.lock:
+            job.log.close()
+        self.active.pop(job.index, None)
+        self.done.append(job)
+        speed = job.media_seconds / job.wall_seconds if job.wall_seconds > 0 else 0.0
+        status = f"❌ {job.error}" if job.error else "✅"
+        print(f"{status} [{len(self.done)}/{len(self.paths)}] {job.name}: {job.frames} frames, "
+              f"{job.faces} faces, {job.media_seconds:.1f}s media in {job.wall_seconds:.1f}s ({speed:.1f}x real time)")
+        if not self.queue and not self.active:
+            self.loop.quit()
+        return False
+
+    def job_for(self, element):
+        """The file whose source bin holds `element`, or None for the shared muxer/nvinfer"""
+        while element is not None:
+            for job in self.active.values():
+                if job.bin is not None and element == job.bin:
+                    return job
+            element = element.get_parent()
+        return None
+
+    def on_message(self, bus, message):
+        if message.type != Gst.MessageType.ERROR:
+            return
+        err, debug = message.parse_error()
+        job = self.job_for(message.src)
+        print(f"Error in {job.name if job else message.src.get_name()}: {err}")
+        if debug:
+            print(f"Debug: {debug}")
+        if job is not None:
+            job.error = str(err)
+            self.end_of_input(job)
+            self.detach(job)
+            return
+        # The shared muxer or nvinfer failed: nothing else can finish
+        for job in list(self.active.values()):
+            self.finish(job, str(err))
+        for job in self.queue:
+            job.error = str(err)
+            self.done.append(job)
+        self.queue = []
+        self.loop.quit()
+
+    def report_progress(self):
+        for job in list(self.active.values()):
+            if job.detached:
+                continue
+            ok, position = job.ghost.query_position(Gst.Format.TIME)
+            ok_duration, duration = job.ghost.query_duration(Gst.Format.TIME)
+            if ok and ok_duration and duration > 0:
+                print(f"   {job.name}: {100.0 * position / duration:.0f}% ({job.frames} frames, {job.faces} faces)")
+        return bool(self.active or self.queue)
+
+    def run(self):
+        if not self.paths:
+            print("No video files found")
+            return False
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.pipeline = self.create_pipeline()
+        if self.pipeline is None:
+            return False
+        self.queue = [FileJob(index, path, self.output_dir) for index, path in enumerate(self.paths)]
+        self.loop = GObject.MainLoop()
+        self.started = time.monotonic()
+        print(f"🎬 Processing {len(self.paths)} files, {self.parallelism} at a time in batches of {self.parallelism}")
+        self.start_next()
+        if self.pipeline.set_state(Gst.State.PLAYING) == Gst.StateChangeReturn.FAILURE:
+            for job in list(self.active.values()):
+                self.finish(job, "failed to start")
+        GLib.timeout_add_seconds(5, self.report_progress)
+
+        try:
+            if self.active:
+                self.loop.run()
+        except KeyboardInterrupt:
+            print("\nStopping batch...")
+            for job in list(self.active.values()):
+                self.finish(job, "interrupted")
+
+        self.pipeline.set_state(Gst.State.NULL)
+        self.pipeline.get_bus().remove_signal_watch()
+        self.print_report()
+        return all(job.error is None for job in self.done)
+
+    def print_report(self):
+        wall = time.monotonic() - self.started
+        media = sum(job.media_seconds for job in self.done)
+        frames = sum(job.frames for job in self.done)
+        failed = [job for job in self.done if job.error]
+        print("\n📋 Batch report")
+        print(f"   Files: {len(self.done)} processed, {len(failed)} failed")
+        print(f"   Frames: {frames} ({frames / wall:.1f} fps aggregate)" if wall > 0 else f"   Frames: {frames}")
+        if wall > 0:
+            print(f"   Media: {media:.1f}s in {wall:.1f}s wall = {media / wall:.1f}x real time")
+        print(f"   Logs: {self.output_dir}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run face detection over recorded video files")
+    parser.add_argument("input", help="directory or glob of video files")
+    parser.add_argument("-j", "--parallelism", type=int, default=4, help="files decoded concurrently into one batch")
+    parser.add_argument("-o", "--output", default="output/batch", help="directory for per-file detection logs")
+    args = parser.parse_args()
+
+    detection = FileBatchDetection(collect_files(args.input), args.parallelism, args.output)
+    return 0 if detection.run() else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
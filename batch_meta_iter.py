@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+
+import sys
+import time
+
+
+class PydsBackend:
+    """Walks real NvDs metadata; every list node has to be cast through pyds"""
+
+    def __init__(self, module):
+        self.module = module
+        self.frame_cast = module.NvDsFrameMeta.cast
+        self.object_cast = module.NvDsObjectMeta.cast
+
+    def batch_meta(self, gst_buffer):
+        return self.module.gst_buffer_get_nvds_batch_meta(hash(gst_buffer))
+
+
+class PythonBackend:
+    """Walks plain Python lists whose node.data already is the meta object"""
+    frame_cast = None
+    object_cast = None
+
+    def batch_meta(self, batch_meta):
+        return batch_meta
+
+
+PYTHON_BACKEND = PythonBackend()
+_backend_cache = {}
+
+
+def backend_for(module):
+    """Cached pyds backend, so per-batch probes don't re-resolve the cast functions"""
+    backend = _backend_cache.get(id(module))
+    if backend is None or backend.module is not module:
+        backend = _backend_cache[id(module)] = PydsBackend(module)
+    return backend
+
+
+def iter_frames(batch_meta, backend=PYTHON_BACKEND):
+    """Yield the frame metas of a batch"""
+    cast = backend.frame_cast
+    l_frame = batch_meta.frame_meta_list
+    if cast is None:
+        while l_frame is not None:
+            yield l_frame.data
+            l_frame = l_frame.next
+        return
+    while l_frame is not None:
+        try:
+            frame_meta = cast(l_frame.data)
+        except StopIteration:
+            return
+        yield frame_meta
+        try:
+            l_frame = l_frame.next
+        except StopIteration:
+            return
+
+
+def iter_objects(frame_meta, backend=PYTHON_BACKEND, class_ids=None, min_confidence=None,
+                 min_width=0, min_height=0):
+    """Yield the object metas of a frame that pass the filters
+
+    Filters run cheapest first while walking the list: class_id, then
+    confidence, and only then rect_params, whose wrapper is never created
+    for objects already rejected. class_ids may be a single id or a set.
+    """
+    cast = backend.object_cast
+    single_class = class_ids if isinstance(class_ids, int) else None
+    check_class = class_ids is not None and single_class is None
+    check_size = min_width > 0 or min_height > 0
+    l_obj = frame_meta.obj_meta_list
+    while l_obj is not None:
+        if cast is None:
+            obj_meta = l_obj.data
+        else:
+            try:
+                obj_meta = cast(l_obj.data)
+            except StopIteration:
+                return
+        if single_class is not None:
+            accept = obj_meta.class_id == single_class
+        elif check_class:
+            accept = obj_meta.class_id in class_ids
+        else:
+            accept = True
+        if accept and min_confidence is not None and obj_meta.confidence < min_confidence:
+            accept = False
+        if accept and check_size:
+            rect = obj_meta.rect_params
+            accept = rect.width >= min_width and rect.height >= min_height
+        if accept:
+            yield obj_meta
+        if cast is None:
+            l_obj = l_obj.next
+        else:
+            try:
+                l_obj = l_obj.next
+            except StopIteration:
+                return
+
+
+def iter_batch_objects(batch_meta, backend=PYTHON_BACKEND, class_ids=None, min_confidence=None,
+                       min_width=0, min_height=0):
+    """Yield (frame_meta, obj_meta) pairs across a whole batch"""
+    for frame_meta in iter_frames(batch_meta, backend):
+        for obj_meta in iter_objects(frame_meta, backend, class_ids, min_confidence, min_width, min_height):
+            yield frame_meta, obj_meta
+
+
+def benchmark(num_objects=10000, objects_per_frame=50, repeats=50):
+    """Compare a cast-everything-then-filter walk with the filtered generators on synthetic lists"""
+    from metadata_replay import (ReplayBatchMeta, ReplayFrameMeta, ReplayObjectMeta, ReplayRectParams,
+                                 make_replay_pyds)
+
+    frames = []
+    for frame_num in range(num_objects // objects_per_frame):
+        objects = [ReplayObjectMeta(i % 4, i, (i * 37 % 100) / 100.0,
+                                    ReplayRectParams(10.0, 10.0, float(8 + i % 64), float(8 + i % 64)))
+                   for i in range(objects_per_frame)]
+        frames.append(ReplayFrameMeta(0, frame_num, frame_num, 0, 1920, 1080, objects))
+    batch_meta = ReplayBatchMeta(frames)
+    replay_pyds = make_replay_pyds()
+    pyds_backend = backend_for(replay_pyds)
+
+    def naive():
+        kept = 0
+        l_frame = batch_meta.frame_meta_list
+        while l_frame is not None:
+            try:
+                frame_meta = replay_pyds.NvDsFrameMeta.cast(l_frame.data)
+            except StopIteration:
+                break
+            l_obj = frame_meta.obj_meta_list
+            while l_obj is not None:
+                try:
+                    obj_meta = replay_pyds.NvDsObjectMeta.cast(l_obj.data)
+                except StopIteration:
+                    break
+                rect = obj_meta.rect_params
+                box = (obj_meta.class_id, obj_meta.confidence, rect.width, rect.height)
+                if box[0] == 0 and box[1] >= 0.5 and box[2] >= 32 and box[3] >= 32:
+                    kept += 1
+                try:
+                    l_obj = l_obj.next
+                except StopIteration:
+                    break
+            try:
+                l_frame = l_frame.next
+            except StopIteration:
+                break
+        return kept
+
+    def generator(backend):
+        return sum(1 for _ in iter_batch_objects(batch_meta, backend, 0, 0.5, 32, 32))
+
+    runs = [("naive walk", naive),
+            ("generators (pyds backend)", lambda: generator(pyds_backend)),
+            ("generators (python backend)", lambda: generator(PYTHON_BACKEND))]
+    for name, fn in runs:
+        kept = fn()
+        start = time.perf_counter()
+        for _ in range(repeats):
+            fn()
+        elapsed = (time.perf_counter() - start) / repeats
+        print(f"{name:>28}: {elapsed * 1e3:6.2f} ms per {num_objects} objects "
+              f"({num_objects / elapsed / 1e6:.2f} M objects/sec, {kept} kept)")
+
+
+def main():
+    benchmark()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
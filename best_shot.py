@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import cv2
+import gi
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst
+
+try:
+    import pyds
+except ImportError:
+    pyds = None
+
+from batch_meta_iter import backend_for, iter_frames, iter_objects
+
+PGIE_CLASS_ID_FACE = 0
+UNTRACKED_OBJECT_ID = 0xFFFFFFFFFFFFFFFF
+# Jetson maps the NVMM surface for the CPU on each get_nvds_buf_surface and needs an explicit unmap
+IS_AARCH64 = os.uname().machine == 'aarch64'
+
+
+class FaceQualityScorer:
+    """Scores face crops in batches: sharpness, size, exposure, frontalness and position in the frame
+
+    Box-only scores (size, position) are computed for every candidate; pixel
+    scores run on crops downscaled to `size` x `size` grey and stacked, so a
+    whole batch goes through each measure as one array operation.
+    """
+
+    def __init__(self, size=64, target_face_px=112, sharpness_scale=150.0, weights=None):
+        self.size = size
+        self.target_face_px = target_face_px
+        self.sharpness_scale = sharpness_scale
+        self.weights = weights or {"sharpness": 0.35, "size": 0.25, "exposure": 0.15,
+                                   "frontal": 0.15, "position": 0.10}
+        self.total_weight = sum(self.weights.values())
+
+    def box_scores(self, boxes, frame_width, frame_height):
+        """(N, 4) left, top, width, height -> size and position scores in [0, 1]"""
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        side = np.sqrt(boxes[:, 2] * boxes[:, 3])
+        size = np.clip(side / self.target_face_px, 0.0, 1.0)
+        # Faces cut by the frame edge are partial; want a quarter face of margin all round
+        margin = np.minimum.reduce([boxes[:, 0], boxes[:, 1],
+                                    frame_width - boxes[:, 0] - boxes[:, 2],
+                                    frame_height - boxes[:, 1] - boxes[:, 3]])
+        position = np.clip(margin / np.maximum(0.25 * side, 1.0), 0.0, 1.0)
+        return size, position
+
+    def upper_bound(self, size, position):
+        """Best total a face with these box scores could reach"""
+        return (self.total_weight - self.weights["size"] * (1.0 - size)
+                - self.weights["position"] * (1.0 - position)) / self.total_weight
+
+    def downscale(self, frame, boxes, rgba=False):
+        """Grey size x size crops of the boxes as one (N, size, size) float32 array"""
+        height, width = frame.shape[:2]
+        crops = np.empty((len(boxes), self.size, self.size), dtype=np.float32)
+        code = cv2.COLOR_RGBA2GRAY if rgba else cv2.COLOR_BGR2GRAY
+        for index, (left, top, box_width, box_height) in enumerate(boxes):
+            x0, y0 = max(0, int(left)), max(0, int(top))
+            x1, y1 = min(width, int(left + box_width)), min(height, int(top + box_height))
+            region = frame[y0:max(y1, y0 + 1), x0:max(x1, x0 + 1)]
+            crops[index] = cv2.resize(cv2.cvtColor(region, code), (self.size, self.size),
+                                      interpolation=cv2.INTER_AREA)
+        return crops / 255.0
+
+    def pixel_scores(self, crops):
+        """(N, size, size) grey in [0, 1] -> sharpness, exposure and frontal scores"""
+        # Laplacian variance, from shifted views of the whole stack at once
+        laplacian = (crops[:, :-2, 1:-1] + crops[:, 2:, 1:-1] + crops[:, 1:-1, :-2] + crops[:, 1:-1, 2:]
+                     - 4.0 * crops[:, 1:-1, 1:-1])
+        variance = laplacian.reshape(len(crops), -1).var(axis=1) * 255.0 ** 2
+        sharpness = 1.0 - np.exp(-variance / self.sharpness_scale)
+        # Mid-grey mean is best; clipped shadows and highlights cost extra
+        mean = crops.reshape(len(crops), -1).mean(axis=1)
+        clipped = ((crops < 0.02) | (crops > 0.98)).reshape(len(crops), -1).mean(axis=1)
+        exposure = np.clip(1.0 - 2.0 * np.abs(mean - 0.5) - clipped, 0.0, 1.0)
+        # A frontal face is close to mirror symmetric
+        asymmetry = np.abs(crops - crops[:, :, ::-1]).reshape(len(crops), -1).mean(axis=1)
+        frontal = np.clip(1.0 - 4.0 * asymmetry, 0.0, 1.0)
+        return sharpness, exposure, frontal
+
+    def combine(self, sharpness, size, exposure, frontal, position):
+        weights = self.weights
+        return (weights["sharpness"] * sharpness + weights["size"] * size + weights["exposure"] * exposure
+                + weights["frontal"] * frontal + weights["position"] * position) / self.total_weight
+
+    def score(self, frame, boxes, rgba=False):
+        """Quality in [0, 1] for each (left, top, width, height) box of one frame"""
+        if not len(boxes):
+            return np.zeros(0, dtype=np.float32)
+        size, position = self.box_scores(boxes, frame.shape[1], frame.shape[0])
+        sharpness, exposure, frontal = self.pixel_scores(self.downscale(frame, boxes, rgba))
+        return self.combine(sharpness, size, exposure, frontal, position)
+
+
+class BestShot:
+    __slots__ = ("score", "crop", "box", "frame_num", "last_seen")
+
+    def __init__(self, score, crop, box, frame_num):
+        self.score = score
+        self.crop = crop
+        self.box = box
+        self.frame_num = frame_num
+        self.last_seen = frame_num
+
+
+class BestShotSelector:
+    """Keeps only the best-scoring crop of each active track and emits it when the track ends
+
+    Memory is one crop per active track. Candidates whose box alone rules
+    out beating the current best are never cropped or scored.
+    """
+
+    def __init__(self, scorer=None, max_missing_frames=30, out_dir="output/best_shots", on_best=None,
+                 padding=0.15, jpeg_quality=95):
+        self.scorer = scorer or FaceQualityScorer()
+        self.max_missing_frames = max_missing_frames
+        self.out_dir = out_dir
+        self.on_best = on_best or self._save
+        self.padding = padding
+        self.jpeg_quality = jpeg_quality
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="best-shot")
+        self.tracks = {}
+        self.counts = {"candidates": 0, "pruned": 0, "scored": 0, "replaced": 0, "emitted": 0}
+
+    def update(self, frame, source_id, frame_num, detections, rgba=False):
+        """Offer one frame's tracked detections, (object_id, left, top, width, height)"""
+        height, width = frame.shape[:2]
+        tracked = [d for d in detections if d[0] != UNTRACKED_OBJECT_ID]
+        if tracked:
+            boxes = np.array([d[1:5] for d in tracked], dtype=np.float32)
+            size, position = self.scorer.box_scores(boxes, width, height)
+            bound = self.scorer.upper_bound(size, position)
+            candidates = []
+            for index, detection in enumerate(tracked):
+                best = self.tracks.get((source_id, detection[0]))
+                if best is not None:
+                    best.last_seen = frame_num
+                if best is None or bound[index] > best.score:
+                    candidates.append(index)
+            self.counts["candidates"] += len(tracked)
+            self.counts["pruned"] += len(tracked) - len(candidates)
+            if candidates:
+                crops = self.scorer.downscale(frame, boxes[candidates], rgba)
+                sharpness, exposure, frontal = self.scorer.pixel_scores(crops)
+                scores = self.scorer.combine(sharpness, size[candidates], exposure, frontal, position[candidates])
+                self.counts["scored"] += len(candidates)
+                for index, score in zip(candidates, scores):
+                    key = (source_id, tracked[index][0])
+                    best = self.tracks.get(key)
+                    if best is None or score > best.score:
+                        # Copy now: the frame surface is recycled once the probe returns
+                        crop = self._crop(frame, boxes[index])
+                        if best is None:
+                            self.tracks[key] = BestShot(float(score), crop, tuple(boxes[index]), frame_num)
+                        else:
+                            best.score, best.crop, best.box, best.frame_num = (float(score), crop,
+                                                                               tuple(boxes[index]), frame_num)
+                            self.counts["replaced"] += 1
+        self._expire(source_id, frame_num)
+
+    def _crop(self, frame, box):
+        left, top, box_width, box_height = box
+        pad_w, pad_h = box_width * self.padding, box_height * self.padding
+        height, width = frame.shape[:2]
+        x0, y0 = max(0, int(left - pad_w)), max(0, int(top - pad_h))
+        x1, y1 = min(width, int(left + box_width + pad_w)), min(height, int(top + box_height + pad_h))
+        return np.array(frame[y0:y1, x0:x1], copy=True)
+
+    def _expire(self, source_id, frame_num):
+        ended = [key for key, best in self.tracks.items()
+                 if key[0] == source_id and frame_num - best.last_seen > self.max_missing_frames]
+        for key in ended:
+            self._emit(key, self.tracks.pop(key))
+
+    def _emit(self, key, best):
+        self.counts["emitted"] += 1
+        self.on_best(key[0], key[1], best)
+
+    def _save(self, source_id, object_id, best):
+        self.executor.submit(self._write, source_id, object_id, best)
+
+    def _write(self, source_id, object_id, best):
+        try:
+            os.makedirs(self.out_dir, exist_ok=True)
+            crop = cv2.cvtColor(best.crop, cv2.COLOR_RGBA2BGR) if best.crop.shape[2] == 4 else best.crop
+            path = os.path.join(self.out_dir, f"src{source_id}_track{object_id}_q{best.score:.2f}.jpg")
+            cv2.imwrite(path, crop, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+        except Exception as e:
+            print(f"Unable to save best shot of track {object_id}: {e}")
+
+    def best_shot_probe(self, pad, info, u_data):
+        """Buffer probe on an RGBA NVMM pad before drawing (osd sink pad); needs tracker object ids"""
+        gst_buffer = info.get_buffer()
+        if not gst_buffer:
+            return Gst.PadProbeReturn.OK
+
+        backend = backend_for(pyds)
+        batch_meta = backend.batch_meta(gst_buffer)
+        for frame_meta in iter_frames(batch_meta, backend):
+            detections = []
+            for obj_meta in iter_objects(frame_meta, backend, PGIE_CLASS_ID_FACE):
+                if obj_meta.object_id == UNTRACKED_OBJECT_ID:
+                    continue
+                rect = obj_meta.rect_params
+                detections.append((obj_meta.object_id, rect.left, rect.top, rect.width, rect.height))
+            if detections:
+                frame = pyds.get_nvds_buf_surface(hash(gst_buffer), frame_meta.batch_id)
+                try:
+                    self.update(frame, frame_meta.source_id, frame_meta.frame_num, detections, rgba=True)
+                finally:
+                    if IS_AARCH64:
+                        pyds.unmap_nvds_buf_surface(hash(gst_buffer), frame_meta.batch_id)
+            else:
+                self._expire(frame_meta.source_id, frame_meta.frame_num)
+
+        return Gst.PadProbeReturn.OK
+
+    def stats(self):
+        return dict(self.counts, active_tracks=len(self.tracks),
+                    held_bytes=sum(best.crop.nbytes for best in self.tracks.values()))
+
+    def close(self):
+        """Emit the best shot of every track still active, then wait for the writes"""
+        for key in list(self.tracks):
+            self._emit(key, self.tracks.pop(key))
+        self.executor.shutdown(wait=True)
+
+
+def benchmark(batch=64, rounds=50, tracks=40, frames=300, width=1920, height=1080):
+    """CPU scoring throughput, and a selection run over synthetic tracks"""
+    rng = np.random.default_rng(0)
+    # Textured frame with a blurred copy, so sharp and soft faces are told apart
+    frame = rng.integers(0, 255, size=(height, width, 4), dtype=np.uint8)
+    frame = cv2.GaussianBlur(frame, (3, 3), 0)
+    soft = cv2.GaussianBlur(frame, (15, 15), 0)
+    scorer = FaceQualityScorer()
+    sides = rng.uniform(40, 200, batch)
+    boxes = np.column_stack([rng.uniform(0, width - 200, batch), rng.uniform(0, height - 200, batch), sides, sides])
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        crops = scorer.downscale(frame, boxes, rgba=True)
+    downscale_s = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(rounds):
+        scorer.pixel_scores(crops)
+    scoring_s = time.perf_counter() - start
+    faces = batch * rounds
+    print(f"Scoring {batch} faces per batch on CPU: crop+downscale {downscale_s / faces * 1e6:.0f} us/face, "
+          f"quality measures {scoring_s / faces * 1e6:.1f} us/face ({faces / (downscale_s + scoring_s):.0f} faces/s)")
+    box = np.array([[800.0, 400.0, 160.0, 160.0]])
+    print(f"Same face sharp vs blurred: {scorer.score(frame, box, rgba=True)[0]:.3f} vs "
+          f"{scorer.score(soft, box, rgba=True)[0]:.3f}")
+
+    emitted = []
+    selector = BestShotSelector(on_best=lambda source_id, object_id, best: emitted.append(best.score))
+    starts = rng.uniform((200, 200), (width - 400, height - 400), (tracks, 2))
+    lifetimes = rng.integers(30, frames, tracks)
+    start = time.perf_counter()
+    for frame_num in range(frames):
+        detections = []
+        for object_id in range(tracks):
+            if frame_num < lifetimes[object_id]:
+                # Faces walk up to the camera and away again
+                side = 40 + 120 * np.sin(np.pi * frame_num / lifetimes[object_id])
+                x, y = starts[object_id] + frame_num
+                detections.append((object_id, float(x), float(y), side, side))
+        selector.update(soft if frame_num % 3 else frame, 0, frame_num, detections, rgba=True)
+    selector.close()
+    elapsed = time.perf_counter() - start
+    stats = selector.stats()
+    print(f"{tracks} tracks over {frames} frames: {elapsed / frames * 1000:.2f} ms/frame, "
+          f"{stats['scored']} of {stats['candidates']} candidates scored ({stats['pruned']} pruned by box), "
+          f"{stats['replaced']} replacements, {stats['emitted']} best shots emitted")
+
+
+def main():
+    benchmark()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+
+import sys
+import time
+
+import numpy as np
+import gi
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst
+
+try:
+    import pyds
+except ImportError:
+    pyds = None
+
+from batch_meta_iter import backend_for, iter_batch_objects
+
+# Objects that fail the filter keep their meta but get this class, so class_id checks skip them
+FILTERED_CLASS_ID = -1
+
+
+def iou_matrix(boxes):
+    """Pairwise IoU of (N, 4) left/top/width/height boxes"""
+    x0, y0 = boxes[:, 0], boxes[:, 1]
+    x1, y1 = x0 + boxes[:, 2], y0 + boxes[:, 3]
+    area = boxes[:, 2] * boxes[:, 3]
+    iw = np.clip(np.minimum(x1[:, None], x1[None, :]) - np.maximum(x0[:, None], x0[None, :]), 0, None)
+    ih = np.clip(np.minimum(y1[:, None], y1[None, :]) - np.maximum(y0[:, None], y0[None, :]), 0, None)
+    inter = iw * ih
+    union = area[:, None] + area[None, :] - inter
+    return inter / np.maximum(union, 1e-6)
+
+
+class BoxFilter:
+    """Per-class thresholds, size and aspect gates, then NMS or weighted box fusion per batch"""
+
+    def __init__(self, class_thresholds=None, default_threshold=0.3, min_size=(16, 16),
+                 max_size=(4096, 4096), aspect_range=(0.4, 2.5), iou_threshold=0.45, method="nms"):
+        if method not in ("nms", "wbf"):
+            raise ValueError(f"Unknown box fusion method: {method}")
+        self.class_thresholds = class_thresholds or {}
+        self.default_threshold = default_threshold
+        self.min_size = min_size
+        self.max_size = max_size
+        self.aspect_range = aspect_range
+        self.iou_threshold = iou_threshold
+        self.method = method
+        self.batches = 0
+        self.boxes_in = 0
+        self.boxes_out = 0
+
+    def gate(self, boxes, scores, class_ids):
+        """Boolean mask of boxes passing the confidence, size and aspect-ratio gates"""
+        thresholds = np.full(len(scores), self.default_threshold, np.float32)
+        for class_id, threshold in self.class_thresholds.items():
+            thresholds[class_ids == class_id] = threshold
+        width, height = boxes[:, 2], boxes[:, 3]
+        aspect = width / np.maximum(height, 1e-6)
+        return ((scores >= thresholds)
+                & (width >= self.min_size[0]) & (height >= self.min_size[1])
+                & (width <= self.max_size[0]) & (height <= self.max_size[1])
+                & (aspect >= self.aspect_range[0]) & (aspect <= self.aspect_range[1]))
+
+    def filter(self, boxes, scores, class_ids, frame_ids):
+        """Return (keep mask, boxes) where boxes holds fused coordinates for wbf survivors"""
+        boxes = np.asarray(boxes, np.float32).reshape(-1, 4)
+        scores = np.asarray(scores, np.float32)
+        class_ids = np.asarray(class_ids, np.int64)
+        frame_ids = np.asarray(frame_ids, np.int64)
+        keep = np.zeros(len(boxes), bool)
+        out = boxes.copy()
+        self.batches += 1
+        self.boxes_in += len(boxes)
+
+        candidates = np.flatnonzero(self.gate(boxes, scores, class_ids))
+        if len(candidates) == 0:
+            return keep, out
+
+        # Shift each (frame, class) group into its own region so one IoU matrix covers the whole batch
+        groups = np.unique(np.stack([frame_ids[candidates], class_ids[candidates]], axis=1),
+                           axis=0, return_inverse=True)[1].ravel()
+        span = float(boxes[candidates, 0].max() + boxes[candidates, 2].max()) + 1.0
+        shifted = boxes[candidates].copy()
+        shifted[:, 0] += groups * span
+
+        order = np.argsort(-scores[candidates], kind="stable")
+        iou = iou_matrix(shifted[order])
+        ordered_scores = scores[candidates][order]
+        suppressed = np.zeros(len(order), bool)
+        for i in range(len(order)):
+            if suppressed[i]:
+                continue
+            cluster = (iou[i] > self.iou_threshold) & ~suppressed
+            cluster[i] = True
+            suppressed |= cluster
+            index = candidates[order[i]]
+            keep[index] = True
+            if self.method == "wbf" and cluster.sum() > 1:
+                weights = ordered_scores[cluster]
+                out[index] = (boxes[candidates[order[cluster]]] * weights[:, None]).sum(axis=0) / weights.sum()
+
+        self.boxes_out += int(keep.sum())
+        return keep, out
+
+    def filter_probe(self, pad, info, u_data):
+        """Buffer probe on the nvinfer src pad: filters every object of the batch in one pass"""
+        gst_buffer = info.get_buffer()
+        if not gst_buffer:
+            return Gst.PadProbeReturn.OK
+
+        backend = backend_for(pyds)
+        batch_meta = backend.batch_meta(gst_buffer)
+        objects = list(iter_batch_objects(batch_meta, backend))
+        if not objects:
+            return Gst.PadProbeReturn.OK
+
+        boxes = np.empty((len(objects), 4), np.float32)
+        scores = np.empty(len(objects), np.float32)
+        class_ids = np.empty(len(objects), np.int64)
+        frame_ids = np.empty(len(objects), np.int64)
+        for i, (frame_meta, obj_meta) in enumerate(objects):
+            rect = obj_meta.rect_params
+            boxes[i] = (rect.left, rect.top, rect.width, rect.height)
+            scores[i] = obj_meta.confidence
+            class_ids[i] = obj_meta.class_id
+            frame_ids[i] = frame_meta.batch_id
+
+        keep, fused = self.filter(boxes, scores, class_ids, frame_ids)
+        for i, (frame_meta, obj_meta) in enumerate(objects):
+            if not keep[i]:
+                obj_meta.class_id = FILTERED_CLASS_ID
+                obj_meta.rect_params.border_width = 0
+                obj_meta.text_params.display_text = ""
+            elif self.method == "wbf":
+                rect = obj_meta.rect_params
+                rect.left, rect.top, rect.width, rect.height = (float(v) for v in fused[i])
+
+        return Gst.PadProbeReturn.OK
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "boxes_in": self.boxes_in,
+            "boxes_out": self.boxes_out,
+            "kept_ratio": self.boxes_out / self.boxes_in if self.boxes_in else 0.0,
+        }
+
+
+def synthetic_batch(rng, frames, faces_per_frame, duplicates):
+    """Clusters of jittered duplicate boxes around each face, plus tiny and implausible boxes"""
+    boxes, scores, class_ids, frame_ids = [], [], [], []
+    for frame in range(frames):
+        centers = rng.uniform(100, 1700, size=(faces_per_frame, 2))
+        sizes = rng.uniform(30, 200, size=faces_per_frame)
+        for (cx, cy), size in zip(centers, sizes):
+            for _ in range(duplicates):
+                jitter = rng.normal(0, size * 0.05, size=4)
+                boxes.append((cx + jitter[0], cy + jitter[1], size + jitter[2], size * 1.2 + jitter[3]))
+                scores.append(rng.uniform(0.1, 0.99))
+                class_ids.append(0)
+                frame_ids.append(frame)
+        for _ in range(faces_per_frame):
+            boxes.append((rng.uniform(0, 1800), rng.uniform(0, 1000), rng.uniform(2, 12), rng.uniform(2, 60)))
+            scores.append(rng.uniform(0.1, 0.99))
+            class_ids.append(int(rng.integers(0, 4)))
+            frame_ids.append(frame)
+    return (np.array(boxes, np.float32), np.array(scores, np.float32),
+            np.array(class_ids), np.array(frame_ids))
+
+
+def benchmark(batch_sizes=(100, 200, 400, 800), repeats=200):
+    rng = np.random.default_rng(0)
+    print(f"{'boxes':>6} {'method':>6} {'ms/batch':>9} {'kept':>5}")
+    for total in batch_sizes:
+        frames = 4
+        faces = max(1, total // (frames * 6))
+        batch = synthetic_batch(rng, frames, faces, duplicates=5)
+        for method in ("nms", "wbf"):
+            box_filter = BoxFilter(class_thresholds={0: 0.4}, method=method)
+            keep, _ = box_filter.filter(*batch)
+            start = time.perf_counter()
+            for _ in range(repeats):
+                box_filter.filter(*batch)
+            elapsed = (time.perf_counter() - start) / repeats
+            print(f"{len(batch[0]):>6} {method:>6} {elapsed * 1e3:>9.3f} {int(keep.sum()):>5}")
+
+
+def main():
+    benchmark()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
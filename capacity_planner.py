@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import threading
+import subprocess
+import gi
+gi.require_version('Gst', '1.0')
+from gi.repository import GObject, GLib, Gst
+
+try:
+    import pyds
+except ImportError:
+    pyds = None
+
+from batch_meta_iter import backend_for, iter_frames
+from display_branch import process_cpu_seconds
+from thread_telemetry import read_rss
+
+DEFAULT_CONFIG = "/opt/nvidia/deepstream/deepstream/samples/configs/deepstream-app/config_infer_primary.txt"
+
+
+def gpu_sources(streams, width, height, fps):
+    """videotestsrc → nvvideoconvert branches feeding the sink pads of an element named mux"""
+    return " ".join(
+        f"videotestsrc is-live=true pattern=ball ! video/x-raw,width={width},height={height},framerate={fps}/1 ! "
+        f"nvvideoconvert ! video/x-raw(memory:NVMM),format=NV12 ! queue name=branch{i} ! mux.sink_{i}"
+        for i in range(streams))
+
+
+def gpu_pipeline(streams, width, height, fps, config_path):
+    """videotestsrc → nvvideoconvert → nvstreammux (batch = streams) → nvinfer → fakesink"""
+    sources = gpu_sources(streams, width, height, fps)
+    return (f"nvstreammux name=mux batch-size={streams} width={width} height={height} live-source=1 "
+            f"batched-push-timeout={int(1e6 / fps)} ! nvinfer name=infer config-file-path={config_path} "
+            f"batch-size={streams} ! fakesink name=sink sync=false {sources}")
+
+
+def cpu_pipeline(streams, width, height, fps, model_size, infer_us):
+    """The non-GPU stages per stream, merged into one serial inference stand-in
+
+    funnel feeds a single identity whose per-frame sleep stands in for a
+    shared engine; every source still pays for its own colour conversion
+    and scaling to the model input size.
+    """
+    sources = " ".join(
+        f"videotestsrc is-live=true pattern=ball ! video/x-raw,width={width},height={height},framerate={fps}/1 ! "
+        f"videoconvert ! videoscale ! video/x-raw,format=RGBA,width={model_size[0]},height={model_size[1]} ! "
+        f"queue name=branch{i} max-size-buffers=4 leaky=downstream ! mux."
+        for i in range(streams))
+    return (f"funnel name=mux ! identity name=infer sleep-time={infer_us} ! fakesink name=sink sync=false "
+            f"{sources}")
+
+
+def gpu_utilisation():
+    """(GPU %, memory MiB) from nvidia-smi, or (None, None) without one"""
+    if not shutil.which("nvidia-smi"):
+        return None, None
+    try:
+        output = subprocess.run(["nvidia-smi", "--query-gpu=utilization.gpu,memory.used",
+                                 "--format=csv,noheader,nounits"], capture_output=True, text=True, timeout=5).stdout
+        util, memory = output.splitlines()[0].split(",")
+        return float(util), float(memory)
+    except (OSError, ValueError, IndexError, subprocess.TimeoutExpired):
+        return None, None
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+class Trial:
+    """Runs one pipeline with N streams and measures per-stream FPS, latency and resources"""
+
+    def __init__(self, streams, description, batched=False, warmup=3.0, duration=5.0):
+        self.streams = streams
+        self.description = description
+        # Batched buffers carry each frame's capture PTS in its frame meta
+        self.batched = batched
+        self.warmup = warmup
+        self.duration = duration
+        self.lock = threading.Lock()
+        self.measuring = False
+        self.frames = [0] * streams
+        self.latencies = []
+        self.pipeline = None
+
+    def branch_probe(self, pad, info, source_id):
+        if self.measuring:
+            with self.lock:
+                self.frames[source_id] += 1
+        return Gst.PadProbeReturn.OK
+
+    def sink_probe(self, pad, info, u_data):
+        if not self.measuring:
+            return Gst.PadProbeReturn.OK
+        gst_buffer = info.get_buffer()
+        clock = self.pipeline.get_clock()
+        if not gst_buffer or clock is None:
+            return Gst.PadProbeReturn.OK
+        running_time = clock.get_time() - self.pipeline.get_base_time()
+        # Live sources stamp buffers with the running time at capture
+        if self.batched and pyds is not None:
+            backend = backend_for(pyds)
+            pts = [frame_meta.buf_pts for frame_meta in iter_frames(backend.batch_meta(gst_buffer), backend)]
+        else:
+            pts = [gst_buffer.pts]
+        with self.lock:
+            self.latencies.extend((running_time - p) / Gst.MSECOND for p in pts if p != Gst.CLOCK_TIME_NONE)
+        return Gst.PadProbeReturn.OK
+
+    def run(self):
+        self.pipeline = Gst.parse_launch(self.description)
+        for i in range(self.streams):
+            self.pipeline.get_by_name(f"branch{i}").get_static_pad("src").add_probe(
+                Gst.PadProbeType.BUFFER, self.branch_probe, i)
+        self.pipeline.get_by_name("sink").get_static_pad("sink").add_probe(
+            Gst.PadProbeType.BUFFER, self.sink_probe, 0)
+
+        error = []
+        loop = GLib.MainLoop()
+
+        def on_error(bus, message):
+            error.append(str(message.parse_error()[0]))
+            loop.quit()
+
+        bus = self.pipeline.get_bus()
+        bus.add_signal_watch()
+        bus.connect("message::error", on_error)
+        samples = {}
+
+        def begin():
+            self.measuring = True
+            samples["start"] = (time.monotonic(), process_cpu_seconds())
+            return False
+
+        def end():
+            self.measuring = False
+            samples["end"] = (time.monotonic(), process_cpu_seconds())
+            samples["rss"] = read_rss()
+            samples["gpu"] = gpu_utilisation()
+            loop.quit()
+            return False
+
+        self.pipeline.set_state(Gst.State.PLAYING)
+        GLib.timeout_add(int(self.warmup * 1000), begin)
+        GLib.timeout_add(int((self.warmup + self.duration) * 1000), end)
+        loop.run()
+        self.pipeline.set_state(Gst.State.NULL)
+        bus.remove_signal_watch()
+
+        if error or "end" not in samples:
+            return {"streams": self.streams, "error": error[0] if error else "no measurement"}
+        wall = samples["end"][0] - samples["start"][0]
+        cpu = samples["end"][1] - samples["start"][1]
+        per_stream = [frames / wall for frames in self.frames]
+        return {
+            "streams": self.streams,
+            "min_fps": min(per_stream),
+            "mean_fps": sum(per_stream) / len(per_stream),
+            "latency_ms": {p: percentile(self.latencies, p) for p in (50, 95, 99)},
+            "cpu_percent": cpu / wall * 100.0,
+            "rss_mib": samples["rss"] / 2**20,
+            "gpu_percent": samples["gpu"][0],
+            "gpu_mem_mib": samples["gpu"][1],
+        }
+
+
+class CapacityPlanner:
+    """Largest stream count holding a per-stream FPS and latency percentile: ramp up, then bisect"""
+
+    def __init__(self, mode="cpu", target_fps=30, max_latency_ms=200.0, latency_percentile=95,
+                 fps_tolerance=0.05, max_streams=64, width=1280, height=720, model_size=(640, 368),
+                 infer_us=2000, config_path=DEFAULT_CONFIG, warmup=3.0, duration=5.0):
+        self.mode = mode
+        self.target_fps = target_fps
+        self.max_latency_ms = max_latency_ms
+        self.latency_percentile = latency_percentile
+        self.fps_tolerance = fps_tolerance
+        self.max_streams = max_streams
+        self.width = width
+        self.height = height
+        self.model_size = model_size
+        self.infer_us = infer_us
+        self.config_path = config_path
+        self.warmup = warmup
+        self.duration = duration
+        self.results = {}
+
+    def describe(self, streams):
+        if self.mode == "gpu":
+            return gpu_pipeline(streams, self.width, self.height, self.target_fps, self.config_path)
+        return cpu_pipeline(streams, self.width, self.height, self.target_fps, self.model_size, self.infer_us)
+
+    def passes(self, result):
+        if "error" in result:
+            return False
+        latency = result["latency_ms"][self.latency_percentile]
+        return (result["min_fps"] >= self.target_fps * (1.0 - self.fps_tolerance)
+                and latency is not None and latency <= self.max_latency_ms)
+
+    def measure(self, streams):
+        if streams not in self.results:
+            result = Trial(streams, self.describe(streams), self.mode == "gpu", self.warmup, self.duration).run()
+            result["pass"] = self.passes(result)
+            self.results[streams] = result
+            print(self.format_row(result))
+        return self.results[streams]
+
+    def search(self):
+        """Returns the largest passing stream count (0 if even one stream fails)"""
+        print(self.header())
+        good, bad = 0, None
+        streams = 1
+        while streams <= self.max_streams:
+            if self.measure(streams)["pass"]:
+                good = streams
+                streams *= 2
+            else:
+                bad = streams
+                break
+        if bad is None:
+            if good == self.max_streams or self.measure(self.max_streams)["pass"]:
+                return self.max_streams
+            bad = self.max_streams
+        while bad - good > 1:
+            middle = (good + bad) // 2
+            if self.measure(middle)["pass"]:
+                good = middle
+            else:
+                bad = middle
+        return good
+
+    def header(self):
+        return (f"{'streams':>7} {'min fps':>8} {'mean fps':>9} {'p50 ms':>7} {'p95 ms':>7} {'p99 ms':>7} "
+                f"{'cpu %':>6} {'rss MiB':>8} {'gpu %':>6}  result")
+
+    @staticmethod
+    def format_row(result):
+        if "error" in result:
+            return f"{result['streams']:>7}  error: {result['error']}"
+
+        def fmt(value, width, digits=1):
+            return f"{'-':>{width}}" if value is None else f"{value:>{width}.{digits}f}"
+
+        latency = result["latency_ms"]
+        return (f"{result['streams']:>7} {fmt(result['min_fps'], 8)} {fmt(result['mean_fps'], 9)} "
+                f"{fmt(latency[50], 7)} {fmt(latency[95], 7)} {fmt(latency[99], 7)} "
+                f"{fmt(result['cpu_percent'], 6, 0)} {fmt(result['rss_mib'], 8, 0)} "
+                f"{fmt(result['gpu_percent'], 6, 0)}  {'pass' if result['pass'] else 'FAIL'}")
+
+    def report(self, capacity):
+        lines = [f"Capacity: {capacity} stream(s) at {self.target_fps} fps per stream, "
+                 f"p{self.latency_percentile} latency <= {self.max_latency_ms:.0f} ms ({self.mode} mode)",
+                 "Resource curve:", self.header()]
+        lines.extend(self.format_row(self.results[streams]) for streams in sorted(self.results))
+        return "\n".join(lines)
+
+    def save(self, path, capacity):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as f:
+            json.dump({"mode": self.mode, "target_fps": self.target_fps, "max_latency_ms": self.max_latency_ms,
+                       "latency_percentile": self.latency_percentile, "capacity": capacity,
+                       "trials": [self.results[streams] for streams in sorted(self.results)]}, f, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find the largest stream count that holds a target FPS")
+    parser.add_argument("--mode", choices=("cpu", "gpu"), default="cpu",
+                        help="gpu uses nvstreammux + nvinfer; cpu sizes the non-GPU stages with a stand-in")
+    parser.add_argument("--target-fps", type=int, default=30)
+    parser.add_argument("--max-latency-ms", type=float, default=200.0)
+    parser.add_argument("--percentile", type=int, choices=(50, 95, 99), default=95)
+    parser.add_argument("--max-streams", type=int, default=64)
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--infer-us", type=int, default=2000, help="cpu mode: stand-in inference time per frame")
+    parser.add_argument("--config", default=DEFAULT_CONFIG, help="gpu mode: nvinfer config file")
+    parser.add_argument("--warmup", type=float, default=3.0)
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("-o", "--output", default="output/capacity.json")
+    args = parser.parse_args()
+
+    GObject.threads_init()
+    Gst.init(None)
+    planner = CapacityPlanner(args.mode, args.target_fps, args.max_latency_ms, args.percentile,
+                              max_streams=args.max_streams, width=args.width, height=args.height,
+                              infer_us=args.infer_us, config_path=args.config,
+                              warmup=args.warmup, duration=args.duration)
+    capacity = planner.search()
+    print()
+    print(planner.report(capacity))
+    planner.save(args.output, capacity)
+    print(f"Report written to {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -3,8 +3,18 @@
 import sys
 import gi
 gi.require_version('Gst', '1.0')
-from gi.repository import GObject, Gst
+from gi.repository import GObject, GLib, Gst
+import os
 import signal
+import time
+from muxer_resolution import AdaptiveResolution, MuxerResolutionMatcher, resolution_ladder
+from source_watchdog import SourceWatchdog, build_source_bin
+from thread_telemetry import ThreadTelemetry
+from metrics import REGISTRY
+from drop_accounting import DropAccountant
+from display_branch import DisplayBranch, make_display_elements
+from memory_budget import MemoryBudget, parse_bytes
+from push_timeout_tuner import MuxerTimeoutControl
 
 class ConsoleDetection:
     def __init__(self):
@@ -14,6 +24,15 @@ class ConsoleDetection:
         self.loop = None
         self.frame_count = 0
         self.detection_count = 0
+        self.matcher = None
+        self.adaptive = None
+        self.last_sample = None
+        self.watchdog = SourceWatchdog()
+        self.telemetry = None
+        self.drops = DropAccountant()
+        self.display = None
+        self.memory = None
+        self.mux_timeout = None
         
     def create_pipeline(self):
         print("🚀 Creating DeepStream face/object detection pipeline...")
@@ -30,15 +49,18 @@ class ConsoleDetection:
         
         # DeepStream elements
         streammux = Gst.ElementFactory.make("nvstreammux", "streammux")
+        # Working resolution under load: changing the capsfilter renegotiates the converter
+        scaler = Gst.ElementFactory.make("nvvideoconvert", "scaler")
+        scale_caps = Gst.ElementFactory.make("capsfilter", "scale_caps")
+        # Buffers wait here when inference falls behind; the memory budget bounds it
+        infer_queue = Gst.ElementFactory.make("queue", "infer-queue")
         pgie = Gst.ElementFactory.make("nvinfer", "primary-inference")
-        nvvidconv = Gst.ElementFactory.make("nvvideoconvert", "nvvidconv")
-        nvosd = Gst.ElementFactory.make("nvdsosd", "nvosd")
         
-        # Output: fake sink (console output only)
-        sink = Gst.ElementFactory.make("fakesink", "fakesink")
+        # Output: console only; OSD and a window exist only while a viewer is attached (SIGUSR1)
+        display_elements = make_display_elements("viewer")
         
         if not all([source, caps_v4l2, vidconv_src, nvvidconv_src, caps_nvmm,
-                   streammux, pgie, nvvidconv, nvosd, sink]):
+                   streammux, scaler, scale_caps, infer_queue, pgie, display_elements]):
             print("❌ Failed to create all pipeline elements")
             return False
             
@@ -47,50 +69,61 @@ class ConsoleDetection:
         caps_v4l2.set_property("caps", Gst.Caps.from_string("video/x-raw, framerate=30/1"))
         caps_nvmm.set_property("caps", Gst.Caps.from_string("video/x-raw(memory:NVMM)"))
         
-        # Configure streammux
+        # Configure primary inference
+        config_path = "/opt/nvidia/deepstream/deepstream/samples/configs/deepstream-app/config_infer_primary.txt"
+        pgie.set_property("config-file-path", config_path)
+        
+        # Configure streammux: 1920x1080 is only a fallback until the camera caps are known
         streammux.set_property("width", 1920)
         streammux.set_property("height", 1080)
         streammux.set_property("batch-size", 1)
         streammux.set_property("batched-push-timeout", 4000000)
+        scale_caps.set_property("caps", Gst.Caps.from_string("video/x-raw(memory:NVMM)"))
+        self.adaptive = AdaptiveResolution(scale_caps)
+        self.matcher = MuxerResolutionMatcher(streammux, config_path, cap_to_model=True,
+                                              on_resolved=self.on_resolution_resolved)
+        # Replaces the 4 s timeout with one just above the measured batch fill time
+        self.mux_timeout = MuxerTimeoutControl(streammux)
+        self.mux_timeout.attach()
         
-        # Configure primary inference
-        config_path = "/opt/nvidia/deepstream/deepstream/samples/configs/deepstream-app/config_infer_primary.txt"
-        pgie.set_property("config-file-path", config_path)
-        
-        # Configure sink
-        sink.set_property("sync", False)
+        # Camera chain lives in its own bin so the watchdog can restart it alone
+        source_bin = build_source_bin("source-bin-0", [source, caps_v4l2, vidconv_src, nvvidconv_src, caps_nvmm])
+        if not source_bin:
+            return False
         
         # Add elements to pipeline
-        elements = [source, caps_v4l2, vidconv_src, nvvidconv_src, caps_nvmm,
-                   streammux, pgie, nvvidconv, nvosd, sink]
+        elements = [source_bin, streammux, scaler, scale_caps, infer_queue, pgie]
         for element in elements:
             self.pipeline.add(element)
         
-        # Link elements
-        source.link(caps_v4l2)
-        caps_v4l2.link(vidconv_src)
-        vidconv_src.link(nvvidconv_src)
-        nvvidconv_src.link(caps_nvmm)
-        
         # Link to streammux
         sinkpad = streammux.get_request_pad("sink_0")
-        srcpad = caps_nvmm.get_static_pad("src")
+        srcpad = source_bin.get_static_pad("src")
         srcpad.link(sinkpad)
+        self.matcher.attach(srcpad)
+        self.watchdog.watch(0, source_bin)
+        # Lost frames: driver sequence gaps at the camera, then per-source counts around the muxer
+        self.drops.watch_capture(0, source.get_static_pad("src"))
+        self.drops.watch_mux_input(0, srcpad)
+        self.mux_timeout.watch_input(0, srcpad)
         
         # Link rest of pipeline
-        streammux.link(pgie)
-        pgie.link(nvvidconv)
-        nvvidconv.link(nvosd)
-        nvosd.link(sink)
+        self.display = DisplayBranch(self.pipeline, display_elements, "viewer", attached=False)
+        streammux.link(scaler)
+        scaler.link(scale_caps)
+        scale_caps.link(infer_queue)
+        infer_queue.link(pgie)
+        pgie.link(self.display.tee)
         
-        # Add buffer probe for detection results
-        osdsinkpad = nvosd.get_static_pad("sink")
-        osdsinkpad.add_probe(Gst.PadProbeType.BUFFER, self.osd_sink_pad_buffer_probe, 0)
+        # Detection probes sit on nvinfer so they run whether or not anyone is watching
+        pgiesrcpad = pgie.get_static_pad("src")
+        pgiesrcpad.add_probe(Gst.PadProbeType.BUFFER, self.drops.batch_probe, 0)
+        pgiesrcpad.add_probe(Gst.PadProbeType.BUFFER, self.pgie_src_pad_buffer_probe, 0)
         
         print("✅ Pipeline created successfully")
         return True
         
-    def osd_sink_pad_buffer_probe(self, pad, info, u_data):
+    def pgie_src_pad_buffer_probe(self, pad, info, u_data):
         """Buffer probe to detect objects without PyDS bindings"""
         self.frame_count += 1
         
@@ -107,6 +140,19 @@ class ConsoleDetection:
         
         return Gst.PadProbeReturn.OK
         
+    def on_resolution_resolved(self, resolution, framerate):
+        self.adaptive.set_ladder(resolution_ladder(resolution))
+        
+    def sample_throughput(self):
+        """Once a second: feed measured fps to the adaptive resolution controller"""
+        now = time.monotonic()
+        if self.last_sample is not None:
+            last_time, last_count = self.last_sample
+            fps = (self.frame_count - last_count) / (now - last_time)
+            self.adaptive.update(now, fps, self.matcher.framerate)
+        self.last_sample = (now, self.frame_count)
+        return True
+        
     def run(self):
         if not self.create_pipeline():
             return False
@@ -116,6 +162,26 @@ class ConsoleDetection:
         bus.add_signal_watch()
         bus.connect("message", self.on_message)
         
+        # THREAD_TELEMETRY=1 reports CPU per streaming thread every few seconds. Streaming threads
+        # announce themselves while the pipeline starts, so attach first; TRACE_PYTHON=1 also reports
+        # Python allocation peaks (tracemalloc slows allocation down)
+        if os.environ.get("THREAD_TELEMETRY") == "1":
+            self.telemetry = ThreadTelemetry(self.pipeline, trace_python=os.environ.get("TRACE_PYTHON") == "1")
+            self.telemetry.attach()
+        self.drops.attach(self.pipeline)
+        # MEMORY_BUDGET=256M bounds every queue and buffer pool by bytes instead of letting them grow
+        if os.environ.get("MEMORY_BUDGET"):
+            self.memory = MemoryBudget(parse_bytes(os.environ["MEMORY_BUDGET"]))
+            self.memory.attach(self.pipeline)
+        # METRICS_ADDR=<port> or <host:port> serves /metrics; unauthenticated, so loopback unless a host is given
+        if os.environ.get("METRICS_ADDR"):
+            host, _, port = os.environ["METRICS_ADDR"].rpartition(":")
+            try:
+                REGISTRY.serve(int(port), host or "127.0.0.1")
+                print(f"📈 Metrics on http://{host or '127.0.0.1'}:{port}/metrics")
+            except OSError as e:
+                print(f"⚠️  Metrics endpoint unavailable: {e}")
+        
         print("🎬 Starting detection pipeline...")
         ret = self.pipeline.set_state(Gst.State.PLAYING)
         if ret == Gst.StateChangeReturn.FAILURE:
@@ -123,6 +189,16 @@ class ConsoleDetection:
             return False
             
         self.loop = GObject.MainLoop()
+        self.watchdog.start()
+        if self.telemetry:
+            self.telemetry.start()
+        self.drops.start()
+        if self.memory:
+            self.memory.start()
+        self.mux_timeout.start()
+        self.display.start()
+        self.display.toggle_on_signals()
+        GLib.timeout_add_seconds(1, self.sample_throughput)
         
         def signal_handler(sig, frame):
             print(f"\n🛑 Detection stopped. Processed {self.frame_count} frames")
@@ -144,7 +220,32 @@ class ConsoleDetection:
         except KeyboardInterrupt:
             print(f"\n✅ Test completed! Processed {self.frame_count} frames")
         
+        self.watchdog.stop()
+        if self.telemetry:
+            self.telemetry.stop()
+        self.drops.stop()
+        if self.memory:
+            self.memory.stop()
+        self.mux_timeout.stop()
+        display_report = self.display.report()
         self.pipeline.set_state(Gst.State.NULL)
+        REGISTRY.shutdown()
+        if self.watchdog.incidents:
+            print("Source incidents:")
+            print(self.watchdog.report())
+        print("🖥️  CPU by display mode:")
+        print(display_report)
+        print("📉 Dropped frames by stage:")
+        print(self.drops.report())
+        print("⏱️  Muxer batching:")
+        print(self.mux_timeout.report())
+        if self.memory:
+            print("💾 Memory by stage:")
+            print(self.memory.report())
+        report = self.adaptive.report()
+        if report:
+            print("📊 Throughput per working resolution:")
+            print(report)
         print("Pipeline stopped")
         return True
         
@@ -154,6 +255,9 @@ class ConsoleDetection:
             print("End-of-stream")
             self.loop.quit()
         elif t == Gst.MessageType.ERROR:
+            # Errors inside a source bin restart that source only
+            if self.watchdog.handle_error(message) or self.display.handle_error(message):
+                return
             err, debug = message.parse_error()
             print(f"❌ Error: {err}")
             if debug:
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+
+import sys
+import time
+import signal
+import resource
+import gi
+gi.require_version('Gst', '1.0')
+from gi.repository import GObject, GLib, Gst
+
+
+def process_cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def make_display_elements(prefix="display"):
+    """nvvideoconvert → nvdsosd → nvvideoconvert → RGBA caps → videoconvert → xvimagesink"""
+    elements = [
+        Gst.ElementFactory.make("nvvideoconvert", f"{prefix}-convert"),
+        Gst.ElementFactory.make("nvdsosd", f"{prefix}-osd"),
+        Gst.ElementFactory.make("nvvideoconvert", f"{prefix}-convert-postosd"),
+        Gst.ElementFactory.make("capsfilter", f"{prefix}-caps"),
+        Gst.ElementFactory.make("videoconvert", f"{prefix}-videoconvert"),
+        Gst.ElementFactory.make("xvimagesink", f"{prefix}-sink"),
+    ]
+    if not all(elements):
+        return None
+    elements[3].set_property("caps", Gst.Caps.from_string("video/x-raw, format=RGBA"))
+    elements[-1].set_property("sync", False)
+    return elements
+
+
+class DisplayBranch:
+    """OSD/display path as a tee branch behind a valve, only running while a viewer is attached
+
+    tee ─┬─ fakesink                                   (always: keeps inference flowing)
+         └─ valve ─ queue ─ <display elements> ─ sink  (only while attached)
+
+    While detached the valve drops everything and the elements after it are
+    held in NULL, so no drawing, colour conversion or window exists at all.
+    """
+
+    def __init__(self, pipeline, elements, name="display", attached=False):
+        self.name = name
+        self.tee = Gst.ElementFactory.make("tee", f"{name}-tee")
+        self.headless_sink = Gst.ElementFactory.make("fakesink", f"{name}-headless-sink")
+        self.valve = Gst.ElementFactory.make("valve", f"{name}-valve")
+        queue = Gst.ElementFactory.make("queue", f"{name}-queue")
+        # Never let a slow window hold back inference
+        queue.set_property("leaky", 2)
+        queue.set_property("max-size-buffers", 2)
+        self.headless_sink.set_property("sync", False)
+        self.headless_sink.set_property("async", False)
+        self.branch = [queue] + list(elements)
+        self.branch[-1].set_property("async", False)
+
+        for element in [self.tee, self.headless_sink, self.valve] + self.branch:
+            pipeline.add(element)
+        self.tee.link(self.headless_sink)
+        self.tee.link(self.valve)
+        for upstream, downstream in zip([self.valve] + self.branch, self.branch):
+            if not upstream.link(downstream):
+                print(f"Unable to link {upstream.get_name()} -> {downstream.get_name()}")
+
+        self.attached = attached
+        self.valve.set_property("drop", not attached)
+        for element in self.branch:
+            element.set_locked_state(not attached)
+        # CPU seconds and wall seconds spent in each mode
+        self.usage = {True: [0.0, 0.0], False: [0.0, 0.0]}
+        self.mode_since = None
+
+    def _account(self):
+        now = (time.monotonic(), process_cpu_seconds())
+        if self.mode_since is not None:
+            usage = self.usage[self.attached]
+            usage[0] += now[1] - self.mode_since[1]
+            usage[1] += now[0] - self.mode_since[0]
+        self.mode_since = now
+
+    def start(self):
+        """Start CPU accounting; call once the pipeline is PLAYING"""
+        self._account()
+
+    def attach_viewer(self):
+        if self.attached:
+            return
+        self._account()
+        # Downstream first, so each element is ready before its upstream starts pushing
+        for element in reversed(self.branch):
+            element.set_locked_state(False)
+            element.sync_state_with_parent()
+        self.valve.set_property("drop", False)
+        self.attached = True
+        print("🖥️  Viewer attached: display branch running")
+
+    def detach_viewer(self):
+        if not self.attached:
+            return
+        self._account()
+        self.valve.set_property("drop", True)
+        for element in self.branch:
+            element.set_locked_state(True)
+            element.set_state(Gst.State.NULL)
+        self.attached = False
+        print("🖥️  Viewer detached: running headless")
+
+    def toggle_on_signals(self):
+        """SIGUSR1 attaches a viewer, SIGUSR2 detaches it"""
+        GLib.unix_signal_add(GLib.PRIORITY_DEFAULT, signal.SIGUSR1, lambda: self.attach_viewer() or True)
+        GLib.unix_signal_add(GLib.PRIORITY_DEFAULT, signal.SIGUSR2, lambda: self.detach_viewer() or True)
+
+    def handle_error(self, message):
+        """Call from on_message for ERROR; a closed window or failing display detaches instead of quitting"""
+        if not any(message.src is element or message.src.has_as_ancestor(element) for element in self.branch):
+            return False
+        err, debug = message.parse_error()
+        print(f"⚠️  Display error from {message.src.get_name()}: {err}")
+        # Out of the bus handler, so the branch is not torn down while the error is still being posted
+        GLib.idle_add(lambda: self.detach_viewer() or False)
+        return True
+
+    def report(self):
+        self._account()
+        lines = []
+        for attached, label in ((True, "display attached"), (False, "headless")):
+            cpu, wall = self.usage[attached]
+            if wall > 0:
+                lines.append(f"   {label}: {cpu / wall * 100:.1f}% CPU over {wall:.0f}s")
+        return "\n".join(lines)
+
+
+def main():
+    # CPU stand-in for the OSD path: overlay drawing plus RGBA conversion on 1080p frames
+    GObject.threads_init()
+    Gst.init(None)
+    pipeline = Gst.parse_launch(
+        "videotestsrc is-live=true ! video/x-raw,width=1920,height=1080,framerate=30/1 ! "
+        "identity name=inference")
+    elements = [Gst.ElementFactory.make("timeoverlay", "display-overlay"),
+                Gst.ElementFactory.make("videoconvert", "display-convert"),
+                Gst.ElementFactory.make("capsfilter", "display-caps"),
+                Gst.ElementFactory.make("fakesink", "display-sink")]
+    elements[2].set_property("caps", Gst.Caps.from_string("video/x-raw, format=RGBA"))
+    elements[3].set_property("sync", False)
+    branch = DisplayBranch(pipeline, elements)
+    pipeline.get_by_name("inference").link(branch.tee)
+
+    loop = GLib.MainLoop()
+    pipeline.set_state(Gst.State.PLAYING)
+    branch.start()
+    GLib.timeout_add_seconds(5, lambda: branch.attach_viewer() or False)
+    GLib.timeout_add_seconds(10, lambda: branch.detach_viewer() or False)
+    GLib.timeout_add_seconds(15, loop.quit)
+    loop.run()
+    print("CPU per mode:")
+    print(branch.report())
+    pipeline.set_state(Gst.State.NULL)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
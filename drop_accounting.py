@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+
+import sys
+import threading
+import gi
+gi.require_version('Gst', '1.0')
+from gi.repository import GObject, GLib, Gst
+
+try:
+    import pyds
+except ImportError:
+    pyds = None
+
+from batch_meta_iter import backend_for, iter_frames
+from metrics import REGISTRY
+
+# Post-muxer stages see batches, not sources; their drops are reported under this source label
+ALL_SOURCES = "all"
+
+
+class SourceCounters:
+    __slots__ = ("capture_last", "captured", "mux_in", "mux_out", "frame_num_last", "frame_num_gaps",
+                 "delivered")
+
+    def __init__(self):
+        self.capture_last = None
+        self.captured = 0
+        self.mux_in = 0
+        self.mux_out = 0
+        self.frame_num_last = None
+        self.frame_num_gaps = 0
+        self.delivered = 0
+
+
+class DropAccountant:
+    """Attributes lost frames to capture, streammux, QoS, leaky queues and sinks, per source"""
+
+    def __init__(self, registry=REGISTRY):
+        self.lock = threading.Lock()
+        self.sources = {}
+        # (source, stage) -> dropped frames
+        self.drops = {}
+        self.qos_dropped = {}
+        self.sink_dropped = {}
+        self.queue_overruns = {}
+        self.sinks = []
+        self.timer_id = None
+        self.drop_metric = registry.gauge("frames_dropped", "Frames dropped, by source and pipeline stage")
+        self.rate_metric = registry.gauge("frame_drop_rate", "Dropped / (delivered + dropped) per source")
+
+    def _source(self, source_id):
+        counters = self.sources.get(source_id)
+        if counters is None:
+            counters = self.sources[source_id] = SourceCounters()
+        return counters
+
+    def _add(self, source_id, stage, count):
+        key = (source_id, stage)
+        self.drops[key] = self.drops.get(key, 0) + count
+
+    # Capture: v4l2src (and videotestsrc) number buffers in GST_BUFFER_OFFSET, so gaps are frames
+    # the driver captured but nobody dequeued in time
+
+    def watch_capture(self, source_id, pad):
+        """Probe the source element's own src pad"""
+        pad.add_probe(Gst.PadProbeType.BUFFER, self.capture_probe, source_id)
+
+    def capture_probe(self, pad, info, source_id):
+        offset = info.get_buffer().offset
+        if offset == Gst.BUFFER_OFFSET_NONE:
+            return Gst.PadProbeReturn.OK
+        with self.lock:
+            counters = self._source(source_id)
+            counters.captured += 1
+            last = counters.capture_last
+            # A restarted source starts counting again; that is a reset, not a drop
+            if last is not None and offset > last + 1:
+                self._add(source_id, "capture", offset - last - 1)
+            counters.capture_last = offset
+        return Gst.PadProbeReturn.OK
+
+    # Muxer: frames into sink_<n> against frames of that source in the batches, plus frame_num gaps
+
+    def watch_mux_input(self, source_id, pad):
+        """Probe the pad linked to nvstreammux sink_<source_id>"""
+        pad.add_probe(Gst.PadProbeType.BUFFER, self.mux_input_probe, source_id)
+
+    def mux_input_probe(self, pad, info, source_id):
+        with self.lock:
+            self._source(source_id).mux_in += 1
+        return Gst.PadProbeReturn.OK
+
+    def batch_probe(self, pad, info, u_data):
+        """Buffer probe after nvstreammux (e.g. the nvinfer src pad)"""
+        gst_buffer = info.get_buffer()
+        if not gst_buffer:
+            return Gst.PadProbeReturn.OK
+        backend = backend_for(pyds)
+        batch_meta = backend.batch_meta(gst_buffer)
+        self.record_frames((frame_meta.source_id, frame_meta.frame_num)
+                           for frame_meta in iter_frames(batch_meta, backend))
+        return Gst.PadProbeReturn.OK
+
+    def record_frames(self, frames):
+        """Count (source_id, frame_num) pairs that made it through the muxer"""
+        with self.lock:
+            for source_id, frame_num in frames:
+                counters = self._source(source_id)
+                counters.mux_out += 1
+                counters.delivered += 1
+                last = counters.frame_num_last
+                if last is not None and frame_num > last + 1:
+                    counters.frame_num_gaps += frame_num - last - 1
+                counters.frame_num_last = frame_num
+
+    # Post-muxer: QoS messages, leaky queue overruns and sink statistics
+
+    def attach(self, pipeline):
+        """Listen for QoS on the bus, count queue overruns and remember the sinks to poll"""
+        bus = pipeline.get_bus()
+        bus.add_signal_watch()
+        bus.connect("message::qos", self.on_qos)
+        iterator = pipeline.iterate_recurse()
+        while True:
+            result, element = iterator.next()
+            if result == Gst.IteratorResult.RESYNC:
+                iterator.resync()
+                continue
+            if result != Gst.IteratorResult.OK:
+                break
+            factory = element.get_factory()
+            if factory is not None and factory.get_name() == "queue":
+                element.connect("overrun", self.on_overrun)
+            if element.find_property("stats") is not None and element.find_property("qos") is not None:
+                self.sinks.append(element)
+
+    def on_qos(self, bus, message):
+        fmt, processed, dropped = message.parse_qos_stats()
+        if fmt == Gst.Format.BUFFERS and dropped != 2**64 - 1:
+            with self.lock:
+                # Stats in the message are running totals for that element
+                self.qos_dropped[message.src.get_name()] = dropped
+
+    def on_overrun(self, queue):
+        # A leaky queue throws away a buffer for every overrun; a blocking one pushes back upstream
+        # and the loss shows up as capture gaps instead
+        if queue.get_property("leaky") == 0:
+            return
+        with self.lock:
+            name = queue.get_name()
+            self.queue_overruns[name] = self.queue_overruns.get(name, 0) + 1
+
+    def poll(self):
+        """Read sink statistics and publish metrics; usable as a GLib timeout callback"""
+        for sink in self.sinks:
+            stats = sink.get_property("stats")
+            ok, dropped = stats.get_uint64("dropped")
+            if ok:
+                with self.lock:
+                    self.sink_dropped[sink.get_name()] = dropped
+        self.publish()
+        return True
+
+    def start(self, interval=5):
+        self.timer_id = GLib.timeout_add_seconds(interval, self.poll)
+
+    def stop(self):
+        if self.timer_id is not None:
+            GLib.source_remove(self.timer_id)
+            self.timer_id = None
+        self.poll()
+
+    def totals(self):
+        """{(source, stage): dropped frames} across every stage"""
+        with self.lock:
+            totals = dict(self.drops)
+            for source_id, counters in self.sources.items():
+                in_flight_adjusted = max(0, counters.mux_in - counters.mux_out - 1)
+                # Whichever of the two muxer signals saw more loss; they count the same frames
+                muxed = max(counters.frame_num_gaps, in_flight_adjusted)
+                if muxed:
+                    totals[(source_id, "streammux")] = muxed
+            # Sinks report QoS drops both ways; count each element once
+            for name in set(self.qos_dropped) | set(self.sink_dropped):
+                dropped = max(self.qos_dropped.get(name, 0), self.sink_dropped.get(name, 0))
+                if dropped:
+                    totals[(ALL_SOURCES, f"qos:{name}")] = dropped
+            for name, overruns in self.queue_overruns.items():
+                totals[(ALL_SOURCES, f"queue:{name}")] = overruns
+        return totals
+
+    def drop_rates(self):
+        """{source_id: fraction of frames lost before reaching the probes}"""
+        totals = self.totals()
+        rates = {}
+        with self.lock:
+            for source_id, counters in self.sources.items():
+                dropped = sum(count for (source, _), count in totals.items() if source == source_id)
+                # Without a batch probe nothing is "delivered"; fall back to what the source produced
+                seen = max(counters.delivered + dropped,
+                           counters.captured + totals.get((source_id, "capture"), 0))
+                rates[source_id] = dropped / seen if seen else 0.0
+        return rates
+
+    def publish(self):
+        for (source, stage), count in self.totals().items():
+            self.drop_metric.set(count, source=source, stage=stage)
+        for source_id, rate in self.drop_rates().items():
+            self.rate_metric.set(round(rate, 4), source=source_id)
+
+    def report(self):
+        totals = self.totals()
+        rates = self.drop_rates()
+        lines = []
+        for source in sorted({source for source, _ in totals} | set(rates), key=str):
+            stages = ", ".join(f"{stage} {count}" for (s, stage), count in sorted(totals.items(), key=str)
+                               if s == source)
+            rate = f" ({rates[source]:.1%} of frames)" if source in rates else ""
+            lines.append(f"   source {source}: {stages or 'no drops'}{rate}")
+        return "\n".join(lines)
+
+
+def main():
+    # A live source into a small leaky queue and a sink that cannot keep up
+    GObject.threads_init()
+    Gst.init(None)
+    pipeline = Gst.parse_launch(
+        "videotestsrc name=src is-live=true ! video/x-raw,width=640,height=480,framerate=60/1 ! "
+        "queue name=leaky-queue leaky=downstream max-size-buffers=2 ! "
+        "identity name=slow-stage sleep-time=25000 ! fakesink name=sink sync=true qos=true")
+    accountant = DropAccountant()
+    accountant.attach(pipeline)
+    accountant.watch_capture(0, pipeline.get_by_name("src").get_static_pad("src"))
+
+    # Without pyds there is no batch meta; feed frame_num sequences with gaps directly
+    accountant.record_frames((1, n) for n in range(300) if n % 25)
+
+    loop = GLib.MainLoop()
+    pipeline.set_state(Gst.State.PLAYING)
+    accountant.start(1)
+    GLib.timeout_add_seconds(5, loop.quit)
+    loop.run()
+    accountant.stop()
+    pipeline.set_state(Gst.State.NULL)
+    print("Dropped frames by stage:")
+    print(accountant.report())
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,376 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import time
+
+import numpy as np
+
+
+def normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors[None, :]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _topk(scores, k):
+    """Top-k columns per row, sorted by descending score"""
+    k = min(k, scores.shape[1])
+    if k == 0:
+        return (np.empty((scores.shape[0], 0), np.float32), np.empty((scores.shape[0], 0), np.int64))
+    if k < scores.shape[1]:
+        idx = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        idx = np.broadcast_to(np.arange(scores.shape[1]), scores.shape).copy()
+    part = np.take_along_axis(scores, idx, axis=1)
+    order = np.argsort(-part, axis=1)
+    return np.take_along_axis(part, order, axis=1), np.take_along_axis(idx, order, axis=1)
+
+
+def _save_array(path, array):
+    """np.save to a temporary file beside path, then rename it into place"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        np.save(f, array)
+    os.replace(tmp_path, path)
+
+
+class _Segment:
+    """Growable block of vectors and ids; starts as a read-only (possibly mmap) view"""
+
+    def __init__(self, dim, vectors=None, ids=None):
+        if vectors is None:
+            vectors = np.empty((0, dim), np.float32)
+            ids = np.empty(0, np.int64)
+        self.dim = dim
+        self.vectors = vectors
+        self.ids = ids
+        self.count = len(ids)
+        self.owned = False
+
+    def view(self):
+        return self.vectors[:self.count], self.ids[:self.count]
+
+    def _reserve(self, capacity):
+        if self.owned and capacity <= len(self.ids):
+            return
+        new_capacity = max(capacity, 2 * len(self.ids), 16)
+        vectors = np.empty((new_capacity, self.dim), np.float32)
+        ids = np.empty(new_capacity, np.int64)
+        vectors[:self.count] = self.vectors[:self.count]
+        ids[:self.count] = self.ids[:self.count]
+        self.vectors, self.ids, self.owned = vectors, ids, True
+
+    def add(self, vectors, ids):
+        start = self.count
+        self._reserve(start + len(ids))
+        self.vectors[start:start + len(ids)] = vectors
+        self.ids[start:start + len(ids)] = ids
+        self.count += len(ids)
+        return start
+
+    def remove_row(self, row):
+        """Swap-remove a row; returns the id that moved into it, or None"""
+        self._reserve(self.count)
+        last = self.count - 1
+        moved = None
+        if row != last:
+            self.vectors[row] = self.vectors[last]
+            self.ids[row] = self.ids[last]
+            moved = int(self.ids[row])
+        self.count -= 1
+        return moved
+
+
+class FlatIndex:
+    """Exact cosine search with one matrix multiply per query batch"""
+
+    def __init__(self, dim):
+        self.dim = dim
+        self.segment = _Segment(dim)
+        self._rows = None
+
+    def __len__(self):
+        return self.segment.count
+
+    def _row_map(self):
+        # Built lazily so loading a saved gallery does not walk every id
+        if self._rows is None:
+            _, ids = self.segment.view()
+            self._rows = {int(i): row for row, i in enumerate(ids)}
+        return self._rows
+
+    def add(self, ids, vectors):
+        """Add vectors; an id already present has its old row replaced"""
+        self.remove(ids)
+        rows = self._row_map()
+        start = self.segment.add(vectors, ids)
+        for offset, i in enumerate(ids):
+            rows[int(i)] = start + offset
+
+    def remove(self, ids):
+        rows = self._row_map()
+        for i in ids:
+            row = rows.pop(int(i), None)
+            if row is None:
+                continue
+            moved = self.segment.remove_row(row)
+            if moved is not None:
+                rows[moved] = row
+
+    def search(self, queries, k):
+        vectors, ids = self.segment.view()
+        if len(ids) == 0:
+            return (np.full((len(queries), k), -np.inf, np.float32), np.full((len(queries), k), -1, np.int64))
+        scores, idx = _topk(queries @ vectors.T, k)
+        return scores, ids[idx]
+
+    def vectors(self):
+        return self.segment.view()
+
+
+class IVFIndex:
+    """Inverted-file index: vectors partitioned by nearest centroid, only nprobe lists scanned"""
+
+    def __init__(self, centroids, nprobe=8):
+        self.centroids = np.asarray(centroids, np.float32)
+        self.dim = self.centroids.shape[1]
+        self.nprobe = nprobe
+        self.lists = [_Segment(self.dim) for _ in range(len(self.centroids))]
+        self._where = None
+
+    def __len__(self):
+        return sum(segment.count for segment in self.lists)
+
+    @classmethod
+    def train(cls, vectors, nlist, nprobe=8, iterations=10, sample=None, seed=0):
+        """Spherical k-means on a sample of the gallery"""
+        rng = np.random.default_rng(seed)
+        sample = sample or max(nlist * 64, 10000)
+        if len(vectors) > sample:
+            vectors = vectors[np.sort(rng.choice(len(vectors), sample, replace=False))]
+        centroids = vectors[rng.choice(len(vectors), nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assign = np.argmax(vectors @ centroids.T, axis=1)
+            order = np.argsort(assign, kind="stable")
+            counts = np.bincount(assign, minlength=nlist)
+            sums = np.zeros_like(centroids)
+            nonempty = np.flatnonzero(counts)
+            starts = np.concatenate([[0], np.cumsum(counts)[:-1]])[nonempty]
+            sums[nonempty] = np.add.reduceat(vectors[order], starts, axis=0)
+            empty = counts == 0
+            if empty.any():
+                sums[empty] = vectors[rng.choice(len(vectors), int(empty.sum()), replace=False)]
+            centroids = normalize(sums)
+        return cls(centroids, nprobe)
+
+    def assign(self, vectors, chunk=65536):
+        out = np.empty(len(vectors), np.int64)
+        for start in range(0, len(vectors), chunk):
+            out[start:start + chunk] = np.argmax(vectors[start:start + chunk] @ self.centroids.T, axis=1)
+        return out
+
+    def _where_map(self):
+        if self._where is None:
+            self._where = {}
+            for list_id, segment in enumerate(self.lists):
+                _, ids = segment.view()
+                for row, i in enumerate(ids):
+                    self._where[int(i)] = (list_id, row)
+        return self._where
+
+    def add(self, ids, vectors):
+        """Add vectors; an id already present has its old row replaced, possibly in another list"""
+        self.remove(ids)
+        where = self._where_map()
+        assign = self.assign(vectors)
+        order = np.argsort(assign, kind="stable")
+        boundaries = np.flatnonzero(np.diff(assign[order])) + 1
+        for group in np.split(order, boundaries):
+            if len(group) == 0:
+                continue
+            list_id = int(assign[group[0]])
+            start = self.lists[list_id].add(vectors[group], ids[group])
+            for offset, i in enumerate(ids[group]):
+                where[int(i)] = (list_id, start + offset)
+
+    def remove(self, ids):
+        where = self._where_map()
+        for i in ids:
+            location = where.pop(int(i), None)
+            if location is None:
+                continue
+            list_id, row = location
+            moved = self.lists[list_id].remove_row(row)
+            if moved is not None:
+                where[moved] = (list_id, row)
+
+    def search(self, queries, k):
+        n = len(queries)
+        best_scores = np.full((n, k), -np.inf, np.float32)
+        best_ids = np.full((n, k), -1, np.int64)
+        nprobe = min(self.nprobe, len(self.centroids))
+        _, probe = _topk(queries @ self.centroids.T, nprobe)
+        # Group the batch by list so each probed list costs one matmul
+        flat_lists = probe.ravel()
+        flat_queries = np.repeat(np.arange(n), nprobe)
+        order = np.argsort(flat_lists, kind="stable")
+        boundaries = np.flatnonzero(np.diff(flat_lists[order])) + 1
+        for group in np.split(order, boundaries):
+            if len(group) == 0:
+                continue
+            vectors, ids = self.lists[int(flat_lists[group[0]])].view()
+            if len(ids) == 0:
+                continue
+            rows = flat_queries[group]
+            scores, idx = _topk(queries[rows] @ vectors.T, k)
+            merged_scores = np.concatenate([best_scores[rows], scores], axis=1)
+            merged_ids = np.concatenate([best_ids[rows], ids[idx]], axis=1)
+            top_scores, top_idx = _topk(merged_scores, k)
+            best_scores[rows] = top_scores
+            best_ids[rows] = np.take_along_axis(merged_ids, top_idx, axis=1)
+        return best_scores, best_ids
+
+    def vectors(self):
+        views = [segment.view() for segment in self.lists]
+        vectors = np.concatenate([v for v, _ in views]) if views else np.empty((0, self.dim), np.float32)
+        ids = np.concatenate([i for _, i in views]) if views else np.empty(0, np.int64)
+        return vectors, ids
+
+
+class EmbeddingIndex:
+    """Face gallery: exact search while small, IVF once the gallery passes ivf_threshold"""
+
+    def __init__(self, dim, ivf_threshold=100000, nlist=None, nprobe=16):
+        self.dim = dim
+        self.ivf_threshold = ivf_threshold
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.index = FlatIndex(dim)
+
+    def __len__(self):
+        return len(self.index)
+
+    @property
+    def kind(self):
+        return "ivf" if isinstance(self.index, IVFIndex) else "flat"
+
+    def add(self, ids, vectors):
+        ids = np.asarray(ids, np.int64).ravel()
+        vectors = normalize(vectors)
+        if len(ids) != len(vectors) or vectors.shape[1] != self.dim:
+            raise ValueError(f"Expected {len(ids)} vectors of dimension {self.dim}, got {vectors.shape}")
+        if len(np.unique(ids)) != len(ids):
+            raise ValueError("Duplicate ids in one add")
+        self.index.add(ids, vectors)
+        if self.kind == "flat" and len(self.index) >= self.ivf_threshold:
+            self._build_ivf()
+
+    def remove(self, ids):
+        self.index.remove(np.asarray(ids, np.int64).ravel())
+
+    def _build_ivf(self):
+        vectors, ids = self.index.vectors()
+        nlist = self.nlist or max(16, int(np.sqrt(len(ids))))
+        ivf = IVFIndex.train(vectors, nlist, self.nprobe)
+        ivf.add(ids, vectors)
+        self.index = ivf
+
+    def search(self, queries, k=1):
+        """Batched search: returns (scores, ids) arrays of shape (len(queries), k)"""
+        return self.index.search(normalize(queries), k)
+
+    def match(self, queries, threshold=0.5):
+        """Best gallery id per query, or -1 when the best score is below threshold"""
+        scores, ids = self.search(queries, 1)
+        return np.where(scores[:, 0] >= threshold, ids[:, 0], -1), scores[:, 0]
+
+    def save(self, path):
+        """Write a directory of .npy files that load() can memory-map
+
+        Each file is written next to its target and renamed over it, so a
+        gallery loaded with mmap from the same path stays readable while
+        it is saved back.
+        """
+        os.makedirs(path, exist_ok=True)
+        meta = {"dim": self.dim, "kind": self.kind, "ivf_threshold": self.ivf_threshold,
+                "nlist": self.nlist, "nprobe": self.nprobe}
+        if self.kind == "ivf":
+            views = [segment.view() for segment in self.index.lists]
+            offsets = np.zeros(len(views) + 1, np.int64)
+            offsets[1:] = np.cumsum([len(ids) for _, ids in views])
+            vectors, ids = self.index.vectors()
+            _save_array(os.path.join(path, "centroids.npy"), self.index.centroids)
+            _save_array(os.path.join(path, "offsets.npy"), offsets)
+        else:
+            vectors, ids = self.index.vectors()
+        _save_array(os.path.join(path, "vectors.npy"), np.ascontiguousarray(vectors, np.float32))
+        _save_array(os.path.join(path, "ids.npy"), np.ascontiguousarray(ids, np.int64))
+        with open(os.path.join(path, "meta.json.tmp"), 'w') as f:
+            json.dump(meta, f)
+        os.replace(os.path.join(path, "meta.json.tmp"), os.path.join(path, "meta.json"))
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """Open a saved gallery; with mmap the vectors are paged in on first search"""
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        mode = 'r' if mmap else None
+        vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode=mode)
+        ids = np.load(os.path.join(path, "ids.npy"), mmap_mode=mode)
+        index = cls(meta["dim"], meta["ivf_threshold"], meta["nlist"], meta["nprobe"])
+        if meta["kind"] == "ivf":
+            offsets = np.load(os.path.join(path, "offsets.npy"))
+            ivf = IVFIndex(np.load(os.path.join(path, "centroids.npy")), meta["nprobe"])
+            for list_id in range(len(ivf.lists)):
+                start, end = offsets[list_id], offsets[list_id + 1]
+                ivf.lists[list_id] = _Segment(index.dim, vectors[start:end], ids[start:end])
+            index.index = ivf
+        else:
+            index.index.segment = _Segment(index.dim, vectors, ids)
+        return index
+
+
+def benchmark(sizes=(1000, 10000, 100000, 1000000), dim=128, batch=32, batches=20):
+    """Queries/sec per gallery size for exact and IVF search"""
+    rng = np.random.default_rng(0)
+    print(f"{'gallery':>9} {'index':>6} {'queries/s':>11} {'recall@1':>9} {'build s':>8}")
+    for size in sizes:
+        gallery = normalize(rng.standard_normal((size, dim), dtype=np.float32))
+        ids = np.arange(size, dtype=np.int64)
+        probe_ids = rng.choice(size, batch * batches)
+        queries = normalize(gallery[probe_ids] + 0.05 * rng.standard_normal((len(probe_ids), dim), dtype=np.float32))
+
+        for threshold in (size + 1, 0):
+            if threshold == 0 and size < 10000:
+                continue
+            start = time.perf_counter()
+            index = EmbeddingIndex(dim, ivf_threshold=threshold)
+            index.add(ids, gallery)
+            build = time.perf_counter() - start
+            found = []
+            start = time.perf_counter()
+            for b in range(batches):
+                _, result = index.search(queries[b * batch:(b + 1) * batch], 1)
+                found.append(result[:, 0])
+            elapsed = time.perf_counter() - start
+            recall = float(np.mean(np.concatenate(found) == probe_ids))
+            print(f"{size:>9} {index.kind:>6} {batch * batches / elapsed:>11.0f} {recall:>9.3f} {build:>8.2f}")
+            del index
+        del gallery
+
+
+def main(args):
+    sizes = (1000, 10000, 100000, 1000000)
+    if len(args) > 1:
+        sizes = tuple(int(size) for size in args[1:])
+    benchmark(sizes)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
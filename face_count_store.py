@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import time
+import threading
+
+import numpy as np
+import gi
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst
+
+try:
+    import pyds
+except ImportError:
+    pyds = None
+
+from batch_meta_iter import backend_for, iter_frames, iter_objects
+
+PGIE_CLASS_ID_FACE = 0
+# (bucket seconds, number of buckets): 1 hour of seconds, 1 day of minutes, 30 days of hours
+DEFAULT_RESOLUTIONS = ((1, 3600), (60, 1440), (3600, 720))
+
+
+class RingSeries:
+    """Fixed-size ring of time buckets; a slot is reused once its bucket falls out of the window"""
+
+    FIELDS = ("bucket", "count", "frames", "max", "conf_sum")
+
+    def __init__(self, seconds, capacity):
+        self.seconds = seconds
+        self.capacity = capacity
+        self.bucket = np.full(capacity, -1, np.int64)
+        self.count = np.zeros(capacity, np.int64)
+        self.frames = np.zeros(capacity, np.int64)
+        self.max = np.zeros(capacity, np.int32)
+        self.conf_sum = np.zeros(capacity, np.float64)
+
+    def add(self, timestamp, faces, conf_sum):
+        bucket = int(timestamp // self.seconds)
+        slot = bucket % self.capacity
+        if self.bucket[slot] != bucket:
+            self.bucket[slot] = bucket
+            self.count[slot] = 0
+            self.frames[slot] = 0
+            self.max[slot] = 0
+            self.conf_sum[slot] = 0.0
+        self.count[slot] += faces
+        self.frames[slot] += 1
+        if faces > self.max[slot]:
+            self.max[slot] = faces
+        self.conf_sum[slot] += conf_sum
+
+    def covers(self, timestamp, now):
+        return int(now // self.seconds) - int(timestamp // self.seconds) < self.capacity
+
+    def query(self, start, end):
+        """Rows of (bucket start time, faces, max faces in a frame, mean confidence), oldest first"""
+        first = int(start // self.seconds)
+        last = int(end // self.seconds)
+        valid = (self.bucket >= first) & (self.bucket <= last)
+        order = np.argsort(self.bucket[valid])
+        buckets = self.bucket[valid][order]
+        count = self.count[valid][order]
+        mean_conf = np.divide(self.conf_sum[valid][order], count, out=np.zeros(len(order)), where=count > 0)
+        return [(int(b) * int(self.seconds), int(c), int(m), float(mc))
+                for b, c, m, mc in zip(buckets, count, self.max[valid][order], mean_conf)]
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, field).nbytes for field in self.FIELDS)
+
+
+class FaceCountStore:
+    """Per-source face counts at 1 s / 1 min / 1 h resolution in constant memory"""
+
+    def __init__(self, resolutions=DEFAULT_RESOLUTIONS, path=None):
+        self.resolutions = tuple(resolutions)
+        self.path = path
+        self.sources = {}
+        self.lock = threading.Lock()
+        self._stop = threading.Event()
+        self._saver = None
+
+    def _series(self, source_id):
+        series = self.sources.get(source_id)
+        if series is None:
+            series = self.sources[source_id] = [RingSeries(s, n) for s, n in self.resolutions]
+        return series
+
+    def record(self, source_id, timestamp, faces, conf_sum=0.0):
+        with self.lock:
+            for ring in self._series(source_id):
+                ring.add(timestamp, faces, conf_sum)
+
+    def count_probe(self, pad, info, u_data):
+        """Buffer probe recording faces per frame against wall-clock time"""
+        gst_buffer = info.get_buffer()
+        if not gst_buffer:
+            return Gst.PadProbeReturn.OK
+
+        now = time.time()
+        backend = backend_for(pyds)
+        batch_meta = backend.batch_meta(gst_buffer)
+        for frame_meta in iter_frames(batch_meta, backend):
+            faces = 0
+            conf_sum = 0.0
+            for obj_meta in iter_objects(frame_meta, backend, PGIE_CLASS_ID_FACE):
+                faces += 1
+                conf_sum += obj_meta.confidence
+            self.record(frame_meta.source_id, now, faces, conf_sum)
+        return Gst.PadProbeReturn.OK
+
+    def query(self, source_id, start, end, resolution=None, now=None):
+        """Buckets for [start, end]; picks the finest resolution still covering start by default"""
+        now = time.time() if now is None else now
+        with self.lock:
+            series = self.sources.get(source_id)
+            if series is None:
+                return []
+            if resolution is None:
+                ring = next((r for r in series if r.covers(start, now)), series[-1])
+            else:
+                ring = next(r for r in series if r.seconds == resolution)
+            return ring.query(start, end)
+
+    @property
+    def nbytes(self):
+        with self.lock:
+            return sum(ring.nbytes for series in self.sources.values() for ring in series)
+
+    def save(self, path=None):
+        """Write all rings to one compressed .npz, replacing the previous file atomically"""
+        path = path or self.path
+        arrays = {"resolutions": np.array(self.resolutions, np.int64)}
+        with self.lock:
+            for source_id, series in self.sources.items():
+                for ring in series:
+                    for field in RingSeries.FIELDS:
+                        arrays[f"{source_id}_{ring.seconds}_{field}"] = getattr(ring, field).copy()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = path + ".tmp.npz"
+        np.savez_compressed(tmp_path, **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            store = cls([(int(s), int(n)) for s, n in data["resolutions"]], path)
+            for key in data.files:
+                if not key.endswith("_bucket"):
+                    continue
+                source_id, seconds, _ = key.split("_", 2)
+                series = store._series(int(source_id))
+                ring = next(r for r in series if r.seconds == int(seconds))
+                for field in RingSeries.FIELDS:
+                    getattr(ring, field)[:] = data[f"{source_id}_{seconds}_{field}"]
+        return store
+
+    @classmethod
+    def open(cls, path, resolutions=DEFAULT_RESOLUTIONS):
+        """The history saved at `path` when there is one, so restarts keep it, else an empty store"""
+        if not os.path.exists(path):
+            return cls(resolutions, path)
+        try:
+            return cls.load(path)
+        except (OSError, ValueError, KeyError) as e:
+            # Keep the unreadable file for inspection rather than overwriting it on the next autosave
+            print(f"Unable to load face counts from {path}: {e}")
+            os.replace(path, path + ".bad")
+            return cls(resolutions, path)
+
+    def start_autosave(self, interval=60.0):
+        def loop():
+            while not self._stop.wait(interval):
+                try:
+                    self.save()
+                except OSError as e:
+                    print(f"Unable to save face counts to {self.path}: {e}")
+
+        self._saver = threading.Thread(target=loop, name="face-count-autosave", daemon=True)
+        self._saver.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._saver is not None:
+            self._saver.join()
+            self._saver = None
+        if self.path:
+            self.save()
+
+
+def main():
+    # Two simulated days of 4 cameras at 30 fps, then a "faces per minute" query for the last hour
+    store = FaceCountStore()
+    rng = np.random.default_rng(0)
+    start = 1_700_000_000.0
+    frames = 2 * 24 * 3600 * 30
+    step = 30 * 10  # record one frame in 300 to keep the demo quick
+    t0 = time.perf_counter()
+    for frame in range(0, frames, step):
+        timestamp = start + frame / 30
+        for source_id in range(4):
+            faces = int(rng.poisson(1 + source_id))
+            store.record(source_id, timestamp, faces, faces * 0.7)
+    elapsed = time.perf_counter() - t0
+    end = start + frames / 30
+    rows = store.query(0, end - 3600, end, now=end)
+    print(f"Recorded {4 * frames // step} frames in {elapsed:.2f}s, store uses {store.nbytes / 1024:.0f} KiB")
+    print(f"Last hour at {len(rows)} buckets; first: {rows[0] if rows else None}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import cv2
+import gi
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst
+
+try:
+    import pyds
+except ImportError:
+    pyds = None
+
+from batch_meta_iter import backend_for, iter_frames, iter_objects
+
+PGIE_CLASS_ID_FACE = 0
+UNTRACKED_OBJECT_ID = 0xFFFFFFFFFFFFFFFF
+# Jetson maps the NVMM surface for the CPU on each get_nvds_buf_surface and needs an explicit unmap
+IS_AARCH64 = os.uname().machine == 'aarch64'
+
+
+def crop_key(source_id, frame_num, object_id, index):
+    """Key a crop by track when the tracker assigned one, otherwise by frame"""
+    if object_id != UNTRACKED_OBJECT_ID:
+        return ("track", source_id, object_id)
+    return ("frame", source_id, frame_num, index)
+
+
+class ThumbnailCache:
+    """LRU cache of encoded thumbnails bounded by bytes, spilling evictions to disk
+
+    Only crops keyed by a track are spilled; without a tracker every crop
+    gets a per-frame key, and spilling those would write at frame rate.
+    """
+
+    def __init__(self, max_bytes=32 * 1024 * 1024, spill_dir=None, max_spill_bytes=512 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir
+        self.max_spill_bytes = max_spill_bytes
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.spilled = OrderedDict()
+        self.bytes = 0
+        self.spill_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+
+    def put(self, key, data):
+        evicted = []
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.bytes -= len(old)
+            self.entries[key] = data
+            self.bytes += len(data)
+            while self.bytes > self.max_bytes and len(self.entries) > 1:
+                old_key, old_data = self.entries.popitem(last=False)
+                self.bytes -= len(old_data)
+                evicted.append((old_key, old_data))
+        # Disk writes happen outside the lock so readers never wait on I/O
+        for old_key, old_data in evicted:
+            self._spill(old_key, old_data)
+
+    def get(self, key):
+        with self.lock:
+            data = self.entries.get(key)
+            if data is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return data
+            spilled = self.spilled.get(key)
+        if spilled is not None:
+            path = spilled[0]
+            try:
+                with open(path, 'rb') as f:
+                    data = f.read()
+            except OSError:
+                data = None
+            if data is not None:
+                with self.lock:
+                    self.hits += 1
+                return data
+        with self.lock:
+            self.misses += 1
+        return None
+
+    def keys(self):
+        with self.lock:
+            return list(self.entries.keys()) + list(self.spilled.keys())
+
+    def _spill(self, key, data):
+        if not self.spill_dir or key[0] != "track":
+            return
+        path = os.path.join(self.spill_dir, "_".join(str(part) for part in key) + ".jpg")
+        try:
+            with open(path, 'wb') as f:
+                f.write(data)
+        except OSError as e:
+            print(f"Unable to spill thumbnail {path}: {e}")
+            return
+        stale = []
+        with self.lock:
+            previous = self.spilled.pop(key, None)
+            if previous is not None:
+                self.spill_bytes -= previous[1]
+            self.spilled[key] = (path, len(data))
+            self.spill_bytes += len(data)
+            while self.spill_bytes > self.max_spill_bytes and len(self.spilled) > 1:
+                stale_path, stale_size = self.spilled.popitem(last=False)[1]
+                self.spill_bytes -= stale_size
+                stale.append(stale_path)
+        for stale_path in stale:
+            try:
+                os.remove(stale_path)
+            except OSError:
+                pass
+
+
+class FaceCropStage:
+    """Crops detected faces on the streaming thread and JPEG-encodes them in a worker pool"""
+
+    def __init__(self, cache=None, workers=2, max_pending=64, jpeg_quality=85,
+                 thumb_size=128, min_size=16, padding=0.1):
+        self.cache = cache if cache is not None else ThumbnailCache()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="crop-encode")
+        self.max_pending = max_pending
+        self.jpeg_quality = jpeg_quality
+        self.thumb_size = thumb_size
+        self.min_size = min_size
+        self.padding = padding
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.submitted = 0
+        self.encoded = 0
+        self.dropped = 0
+
+    def submit_frame(self, frame, source_id, frame_num, boxes, rgba=False):
+        """Queue crops of (object_id, left, top, width, height) boxes from one frame"""
+        frame_h, frame_w = frame.shape[:2]
+        for index, (object_id, left, top, width, height) in enumerate(boxes):
+            if width < self.min_size or height < self.min_size:
+                continue
+            with self.lock:
+                if self.pending >= self.max_pending:
+                    # Never make the streaming thread wait on the encoders
+                    self.dropped += 1
+                    continue
+                self.pending += 1
+                self.submitted += 1
+            pad_w = width * self.padding
+            pad_h = height * self.padding
+            x0 = max(0, int(left - pad_w))
+            y0 = max(0, int(top - pad_h))
+            x1 = min(frame_w, int(left + width + pad_w))
+            y1 = min(frame_h, int(top + height + pad_h))
+            # Copy now: the frame surface is recycled once the probe returns
+            crop = np.array(frame[y0:y1, x0:x1], copy=True)
+            key = crop_key(source_id, frame_num, object_id, index)
+            self.executor.submit(self._encode, key, crop, rgba)
+
+    def _encode(self, key, crop, rgba):
+        try:
+            if rgba:
+                crop = cv2.cvtColor(crop, cv2.COLOR_RGBA2BGR)
+            if self.thumb_size:
+                scale = self.thumb_size / max(crop.shape[:2])
+                if scale < 1.0:
+                    crop = cv2.resize(crop, (max(1, int(crop.shape[1] * scale)), max(1, int(crop.shape[0] * scale))),
+                                      interpolation=cv2.INTER_AREA)
+            ok, encoded = cv2.imencode(".jpg", crop, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+            if ok:
+                self.cache.put(key, encoded.tobytes())
+                with self.lock:
+                    self.encoded += 1
+        except Exception as e:
+            print(f"Crop encode failed for {key}: {e}")
+        finally:
+            with self.lock:
+                self.pending -= 1
+
+    def crop_probe(self, pad, info, u_data):
+        """Buffer probe cropping faces from RGBA NVMM frames (osd sink pad)"""
+        gst_buffer = info.get_buffer()
+        if not gst_buffer:
+            return Gst.PadProbeReturn.OK
+
+        backend = backend_for(pyds)
+        batch_meta = backend.batch_meta(gst_buffer)
+        for frame_meta in iter_frames(batch_meta, backend):
+            boxes = []
+            for obj_meta in iter_objects(frame_meta, backend, PGIE_CLASS_ID_FACE, min_width=self.min_size,
+                                         min_height=self.min_size):
+                rect = obj_meta.rect_params
+                boxes.append((obj_meta.object_id, rect.left, rect.top, rect.width, rect.height))
+
+            if boxes:
+                frame = pyds.get_nvds_buf_surface(hash(gst_buffer), frame_meta.batch_id)
+                try:
+                    self.submit_frame(frame, frame_meta.source_id, frame_meta.frame_num, boxes, rgba=True)
+                finally:
+                    if IS_AARCH64:
+                        pyds.unmap_nvds_buf_surface(hash(gst_buffer), frame_meta.batch_id)
+
+        return Gst.PadProbeReturn.OK
+
+    def stats(self):
+        with self.lock:
+            return {
+                "submitted": self.submitted,
+                "encoded": self.encoded,
+                "dropped": self.dropped,
+                "pending": self.pending,
+                "cache_bytes": self.cache.bytes,
+                "cache_entries": len(self.cache.entries),
+            }
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+
+def benchmark(num_frames=300, faces_per_frame=8, width=1920, height=1080, workers=4):
+    """Measure crops/sec on CPU and how long the streaming thread spends per frame"""
+    rng = np.random.default_rng(0)
+    frame = rng.integers(0, 255, size=(height, width, 4), dtype=np.uint8)
+    stage = FaceCropStage(workers=workers, max_pending=num_frames * faces_per_frame)
+    boxes_per_frame = []
+    for frame_num in range(num_frames):
+        sizes = rng.integers(48, 240, size=faces_per_frame)
+        lefts = rng.integers(0, width - 240, size=faces_per_frame)
+        tops = rng.integers(0, height - 240, size=faces_per_frame)
+        boxes_per_frame.append([(frame_num * faces_per_frame + i, float(l), float(t), float(s), float(s))
+                                for i, (l, t, s) in enumerate(zip(lefts, tops, sizes))])
+
+    start = time.perf_counter()
+    submit_time = 0.0
+    for frame_num, boxes in enumerate(boxes_per_frame):
+        t0 = time.perf_counter()
+        stage.submit_frame(frame, 0, frame_num, boxes, rgba=True)
+        submit_time += time.perf_counter() - t0
+    stage.close()
+    elapsed = time.perf_counter() - start
+
+    stats = stage.stats()
+    print(f"Crops encoded: {stats['encoded']} in {elapsed:.2f}s "
+          f"({stats['encoded'] / elapsed:.0f} crops/sec, {workers} workers)")
+    print(f"Streaming thread cost: {submit_time / num_frames * 1e6:.0f} us/frame "
+          f"({faces_per_frame} faces/frame, {width}x{height})")
+    print(f"Cache: {stats['cache_entries']} thumbnails, {stats['cache_bytes'] / 1024:.0f} KiB")
+    return stats
+
+
+def main():
+    benchmark()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,15 +1,16 @@
 #!/usr/bin/env python3
 
+from startup_profile import StartupProfiler, configure_registry_cache, make_elements
+profiler = StartupProfiler()
+
+import os
 import sys
-import gi
-gi.require_version('Gst', '1.0')
-from gi.repository import GObject, Gst
-import pyds
-import platform
-import math
-import time
-from ctypes import *
-import threading
+with profiler.phase("import gi + pyds"):
+    import gi
+    gi.require_version('Gst', '1.0')
+    from gi.repository import GObject, Gst
+    import pyds
+from batch_meta_iter import backend_for, iter_frames, iter_objects
 
 def osd_sink_pad_buffer_probe(pad, info, u_data):
     frame_number = 0
@@ -19,48 +20,60 @@ def osd_sink_pad_buffer_probe(pad, info, u_data):
         print("Unable to get GstBuffer ")
         return
 
-    batch_meta = pyds.gst_buffer_get_nvds_batch_meta(hash(gst_buffer))
-    l_frame = batch_meta.frame_meta_list
-    while l_frame is not None:
-        try:
-            frame_meta = pyds.NvDsFrameMeta.cast(l_frame.data)
-        except StopIteration:
-            break
-
+    backend = backend_for(pyds)
+    batch_meta = backend.batch_meta(gst_buffer)
+    for frame_meta in iter_frames(batch_meta, backend):
         frame_number = frame_meta.frame_num
-        l_obj = frame_meta.obj_meta_list
         num_rects = frame_meta.num_obj_meta
 
-        while l_obj is not None:
-            try:
-                obj_meta = pyds.NvDsObjectMeta.cast(l_obj.data)
-            except StopIteration:
-                break
-
-            if obj_meta.class_id == 0:  # Face detection class
-                print(f"Frame {frame_number}: Face detected at "
-                      f"({obj_meta.rect_params.left:.0f}, {obj_meta.rect_params.top:.0f}) "
-                      f"width={obj_meta.rect_params.width:.0f} "
-                      f"height={obj_meta.rect_params.height:.0f} "
-                      f"confidence={obj_meta.confidence:.2f}")
-
-            try:
-                l_obj = l_obj.next
-            except StopIteration:
-                break
+        for obj_meta in iter_objects(frame_meta, backend, class_ids=0):  # Face detection class
+            print(f"Frame {frame_number}: Face detected at "
+                  f"({obj_meta.rect_params.left:.0f}, {obj_meta.rect_params.top:.0f}) "
+                  f"width={obj_meta.rect_params.width:.0f} "
+                  f"height={obj_meta.rect_params.height:.0f} "
+                  f"confidence={obj_meta.confidence:.2f}")
 
         print(f"Frame {frame_number}: Objects detected: {num_rects}")
-        
-        try:
-            l_frame = l_frame.next
-        except StopIteration:
-            break
 
     return Gst.PadProbeReturn.OK
 
+# (factory, name); none of these depend on each other, so they are created concurrently
+PIPELINE_ELEMENTS = [
+    ("v4l2src", "usb-cam-source"),
+    ("capsfilter", "v4l2src_caps"),
+    ("videoconvert", "convertor_src1"),
+    ("nvvideoconvert", "convertor_src2"),
+    ("capsfilter", "nvmm_caps"),
+    ("nvstreammux", "Stream-muxer"),
+    ("nvinfer", "primary-inference"),
+    ("nvvideoconvert", "convertor"),
+    ("capsfilter", "rgba_caps"),
+    ("nvdsosd", "onscreendisplay"),
+    ("nvvideoconvert", "convertor_postosd"),
+    ("capsfilter", "filter"),
+    ("nvv4l2h264enc", "encoder"),
+    ("rtph264pay", "rtppay"),
+    ("udpsink", "udpsink"),
+]
+
+def option_value(args, name):
+    """Value following `name` on the command line, or None"""
+    if name in args[1:-1]:
+        return args[args.index(name) + 1]
+    return None
+
 def main(args):
-    GObject.threads_init()
-    Gst.init(None)
+    with profiler.phase("Gst.init + registry"):
+        configure_registry_cache()
+        GObject.threads_init()
+        Gst.init(None)
+
+    # --profile-probes <dir> times every probe added below and samples their Python stacks
+    probe_profiler = None
+    if option_value(args, '--profile-probes'):
+        from probe_profiler import ProbeProfiler
+        probe_profiler = ProbeProfiler()
+        probe_profiler.install()
 
     print("Creating Pipeline")
     pipeline = Gst.Pipeline()
@@ -68,79 +81,57 @@ def main(args):
     if not pipeline:
         sys.stderr.write(" Unable to create Pipeline \n")
 
-    print("Creating Source")
-    source = Gst.ElementFactory.make("v4l2src", "usb-cam-source")
-    if not source:
-        sys.stderr.write(" Unable to create Source \n")
-
-    caps_v4l2src = Gst.ElementFactory.make("capsfilter", "v4l2src_caps")
-    if not caps_v4l2src:
-        sys.stderr.write(" Unable to create v4l2src caps \n")
-
-    print("Creating Video Converter")
-    vidconvsrc = Gst.ElementFactory.make("videoconvert", "convertor_src1")
-    if not vidconvsrc:
-        sys.stderr.write(" Unable to create videoconvert \n")
-
-    nvvidconvsrc = Gst.ElementFactory.make("nvvideoconvert", "convertor_src2")
-    if not nvvidconvsrc:
-        sys.stderr.write(" Unable to create nvvideoconvert \n")
-
-    caps_vidconvsrc = Gst.ElementFactory.make("capsfilter", "nvmm_caps")
-    if not caps_vidconvsrc:
-        sys.stderr.write(" Unable to create capsfilter \n")
-
-    print("Creating Streamux")
-    streammux = Gst.ElementFactory.make("nvstreammux", "Stream-muxer")
-    if not streammux:
-        sys.stderr.write(" Unable to create NvStreamMux \n")
-
-    print("Creating Pgie")
-    pgie = Gst.ElementFactory.make("nvinfer", "primary-inference")
-    if not pgie:
-        sys.stderr.write(" Unable to create pgie \n")
-
-    print("Creating nvvidconv")
-    nvvidconv = Gst.ElementFactory.make("nvvideoconvert", "convertor")
-    if not nvvidconv:
-        sys.stderr.write(" Unable to create nvvidconv \n")
-
-    print("Creating nvosd")
-    nvosd = Gst.ElementFactory.make("nvdsosd", "onscreendisplay")
-    if not nvosd:
-        sys.stderr.write(" Unable to create nvosd \n")
-
-    nvvidconv_postosd = Gst.ElementFactory.make("nvvideoconvert", "convertor_postosd")
-    if not nvvidconv_postosd:
-        sys.stderr.write(" Unable to create nvvidconv_postosd \n")
-
-    caps = Gst.ElementFactory.make("capsfilter", "filter")
-    caps.set_property("caps", Gst.Caps.from_string("video/x-raw(memory:NVMM), format=I420"))
+    print("Creating elements")
+    with profiler.phase("element creation"):
+        pending = make_elements(PIPELINE_ELEMENTS)
+        # Plugin loading runs on the factory threads; import the numpy/OpenCV stages meanwhile
+        with profiler.phase("import probe stages"):
+            from face_crops import FaceCropStage, ThumbnailCache
+            from box_filter import BoxFilter
+            from face_count_store import FaceCountStore
+            from snapshot_service import SnapshotService
+            from muxer_resolution import MuxerResolutionMatcher
+            from push_timeout_tuner import MuxerTimeoutControl
+        elements = pending.result()
+
+    source = elements["usb-cam-source"]
+    caps_v4l2src = elements["v4l2src_caps"]
+    vidconvsrc = elements["convertor_src1"]
+    nvvidconvsrc = elements["convertor_src2"]
+    caps_vidconvsrc = elements["nvmm_caps"]
+    streammux = elements["Stream-muxer"]
+    pgie = elements["primary-inference"]
+    nvvidconv = elements["convertor"]
+    rgba_caps = elements["rgba_caps"]
+    nvosd = elements["onscreendisplay"]
+    nvvidconv_postosd = elements["convertor_postosd"]
+    caps = elements["filter"]
+    encoder = elements["encoder"]
+    rtppay = elements["rtppay"]
+    sink = elements["udpsink"]
 
-    encoder = Gst.ElementFactory.make("nvv4l2h264enc", "encoder")
-    if not encoder:
-        sys.stderr.write(" Unable to create encoder")
-
-    rtppay = Gst.ElementFactory.make("rtph264pay", "rtppay")
-    if not rtppay:
-        sys.stderr.write(" Unable to create rtppay")
-
-    print("Creating Sink")
-    sink = Gst.ElementFactory.make("udpsink", "udpsink")
-    if not sink:
-        sys.stderr.write(" Unable to create udpsink")
+    caps.set_property("caps", Gst.Caps.from_string("video/x-raw(memory:NVMM), format=I420"))
 
     print("Playing USB camera")
     source.set_property('device', '/dev/video0')
     caps_v4l2src.set_property('caps', Gst.Caps.from_string("video/x-raw, framerate=30/1"))
     caps_vidconvsrc.set_property('caps', Gst.Caps.from_string("video/x-raw(memory:NVMM)"))
+    # The probes on the osd sink pad read frames through get_nvds_buf_surface, which only maps RGBA
+    rgba_caps.set_property('caps', Gst.Caps.from_string("video/x-raw(memory:NVMM), format=RGBA"))
 
+    # 1920x1080 is only a fallback until the camera caps are known
     streammux.set_property('width', 1920)
     streammux.set_property('height', 1080)
     streammux.set_property('batch-size', 1)
-    streammux.set_property('batched-push-timeout', 4000000)
+    # Sets batched-push-timeout just above the measured batch fill time instead of a fixed 4 s
+    mux_timeout = MuxerTimeoutControl(streammux)
 
-    pgie.set_property('config-file-path', "/opt/nvidia/deepstream/deepstream/samples/configs/deepstream-app/config_infer_primary.txt")
+    config_path = "/opt/nvidia/deepstream/deepstream/samples/configs/deepstream-app/config_infer_primary.txt"
+    pgie.set_property('config-file-path', config_path)
+
+    # Face crops are read from host memory, so dGPU needs CUDA unified buffers
+    if os.uname().machine != 'aarch64':
+        nvvidconv.set_property('nvbuf-memory-type', int(pyds.NVBUF_MEM_CUDA_UNIFIED))
 
     sink.set_property('host', '224.224.255.255')
     sink.set_property('port', 5000)
@@ -156,6 +147,7 @@ def main(args):
     pipeline.add(streammux)
     pipeline.add(pgie)
     pipeline.add(nvvidconv)
+    pipeline.add(rgba_caps)
     pipeline.add(nvosd)
     pipeline.add(sink)
 
@@ -172,10 +164,15 @@ def main(args):
     if not srcpad:
         sys.stderr.write(" Unable to get source pad of caps_vidconvsrc \n")
     srcpad.link(sinkpad)
+    matcher = MuxerResolutionMatcher(streammux, config_path)
+    matcher.attach(srcpad)
+    mux_timeout.watch_input(0, srcpad)
+    mux_timeout.attach()
 
     streammux.link(pgie)
     pgie.link(nvvidconv)
-    nvvidconv.link(nvosd)
+    nvvidconv.link(rgba_caps)
+    rgba_caps.link(nvosd)
     nvosd.link(sink)
 
     osdsinkpad = nvosd.get_static_pad("sink")
@@ -184,8 +181,89 @@ def main(args):
 
     osdsinkpad.add_probe(Gst.PadProbeType.BUFFER, osd_sink_pad_buffer_probe, 0)
 
+    # Drop overlapping, tiny and implausibly shaped boxes before anything downstream sees them
+    box_filter = BoxFilter(class_thresholds={0: 0.4})
+
+    # --crops <dir> keeps face thumbnails in memory; only tracked faces are spilled to <dir>
+    crop_stage = None
+    if option_value(args, '--crops'):
+        crop_stage = FaceCropStage(cache=ThumbnailCache(spill_dir=option_value(args, '--crops')))
+        osdsinkpad.add_probe(Gst.PadProbeType.BUFFER, crop_stage.crop_probe, 0)
+
+    # --hard-examples <dir> keeps frames the detector likely got wrong (borderline scores, lost tracks,
+    # count jumps) for retraining. The borderline window starts at the box filter threshold, as weaker
+    # faces are class -1 by now; lost tracks need a tracker after pgie, so without one only scores and
+    # count jumps qualify
+    hard_examples = None
+    if option_value(args, '--hard-examples'):
+        from hard_examples import HardExampleSampler
+        face_threshold = box_filter.class_thresholds.get(0, box_filter.default_threshold)
+        hard_examples = HardExampleSampler(out_dir=option_value(args, '--hard-examples'),
+                                           borderline=(face_threshold, 0.6))
+        osdsinkpad.add_probe(Gst.PadProbeType.BUFFER, hard_examples.sample_probe, 0)
+
+    # --best-shots <dir> keeps the sharpest, largest, most frontal crop per track, written when the track ends;
+    # faces only get track ids once a tracker runs after pgie
+    best_shots = None
+    if option_value(args, '--best-shots'):
+        from best_shot import BestShotSelector
+        best_shots = BestShotSelector(out_dir=option_value(args, '--best-shots'))
+        osdsinkpad.add_probe(Gst.PadProbeType.BUFFER, best_shots.best_shot_probe, 0)
+
+    # --snapshots <port> or <host:port>: "what does camera N see right now" at
+    # http://127.0.0.1:<port>/snapshot/<N>.jpg?boxes=1; unauthenticated, so loopback unless a host is given
+    snapshots = None
+    if option_value(args, '--snapshots'):
+        host, _, port = option_value(args, '--snapshots').rpartition(':')
+        snapshots = SnapshotService()
+        osdsinkpad.add_probe(Gst.PadProbeType.BUFFER, snapshots.snapshot_probe, 0)
+        snapshots.serve(int(port), host or "127.0.0.1")
+
+    # --record <file> captures per-batch metadata for replay on machines without a GPU
+    recorder = None
+    if option_value(args, '--record'):
+        from metadata_replay import MetadataRecorder
+        recorder = MetadataRecorder(option_value(args, '--record'))
+        pgiesrcpad = pgie.get_static_pad("src")
+        pgiesrcpad.add_probe(Gst.PadProbeType.BUFFER, recorder.record_probe, 0)
+
+    # Attached after the recorder, so recordings keep the unfiltered boxes
+    pgiesrcpad = pgie.get_static_pad("src")
+    pgiesrcpad.add_probe(Gst.PadProbeType.BUFFER, box_filter.filter_probe, 0)
+
+    # Faces per second/minute/hour per camera, persisted once a minute and reloaded on restart
+    face_counts = FaceCountStore.open("output/face_counts.npz")
+    pgiesrcpad.add_probe(Gst.PadProbeType.BUFFER, face_counts.count_probe, 0)
+    face_counts.start_autosave(60)
+
+    # --zones <file.json> counts occupancy and entries per zone and crossings per line
+    zones = None
+    if option_value(args, '--zones'):
+        from zone_analytics import ZoneAnalytics, load_zones
+        zones = ZoneAnalytics(load_zones(option_value(args, '--zones')))
+        pgiesrcpad.add_probe(Gst.PadProbeType.BUFFER, zones.analytics_probe, 0)
+
+    # --webhook <url> pushes detection events to the incident service in batches, off the streaming thread
+    webhook = None
+    if option_value(args, '--webhook'):
+        from webhook_delivery import WebhookDelivery
+        webhook = WebhookDelivery(option_value(args, '--webhook'))
+        pgiesrcpad.add_probe(Gst.PadProbeType.BUFFER, webhook.event_probe, 0)
+
+    pgiesrcpad.add_probe(Gst.PadProbeType.BUFFER, profiler.first_buffer_probe, 0)
+
     print("Starting pipeline")
-    pipeline.set_state(Gst.State.PLAYING)
+    # Stepping through the states separately shows where the time goes: devices open
+    # on READY, nvinfer deserializes (or builds) its TensorRT engine on PAUSED
+    with profiler.phase("state change to READY"):
+        pipeline.set_state(Gst.State.READY)
+    with profiler.phase("state change to PAUSED (engine load)"):
+        pipeline.set_state(Gst.State.PAUSED)
+    with profiler.phase("state change to PLAYING"):
+        pipeline.set_state(Gst.State.PLAYING)
+    mux_timeout.start()
+    if probe_profiler:
+        probe_profiler.start()
 
     try:
         loop = GObject.MainLoop()
@@ -193,7 +271,30 @@ def main(args):
     except:
         pass
 
+    mux_timeout.stop()
+    if probe_profiler:
+        probe_profiler.stop()
+        probe_profiler.write(option_value(args, '--profile-probes'), pipeline)
+        print(probe_profiler.cost_table())
     pipeline.set_state(Gst.State.NULL)
+    if crop_stage:
+        crop_stage.close()
+    if hard_examples:
+        hard_examples.close()
+    if best_shots:
+        best_shots.close()
+    if snapshots:
+        snapshots.shutdown()
+    face_counts.stop()
+    if recorder:
+        recorder.close()
+    if webhook:
+        webhook.close()
+    print("⏱️  Muxer batching:")
+    print(mux_timeout.report())
+    if zones:
+        print("Zone analytics:")
+        print(zones.report())
 
 if __name__ == '__main__':
     sys.exit(main(sys.argv))
\ No newline at end of file
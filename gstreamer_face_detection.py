@@ -1,10 +1,15 @@
 #!/usr/bin/env python3
 
+import os
 import sys
 import gi
 gi.require_version('Gst', '1.0')
 from gi.repository import GObject, Gst
 import signal
+from muxer_resolution import MuxerResolutionMatcher
+from source_watchdog import SourceWatchdog, build_source_bin
+from display_branch import DisplayBranch
+from push_timeout_tuner import MuxerTimeoutControl
 
 class DeepStreamFaceDetection:
     def __init__(self):
@@ -13,6 +18,10 @@ class DeepStreamFaceDetection:
         self.pipeline = None
         self.loop = None
         self.frame_count = 0
+        self.matcher = None
+        self.watchdog = SourceWatchdog()
+        self.display = None
+        self.mux_timeout = None
         
     def create_pipeline(self):
         print("Creating DeepStream face detection pipeline...")
@@ -47,54 +56,58 @@ class DeepStreamFaceDetection:
         caps_vidconvsrc.set_property("caps", 
             Gst.Caps.from_string("video/x-raw(memory:NVMM)"))
         
-        streammux.set_property("width", 1920)
-        streammux.set_property("height", 1080)
-        streammux.set_property("batch-size", 1)
-        streammux.set_property("batched-push-timeout", 4000000)
-        
         # Use primary inference config for face detection
         config_path = "/opt/nvidia/deepstream/deepstream/samples/configs/deepstream-app/config_infer_primary.txt"
         pgie.set_property("config-file-path", config_path)
         
+        # 1920x1080 is only a fallback until the camera caps are known
+        streammux.set_property("width", 1920)
+        streammux.set_property("height", 1080)
+        streammux.set_property("batch-size", 1)
+        # Sets batched-push-timeout just above the measured batch fill time instead of a fixed 4 s
+        self.mux_timeout = MuxerTimeoutControl(streammux)
+        self.matcher = MuxerResolutionMatcher(streammux, config_path)
+        
         caps_filter.set_property("caps", Gst.Caps.from_string("video/x-raw, format=RGBA"))
         
         sink.set_property("sync", False)
         sink.set_property("async", False)
         
+        # Source chain lives in its own bin so the watchdog can restart it alone
+        source_bin = build_source_bin("source-bin-0", [source, caps_v4l2src, vidconvsrc, nvvidconvsrc, caps_vidconvsrc])
+        if not source_bin:
+            return False
+        
         # Add elements to pipeline
-        elements = [source, caps_v4l2src, vidconvsrc, nvvidconvsrc, caps_vidconvsrc,
-                   streammux, pgie, nvvidconv, nvosd, nvvidconv_postosd, caps_filter, videoconvert, sink]
+        elements = [source_bin, streammux, pgie]
         for element in elements:
             self.pipeline.add(element)
         
-        # Link elements
-        source.link(caps_v4l2src)
-        caps_v4l2src.link(vidconvsrc)
-        vidconvsrc.link(nvvidconvsrc)
-        nvvidconvsrc.link(caps_vidconvsrc)
-        
         # Link to streammux
         sinkpad = streammux.get_request_pad("sink_0")
-        srcpad = caps_vidconvsrc.get_static_pad("src")
+        srcpad = source_bin.get_static_pad("src")
         srcpad.link(sinkpad)
-        
-        # Link rest of pipeline
+        self.matcher.attach(srcpad)
+        self.mux_timeout.watch_input(0, srcpad)
+        self.mux_timeout.attach()
+        self.watchdog.watch(0, source_bin)
+        
+        # Link rest of pipeline; OSD and window only run while a viewer is attached
+        # (SIGUSR1 attaches, SIGUSR2 detaches)
+        self.display = DisplayBranch(self.pipeline, [nvvidconv, nvosd, nvvidconv_postosd,
+                                                      caps_filter, videoconvert, sink],
+                                     attached=bool(os.environ.get("DISPLAY")))
         streammux.link(pgie)
-        pgie.link(nvvidconv)
-        nvvidconv.link(nvosd)
-        nvosd.link(nvvidconv_postosd)
-        nvvidconv_postosd.link(caps_filter)
-        caps_filter.link(videoconvert)
-        videoconvert.link(sink)
+        pgie.link(self.display.tee)
         
         # Add probe to see detection results
-        osdsinkpad = nvosd.get_static_pad("sink")
-        osdsinkpad.add_probe(Gst.PadProbeType.BUFFER, self.osd_sink_pad_buffer_probe, 0)
+        pgiesrcpad = pgie.get_static_pad("src")
+        pgiesrcpad.add_probe(Gst.PadProbeType.BUFFER, self.pgie_src_pad_buffer_probe, 0)
         
         print("Pipeline created successfully")
         return True
         
-    def osd_sink_pad_buffer_probe(self, pad, info, u_data):
+    def pgie_src_pad_buffer_probe(self, pad, info, u_data):
         # This is a simplified probe without PyDS
         self.frame_count += 1
         if self.frame_count % 30 == 0:  # Print every 30 frames (1 second at 30fps)
@@ -118,6 +131,10 @@ class DeepStreamFaceDetection:
             
         # Run main loop
         self.loop = GObject.MainLoop()
+        self.watchdog.start()
+        self.mux_timeout.start()
+        self.display.start()
+        self.display.toggle_on_signals()
         
         def signal_handler(sig, frame):
             print(f"\nStopping pipeline... Processed {self.frame_count} frames")
@@ -132,7 +149,17 @@ class DeepStreamFaceDetection:
             print(f"\nKeyboard interrupt received. Processed {self.frame_count} frames")
         
         # Cleanup
+        self.mux_timeout.stop()
+        self.watchdog.stop()
+        display_report = self.display.report()
         self.pipeline.set_state(Gst.State.NULL)
+        print("CPU by display mode:")
+        print(display_report)
+        print("⏱️  Muxer batching:")
+        print(self.mux_timeout.report())
+        if self.watchdog.incidents:
+            print("Source incidents:")
+            print(self.watchdog.report())
         print("Pipeline stopped")
         return True
         
@@ -142,6 +169,9 @@ class DeepStreamFaceDetection:
             print("End-of-stream")
             self.loop.quit()
         elif t == Gst.MessageType.ERROR:
+            # Errors inside a source bin restart that source only
+            if self.watchdog.handle_error(message) or self.display.handle_error(message):
+                return
             err, debug = message.parse_error()
             print(f"Error: {err}")
             if debug:
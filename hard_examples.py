@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import cv2
+import gi
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst
+
+try:
+    import pyds
+except ImportError:
+    pyds = None
+
+from batch_meta_iter import backend_for, iter_frames, iter_objects
+
+PGIE_CLASS_ID_FACE = 0
+UNTRACKED_OBJECT_ID = 0xFFFFFFFFFFFFFFFF
+# Jetson maps the NVMM surface for the CPU on each get_nvds_buf_surface and needs an explicit unmap
+IS_AARCH64 = os.uname().machine == 'aarch64'
+
+
+class SourceState:
+    __slots__ = ("tracks", "count_average", "last_saved")
+
+    def __init__(self):
+        # object_id -> consecutive frames seen, for the tracks present in the previous frame
+        self.tracks = {}
+        self.count_average = None
+        self.last_saved = None
+
+
+class HardExampleSampler:
+    """Keeps frames the detector probably got wrong, for retraining
+
+    A frame qualifies on a borderline confidence, a track that disappears
+    after being stable, or a detection count that jumps away from its
+    running average. Only metadata is looked at per frame; the surface is
+    read and copied only for a frame that qualifies and is not rate
+    limited. Files are written by a small worker pool and the directory is
+    kept under a quota by deleting the oldest samples.
+
+    Behind a box filter, boxes under its threshold are already class -1,
+    so the borderline window has to start at that threshold. Track
+    dropouts need tracker object ids; without a tracker after pgie they
+    never fire.
+    """
+
+    def __init__(self, out_dir="output/hard_examples", borderline=(0.4, 0.6), min_track_frames=5,
+                 count_jump=2.0, count_alpha=0.1, min_interval=10.0, workers=2, max_pending=8,
+                 quota_bytes=2 * 1024**3, jpeg_quality=95):
+        self.out_dir = out_dir
+        self.borderline = borderline
+        self.min_track_frames = min_track_frames
+        self.count_jump = count_jump
+        self.count_alpha = count_alpha
+        self.min_interval = min_interval
+        self.max_pending = max_pending
+        self.quota_bytes = quota_bytes
+        self.jpeg_quality = jpeg_quality
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="hard-example")
+        self.sources = {}
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.counts = {"frames": 0, "qualified": 0, "rate_limited": 0, "dropped": 0, "saved": 0, "evicted": 0}
+        self.reasons = {}
+        # Sample name -> (paths, bytes), oldest first
+        self.samples = OrderedDict()
+        self.bytes = 0
+        os.makedirs(out_dir, exist_ok=True)
+        self._load_existing()
+
+    def _load_existing(self):
+        """Count samples left by earlier runs against the quota, oldest first"""
+        groups = {}
+        for entry in os.scandir(self.out_dir):
+            if entry.is_file():
+                name = os.path.splitext(entry.name)[0]
+                stat = entry.stat()
+                paths, size, mtime = groups.get(name, ([], 0, stat.st_mtime))
+                paths.append(entry.path)
+                groups[name] = (paths, size + stat.st_size, min(mtime, stat.st_mtime))
+        for name, (paths, size, mtime) in sorted(groups.items(), key=lambda item: item[1][2]):
+            self.samples[name] = (paths, size)
+            self.bytes += size
+        self._evict()
+
+    def qualify(self, source_id, detections, now):
+        """Reasons to keep this frame of (object_id, left, top, width, height, confidence) detections
+
+        Updates the per-source track and count state, so call it for every frame.
+        """
+        state = self.sources.get(source_id)
+        if state is None:
+            state = self.sources[source_id] = SourceState()
+        self.counts["frames"] += 1
+        reasons = []
+
+        low, high = self.borderline
+        if any(low <= detection[5] < high for detection in detections):
+            reasons.append("borderline")
+
+        tracks = {}
+        for detection in detections:
+            object_id = detection[0]
+            if object_id != UNTRACKED_OBJECT_ID:
+                tracks[object_id] = state.tracks.get(object_id, 0) + 1
+        if any(seen >= self.min_track_frames and object_id not in tracks
+               for object_id, seen in state.tracks.items()):
+            reasons.append("track_dropout")
+        state.tracks = tracks
+
+        count = len(detections)
+        if state.count_average is None:
+            state.count_average = float(count)
+        elif abs(count - state.count_average) >= self.count_jump:
+            reasons.append("count_change")
+        state.count_average += self.count_alpha * (count - state.count_average)
+
+        if not reasons:
+            return reasons
+        self.counts["qualified"] += 1
+        for reason in reasons:
+            self.reasons[reason] = self.reasons.get(reason, 0) + 1
+        if state.last_saved is not None and now - state.last_saved < self.min_interval:
+            self.counts["rate_limited"] += 1
+            return []
+        with self.lock:
+            if self.pending >= self.max_pending:
+                # Never make the streaming thread wait on the disk
+                self.counts["dropped"] += 1
+                return []
+            self.pending += 1
+        state.last_saved = now
+        return reasons
+
+    def submit(self, frame, source_id, frame_num, detections, reasons, rgba=False):
+        """Hand a qualifying frame to the writers; only call after qualify() returned reasons"""
+        # Copy now: the frame surface is recycled once the probe returns
+        frame = np.array(frame, copy=True)
+        record = {
+            "source_id": source_id,
+            "frame_num": frame_num,
+            "time": time.time(),
+            "reasons": reasons,
+            "detections": [{"object_id": None if d[0] == UNTRACKED_OBJECT_ID else d[0],
+                            "left": d[1], "top": d[2], "width": d[3], "height": d[4], "confidence": d[5]}
+                           for d in detections],
+        }
+        self.executor.submit(self._write, f"src{source_id}_{frame_num:08d}_{int(time.time() * 1000)}",
+                             frame, record, rgba)
+
+    def _write(self, name, frame, record, rgba):
+        paths = [os.path.join(self.out_dir, name + ".jpg"), os.path.join(self.out_dir, name + ".json")]
+        try:
+            record["height"], record["width"] = frame.shape[:2]
+            if rgba:
+                frame = cv2.cvtColor(frame, cv2.COLOR_RGBA2BGR)
+            ok, encoded = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+            if not ok:
+                return
+            metadata = json.dumps(record).encode()
+            for path, data in zip(paths, (encoded.tobytes(), metadata)):
+                with open(path, 'wb') as f:
+                    f.write(data)
+            with self.lock:
+                self.samples[name] = (paths, len(encoded) + len(metadata))
+                self.bytes += len(encoded) + len(metadata)
+                self.counts["saved"] += 1
+            self._evict()
+        except Exception as e:
+            print(f"Unable to save hard example {name}: {e}")
+        finally:
+            with self.lock:
+                self.pending -= 1
+
+    def _evict(self):
+        stale = []
+        with self.lock:
+            while self.bytes > self.quota_bytes and len(self.samples) > 1:
+                paths, size = self.samples.popitem(last=False)[1]
+                self.bytes -= size
+                self.counts["evicted"] += 1
+                stale.extend(paths)
+        for path in stale:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def sample_probe(self, pad, info, u_data):
+        """Buffer probe on an RGBA NVMM pad before drawing (osd sink pad)"""
+        gst_buffer = info.get_buffer()
+        if not gst_buffer:
+            return Gst.PadProbeReturn.OK
+
+        now = time.monotonic()
+        backend = backend_for(pyds)
+        batch_meta = backend.batch_meta(gst_buffer)
+        for frame_meta in iter_frames(batch_meta, backend):
+            detections = []
+            for obj_meta in iter_objects(frame_meta, backend, PGIE_CLASS_ID_FACE):
+                rect = obj_meta.rect_params
+                detections.append((obj_meta.object_id, rect.left, rect.top, rect.width, rect.height,
+                                   obj_meta.confidence))
+            reasons = self.qualify(frame_meta.source_id, detections, now)
+            if not reasons:
+                continue
+            mapped = False
+            try:
+                frame = pyds.get_nvds_buf_surface(hash(gst_buffer), frame_meta.batch_id)
+                mapped = True
+                self.submit(frame, frame_meta.source_id, frame_meta.frame_num, detections, reasons, rgba=True)
+            except Exception as e:
+                # qualify() reserved a writer slot that no write will release
+                with self.lock:
+                    self.pending -= 1
+                    self.counts["dropped"] += 1
+                print(f"Unable to sample frame {frame_meta.frame_num} of source {frame_meta.source_id}: {e}")
+            finally:
+                if IS_AARCH64 and mapped:
+                    pyds.unmap_nvds_buf_surface(hash(gst_buffer), frame_meta.batch_id)
+
+        return Gst.PadProbeReturn.OK
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counts, pending=self.pending, bytes=self.bytes, samples=len(self.samples),
+                        reasons=dict(self.reasons))
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+
+def benchmark(num_frames=3000, sources=4, width=1920, height=1080):
+    """Per-frame cost when nothing qualifies, and a run with hard cases under a small quota"""
+    # Smooth gradients compress like a camera frame; random noise would not
+    ramp = np.linspace(0, 255, width, dtype=np.uint8)
+    frame = np.dstack([np.tile(ramp, (height, 1))] * 3 + [np.full((height, width), 255, np.uint8)])
+    out_dir = tempfile.mkdtemp(prefix="hard-examples-")
+    try:
+        sampler = HardExampleSampler(out_dir, min_interval=5.0, max_pending=32, quota_bytes=1024**2)
+        # Three stable, confident tracks per source: nothing qualifies
+        steady = [(object_id, 100.0 * object_id, 200.0, 120.0, 150.0, 0.9) for object_id in range(3)]
+        start = time.perf_counter()
+        for frame_num in range(num_frames):
+            sampler.qualify(frame_num % sources, steady, frame_num / 30.0)
+        idle_us = (time.perf_counter() - start) / num_frames * 1e6
+
+        # Every 50th frame per source a track drops out, a face turns borderline or a crowd appears
+        start = time.perf_counter()
+        for frame_num in range(num_frames):
+            source_id = frame_num % sources
+            detections = list(steady)
+            case = frame_num // sources % 50
+            if case == 10:
+                detections.pop()
+            elif case == 20:
+                detections[0] = detections[0][:5] + (0.45,)
+            elif case == 30:
+                detections += [(10 + i, 50.0 * i, 600.0, 80.0, 100.0, 0.8) for i in range(4)]
+            reasons = sampler.qualify(source_id, detections, frame_num / 30.0)
+            if reasons:
+                sampler.submit(frame, source_id, frame_num, detections, reasons, rgba=True)
+        submitted = time.perf_counter() - start
+        sampler.close()
+        stats = sampler.stats()
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+
+    print(f"Nothing qualifying: {idle_us:.1f} us/frame (metadata only, no surface access)")
+    print(f"Hard cases: {stats['qualified']} qualified {stats['reasons']}, {stats['saved']} saved, "
+          f"{stats['dropped']} dropped with the writers busy, {submitted:.2f}s on the streaming thread")
+    print(f"Quota 1 MiB: {stats['samples']} samples kept ({stats['bytes'] / 1024**2:.1f} MiB), "
+          f"{stats['evicted']} evicted oldest-first")
+    return stats
+
+
+def main():
+    benchmark()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
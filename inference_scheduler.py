@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+
+import sys
+import time
+import gi
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst
+
+try:
+    import pyds
+except ImportError:
+    pyds = None
+
+from batch_meta_iter import backend_for, iter_frames, iter_objects
+
+PGIE_CLASS_ID_FACE = 0
+
+
+class ScheduledSource:
+    __slots__ = ("source_id", "priority", "fps", "min_fps", "last_arrival", "activity", "activity_at",
+                 "boost_until", "credit", "inferred", "skipped")
+
+    def __init__(self, source_id, priority, fps, min_fps):
+        self.source_id = source_id
+        self.priority = priority
+        self.fps = fps
+        self.min_fps = min_fps
+        self.last_arrival = None
+        self.activity = 0.0
+        self.activity_at = None
+        self.boost_until = None
+        # Fraction of an inference earned so far; a frame is inferred whenever it reaches 1
+        self.credit = 0.0
+        self.inferred = 0
+        self.skipped = 0
+
+
+class InferenceScheduler:
+    """Splits a global inference budget (frames/s) across sources by priority and recent activity
+
+    Decisions depend only on the timestamps passed in, so a run can be
+    replayed exactly with simulated sources.
+    """
+
+    def __init__(self, budget_fps, boost_seconds=5.0, boost_factor=4.0, activity_gain=1.0,
+                 activity_half_life=10.0, min_fps=1.0, rebalance_seconds=0.5):
+        self.budget_fps = budget_fps
+        self.boost_seconds = boost_seconds
+        self.boost_factor = boost_factor
+        self.activity_gain = activity_gain
+        self.activity_half_life = activity_half_life
+        self.min_fps = min_fps
+        self.rebalance_seconds = rebalance_seconds
+        self.sources = {}
+        self.allocation = {}
+        self.allocated_at = None
+
+    def add_source(self, source_id, priority=1.0, fps=30.0, min_fps=None):
+        self.sources[source_id] = ScheduledSource(source_id, priority, fps,
+                                                  self.min_fps if min_fps is None else min_fps)
+        self.allocated_at = None
+
+    def set_priority(self, source_id, priority):
+        self.sources[source_id].priority = priority
+        self.allocated_at = None
+
+    def _activity(self, source, now):
+        if source.activity_at is None:
+            return 0.0
+        return source.activity * 0.5 ** ((now - source.activity_at) / self.activity_half_life)
+
+    def weight(self, source, now):
+        weight = source.priority * (1.0 + self.activity_gain * self._activity(source, now))
+        if source.boost_until is not None and now < source.boost_until:
+            weight *= self.boost_factor
+        return weight
+
+    def allocate(self, now):
+        """{source_id: inference fps}: floors first, then the rest by weight, never above a source's fps"""
+        sources = sorted(self.sources.values(), key=lambda s: s.source_id)
+        floors = {s.source_id: min(s.min_fps, s.fps) for s in sources}
+        floor_total = sum(floors.values())
+        if floor_total >= self.budget_fps:
+            scale = self.budget_fps / floor_total if floor_total else 0.0
+            return {source_id: floor * scale for source_id, floor in floors.items()}
+
+        allocation = dict(floors)
+        remaining = self.budget_fps - floor_total
+        pending = [s for s in sources if s.fps > floors[s.source_id]]
+        weights = {s.source_id: self.weight(s, now) for s in pending}
+        # Water-filling: sources that would exceed their frame rate are capped and the excess
+        # goes round again to the others
+        while pending and remaining > 1e-9:
+            total = sum(weights[s.source_id] for s in pending)
+            if total <= 0:
+                break
+            capped = [s for s in pending
+                      if allocation[s.source_id] + remaining * weights[s.source_id] / total >= s.fps]
+            if not capped:
+                for s in pending:
+                    allocation[s.source_id] += remaining * weights[s.source_id] / total
+                remaining = 0.0
+                break
+            for s in capped:
+                remaining -= s.fps - allocation[s.source_id]
+                allocation[s.source_id] = s.fps
+                pending.remove(s)
+        return allocation
+
+    def _rebalance(self, now):
+        if self.allocated_at is None or now - self.allocated_at >= self.rebalance_seconds:
+            self.allocation = self.allocate(now)
+            self.allocated_at = now
+
+    def should_infer(self, source_id, now):
+        """Call once per arriving frame; True when this frame should go through inference"""
+        source = self.sources[source_id]
+        if source.last_arrival is not None and now > source.last_arrival:
+            # Track the real frame rate so the cap and the per-frame credit stay right
+            source.fps = 0.9 * source.fps + 0.1 / (now - source.last_arrival)
+        source.last_arrival = now
+        self._rebalance(now)
+
+        share = self.allocation.get(source_id, 0.0)
+        source.credit = min(source.credit + share / source.fps, 1.0 + share / source.fps)
+        if source.credit >= 1.0:
+            source.credit -= 1.0
+            source.inferred += 1
+            return True
+        source.skipped += 1
+        return False
+
+    def report_detections(self, source_id, now, faces):
+        """Feed back detections from an inferred frame: updates activity and boosts on faces"""
+        source = self.sources[source_id]
+        decay = 0.0
+        if source.activity_at is not None:
+            decay = 0.5 ** ((now - source.activity_at) / self.activity_half_life)
+        source.activity = source.activity * decay + faces * (1.0 - decay)
+        source.activity_at = now
+        if faces:
+            boosted = source.boost_until is None or now >= source.boost_until
+            source.boost_until = now + self.boost_seconds
+            if boosted:
+                # Take effect on the next frame rather than at the next periodic rebalance
+                self.allocated_at = None
+
+    def schedule_probe(self, pad, info, source_id):
+        """Buffer probe on the pad feeding nvstreammux sink_<source_id>
+
+        nvinfer cannot skip single frames of one source, so skipped frames
+        are dropped before the muxer and never reach inference or display.
+        """
+        if self.should_infer(source_id, time.monotonic()):
+            return Gst.PadProbeReturn.OK
+        return Gst.PadProbeReturn.DROP
+
+    def detection_probe(self, pad, info, u_data):
+        """Buffer probe on the nvinfer src pad feeding face counts back per source"""
+        gst_buffer = info.get_buffer()
+        if not gst_buffer:
+            return Gst.PadProbeReturn.OK
+        now = time.monotonic()
+        backend = backend_for(pyds)
+        batch_meta = backend.batch_meta(gst_buffer)
+        for frame_meta in iter_frames(batch_meta, backend):
+            if frame_meta.source_id in self.sources:
+                faces = sum(1 for _ in iter_objects(frame_meta, backend, PGIE_CLASS_ID_FACE))
+                self.report_detections(frame_meta.source_id, now, faces)
+        return Gst.PadProbeReturn.OK
+
+    def stats(self):
+        return {source_id: {"inferred": s.inferred, "skipped": s.skipped,
+                            "allocated_fps": self.allocation.get(source_id, 0.0)}
+                for source_id, s in sorted(self.sources.items())}
+
+
+class SimulatedSource:
+    """Camera with a fixed frame rate whose scene has faces during the given (start, end) windows"""
+
+    def __init__(self, source_id, fps, priority=1.0, busy=(), faces=2):
+        self.source_id = source_id
+        self.fps = fps
+        self.priority = priority
+        self.busy = busy
+        self.faces = faces
+
+    def faces_at(self, t):
+        return self.faces if any(start <= t < end for start, end in self.busy) else 0
+
+
+def simulate(sources, budget_fps, duration=60.0, **scheduler_args):
+    """Run the scheduler over simulated sources; returns the scheduler and per-second inferred frames"""
+    scheduler = InferenceScheduler(budget_fps, **scheduler_args)
+    events = []
+    for source in sources:
+        scheduler.add_source(source.source_id, source.priority, source.fps)
+        frames = int(duration * source.fps)
+        events.extend((frame / source.fps, source.source_id) for frame in range(frames))
+    # Sorting by (time, source_id) makes the interleaving, and so every decision, deterministic
+    events.sort()
+    by_id = {source.source_id: source for source in sources}
+    timeline = {}
+    for t, source_id in events:
+        if scheduler.should_infer(source_id, t):
+            second = timeline.setdefault(int(t), {})
+            second[source_id] = second.get(source_id, 0) + 1
+            scheduler.report_detections(source_id, t, by_id[source_id].faces_at(t))
+    return scheduler, timeline
+
+
+def main():
+    sources = [
+        SimulatedSource("entrance", 30, priority=2.0, busy=[(0, 60)], faces=3),
+        SimulatedSource("lobby", 30, busy=[(20, 35)]),
+        SimulatedSource("storeroom", 15),
+        SimulatedSource("loading-dock", 30, priority=0.5, busy=[(40, 45)]),
+    ]
+    scheduler, timeline = simulate(sources, budget_fps=40, duration=60)
+    names = [source.source_id for source in sources]
+    print("Inferred frames per second (budget 40 fps):")
+    print("   t   " + " ".join(f"{name:>13}" for name in names))
+    for second in range(0, 60, 5):
+        counts = timeline.get(second, {})
+        print(f"   {second:>3} " + " ".join(f"{counts.get(name, 0):>13}" for name in names))
+    for name, stats in scheduler.stats().items():
+        print(f"{name}: inferred {stats['inferred']}, skipped {stats['skipped']}")
+    # Same inputs, same decisions
+    assert simulate(sources, budget_fps=40, duration=60)[1] == timeline
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+
+import sys
+import threading
+import gi
+gi.require_version('Gst', '1.0')
+from gi.repository import GObject, GLib, Gst
+
+from metrics import REGISTRY
+from thread_telemetry import read_rss
+
+BYTES_PER_PIXEL = {
+    "NV12": 1.5, "I420": 1.5, "YV12": 1.5, "NV21": 1.5,
+    "YUY2": 2, "UYVY": 2, "GRAY16_LE": 2,
+    "RGB": 3, "BGR": 3,
+    "RGBA": 4, "BGRA": 4, "RGBx": 4, "BGRx": 4, "xRGB": 4, "ARGB": 4,
+    "GRAY8": 1,
+}
+# Elements whose output buffer pool size is a property (nvstreammux, nvvideoconvert)
+POOL_PROPERTIES = ("buffer-pool-size", "output-buffers")
+QUEUE_LEAK_DOWNSTREAM = 2
+
+
+def parse_bytes(text):
+    """'512M', '2G', '800000' -> bytes"""
+    text = text.strip().upper().rstrip("B").rstrip("I")
+    units = {"K": 2**10, "M": 2**20, "G": 2**30}
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+
+def caps_frame_bytes(caps):
+    """Bytes of one raw video frame described by fixed caps; None for compressed or unfixed caps"""
+    if caps is None or caps.is_empty():
+        return None
+    structure = caps.get_structure(0)
+    if structure.get_name() != "video/x-raw":
+        return None
+    ok_width, width = structure.get_int("width")
+    ok_height, height = structure.get_int("height")
+    if not (ok_width and ok_height):
+        return None
+    # Unknown formats are costed as 32-bit so the budget errs on the safe side
+    return int(width * height * BYTES_PER_PIXEL.get(structure.get_string("format"), 4))
+
+
+def caps_is_nvmm(caps):
+    return caps is not None and not caps.is_empty() and caps.get_features(0).contains("memory:NVMM")
+
+
+class Stage:
+    """A queue (bounded by depth) or a buffer pool (sized by a property) with its per-buffer cost"""
+
+    def __init__(self, element, kind, pad, pool_property=None):
+        self.element = element
+        self.name = element.get_name()
+        self.kind = kind
+        self.pad = pad
+        self.pool_property = pool_property
+        self.wanted = element.get_property(pool_property) if pool_property else None
+        self.batch = 1
+        self.projected_bytes = None
+        self.actual_bytes = None
+        self.nvmm = False
+        self.depth = None
+        # Pools are allocated during negotiation; after that a new size only applies on renegotiation
+        self.applied_depth = None
+        self.peak_buffers = 0
+        self.overruns = 0
+
+    @property
+    def buffer_bytes(self):
+        frame = self.actual_bytes if self.actual_bytes is not None else self.projected_bytes
+        return None if frame is None else frame * self.batch
+
+
+class MemoryBudget:
+    """Splits a global byte budget across every queue and buffer pool in a pipeline
+
+    Per-buffer sizes come from caps: projected from the muxer resolution or
+    fixed caps before start, replaced by the negotiated caps as they arrive.
+    Queues are bounded in buffers, not just bytes, because an NVMM buffer
+    only reports the size of its surface descriptor; they leak the oldest
+    buffer when full, so falling behind costs frames instead of memory.
+    """
+
+    def __init__(self, budget_bytes, queue_depth=4, min_pool=2, registry=REGISTRY):
+        self.budget_bytes = budget_bytes
+        self.queue_depth = queue_depth
+        self.min_pool = min_pool
+        self.stages = []
+        self.nominal_caps = None
+        self.lock = threading.Lock()
+        self.replan_pending = False
+        self.timer_id = None
+        self.over_budget = False
+        self.stage_metric = registry.gauge("stage_memory_bytes", "Buffered bytes per queue or pool")
+        self.limit_metric = registry.gauge("stage_memory_limit_bytes", "Byte limit per queue or pool")
+
+    def attach(self, pipeline):
+        """Find queues and pools, size them from projected caps; call before PLAYING"""
+        muxer = None
+        elements = []
+        iterator = pipeline.iterate_recurse()
+        while True:
+            result, element = iterator.next()
+            if result == Gst.IteratorResult.RESYNC:
+                iterator.resync()
+                elements = []
+                continue
+            if result != Gst.IteratorResult.OK:
+                break
+            elements.append(element)
+
+        for element in elements:
+            factory = element.get_factory()
+            factory_name = factory.get_name() if factory is not None else ""
+            if factory_name == "nvstreammux" and muxer is None:
+                muxer = element
+            if factory_name in ("queue", "queue2"):
+                stage = Stage(element, "queue", element.get_static_pad("sink"))
+                element.connect("overrun", self.on_overrun, stage)
+            else:
+                pool_property = next((p for p in POOL_PROPERTIES if element.find_property(p) is not None), None)
+                if pool_property is None or element.get_static_pad("src") is None:
+                    continue
+                stage = Stage(element, "pool", element.get_static_pad("src"), pool_property)
+            stage.pad.add_probe(Gst.PadProbeType.EVENT_DOWNSTREAM, self.caps_probe, stage)
+            self.stages.append(stage)
+
+        batched = set()
+        if muxer is not None:
+            self.nominal_caps = Gst.Caps.from_string(
+                f"video/x-raw(memory:NVMM), format=NV12, width={muxer.get_property('width')}, "
+                f"height={muxer.get_property('height')}")
+            batched = self._downstream_of(muxer)
+        for stage in self.stages:
+            if stage.element in batched or stage.element is muxer:
+                stage.batch = muxer.get_property("batch-size")
+            caps = self._projected_caps(stage.pad)
+            stage.projected_bytes = caps_frame_bytes(caps)
+            stage.nvmm = caps_is_nvmm(caps)
+        self.apply()
+
+    @staticmethod
+    def _downstream_of(element):
+        seen = set()
+        pending = [element]
+        while pending:
+            current = pending.pop()
+            for pad in current.srcpads:
+                peer = pad.get_peer()
+                # Through ghost pads to the element that really receives the buffers
+                while isinstance(peer, Gst.GhostPad):
+                    peer = peer.get_target()
+                parent = peer.get_parent_element() if peer is not None else None
+                if parent is not None and parent not in seen:
+                    seen.add(parent)
+                    pending.append(parent)
+        return seen
+
+    def _projected_caps(self, pad):
+        caps = pad.query_caps(None)
+        # Only trust the query when the size is already pinned down; fixating a range picks its minimum
+        if caps is not None and caps_frame_bytes(caps) is not None:
+            return caps.fixate()
+        # Resolution not known before negotiation: assume what the muxer scales everything to
+        return self.nominal_caps
+
+    def plan(self):
+        """Depth per stage: every stage gets its minimum, the rest of the budget is shared pro rata"""
+        sized = [stage for stage in self.stages if stage.buffer_bytes]
+        minimum = {stage: 1 if stage.kind == "queue" else self.min_pool for stage in self.stages}
+        wanted = {stage: self.queue_depth if stage.kind == "queue" else max(stage.wanted, self.min_pool)
+                  for stage in self.stages}
+        fixed = sum(minimum[stage] * stage.buffer_bytes for stage in sized)
+        extra = sum((wanted[stage] - minimum[stage]) * stage.buffer_bytes for stage in sized)
+        available = self.budget_bytes - fixed
+        self.over_budget = available < 0
+        scale = 1.0 if extra <= available else max(0.0, available / extra)
+        for stage in self.stages:
+            if stage.buffer_bytes:
+                stage.depth = minimum[stage] + int((wanted[stage] - minimum[stage]) * scale)
+            else:
+                # Compressed or unknown caps: still bounded in buffers, just not costed
+                stage.depth = wanted[stage]
+        return {stage.name: stage.depth for stage in self.stages}
+
+    def apply(self):
+        with self.lock:
+            self.plan()
+            for stage in self.stages:
+                element = stage.element
+                if stage.kind == "queue":
+                    element.set_property("leaky", QUEUE_LEAK_DOWNSTREAM)
+                    element.set_property("max-size-time", 0)
+                    element.set_property("max-size-buffers", stage.depth)
+                    # System-memory sizes are real, so bound bytes too; NVMM buffers only count descriptors
+                    bytes_limit = 0 if stage.nvmm or not stage.buffer_bytes else stage.depth * stage.buffer_bytes
+                    element.set_property("max-size-bytes", bytes_limit)
+                    stage.applied_depth = stage.depth
+                elif element.get_state(0)[1] in (Gst.State.NULL, Gst.State.READY):
+                    element.set_property(stage.pool_property, stage.depth)
+                    stage.applied_depth = stage.depth
+                if stage.buffer_bytes and stage.applied_depth:
+                    self.limit_metric.set(stage.applied_depth * stage.buffer_bytes, stage=stage.name)
+        if self.over_budget:
+            print(f"⚠️  Memory budget {self.budget_bytes / 2**20:.0f} MiB is below the minimum the "
+                  f"pipeline needs ({self.projected_total() / 2**20:.0f} MiB)")
+
+    def caps_probe(self, pad, info, stage):
+        event = info.get_event()
+        if event is None or event.type != Gst.EventType.CAPS:
+            return Gst.PadProbeReturn.OK
+        caps = event.parse_caps()
+        frame_bytes = caps_frame_bytes(caps)
+        with self.lock:
+            changed = frame_bytes != stage.actual_bytes
+            stage.actual_bytes = frame_bytes
+            stage.nvmm = caps_is_nvmm(caps)
+            schedule = changed and not self.replan_pending
+            self.replan_pending = self.replan_pending or schedule
+        if schedule:
+            # Re-plan on the main loop, not on this streaming thread
+            GLib.idle_add(self._replan)
+        return Gst.PadProbeReturn.OK
+
+    def _replan(self):
+        with self.lock:
+            self.replan_pending = False
+        self.apply()
+        return False
+
+    def on_overrun(self, queue, stage):
+        with self.lock:
+            stage.overruns += 1
+
+    def poll(self):
+        """Track buffered bytes per stage; usable as a GLib timeout callback"""
+        for stage in self.stages:
+            if stage.kind == "queue":
+                level = stage.element.get_property("current-level-buffers")
+            else:
+                # A pool allocates all its buffers up front
+                level = stage.applied_depth or 0
+            stage.peak_buffers = max(stage.peak_buffers, level)
+            if stage.buffer_bytes:
+                self.stage_metric.set(level * stage.buffer_bytes, stage=stage.name)
+        return True
+
+    def start(self, interval_ms=500):
+        self.timer_id = GLib.timeout_add(interval_ms, self.poll)
+
+    def stop(self):
+        if self.timer_id is not None:
+            GLib.source_remove(self.timer_id)
+            self.timer_id = None
+        self.poll()
+
+    def projected_total(self):
+        return sum((stage.applied_depth or stage.depth or 0) * stage.buffer_bytes
+                   for stage in self.stages if stage.buffer_bytes)
+
+    def report(self):
+        def mib(value):
+            return f"{'-':>9}" if value is None else f"{value / 2**20:>9.1f}"
+
+        lines = [f"   {'stage':<28} {'kind':<5} {'buffer':>9} {'limit':>5} {'projected':>9} {'peak':>9} "
+                 f"{'dropped':>7}   (MiB)"]
+        for stage in self.stages:
+            size = stage.buffer_bytes
+            projected = None if size is None else (stage.applied_depth or 0) * size
+            peak = None if size is None else stage.peak_buffers * size
+            note = ""
+            if stage.kind == "pool" and stage.applied_depth != stage.depth:
+                note = f"  (pool already allocated; {stage.depth} applies on renegotiation)"
+            lines.append(f"   {stage.name:<28} {stage.kind:<5} {mib(size)} {stage.applied_depth or 0:>5} "
+                         f"{mib(projected)} {mib(peak)} {stage.overruns:>7}{note}")
+        lines.append(f"   budget {self.budget_bytes / 2**20:.0f} MiB, "
+                     f"projected {self.projected_total() / 2**20:.1f} MiB, process RSS {read_rss() / 2**20:.0f} MiB")
+        return "\n".join(lines)
+
+
+def main():
+    # Inference stand-in at 10 fps behind a 30 fps 1080p RGBA source: the queue fills and leaks
+    budget = parse_bytes(sys.argv[1]) if len(sys.argv) > 1 else parse_bytes("48M")
+    GObject.threads_init()
+    Gst.init(None)
+    pipeline = Gst.parse_launch(
+        "videotestsrc is-live=true ! video/x-raw,format=RGBA,width=1920,height=1080,framerate=30/1 ! "
+        "queue name=capture-queue ! identity name=inference sleep-time=100000 ! "
+        "videoscale ! video/x-raw,width=640,height=360 ! queue name=output-queue ! fakesink sync=false")
+    memory = MemoryBudget(budget, queue_depth=8)
+    memory.attach(pipeline)
+    loop = GLib.MainLoop()
+    pipeline.set_state(Gst.State.PLAYING)
+    memory.start()
+    GLib.timeout_add_seconds(5, loop.quit)
+    loop.run()
+    memory.stop()
+    pipeline.set_state(Gst.State.NULL)
+    print("Memory by stage:")
+    print(memory.report())
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+
+import sys
+import time
+import types
+import random
+import struct
+import argparse
+
+import gi
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst
+
+try:
+    import pyds
+except ImportError:
+    pyds = None
+
+from batch_meta_iter import backend_for, iter_frames, iter_objects
+
+MAGIC = b"DSMETA1\n"
+# Batch: arrival time (s since recording start), buffer pts (ns), frame count
+BATCH_STRUCT = struct.Struct("<dQH")
+# Frame: source_id, frame_num, buf_pts, source width, source height, object count
+FRAME_STRUCT = struct.Struct("<IIQHHH")
+# Object: class_id, object_id, confidence, left, top, width, height
+OBJECT_STRUCT = struct.Struct("<iQfffff")
+
+
+class ReplayRectParams:
+    __slots__ = ("left", "top", "width", "height", "border_width")
+
+    def __init__(self, left, top, width, height, border_width=3):
+        self.left = left
+        self.top = top
+        self.width = width
+        self.height = height
+        self.border_width = border_width
+
+
+class ReplayTextParams:
+    __slots__ = ("display_text",)
+
+    def __init__(self, display_text=""):
+        self.display_text = display_text
+
+
+class ReplayObjectMeta:
+    __slots__ = ("class_id", "object_id", "confidence", "rect_params", "text_params")
+
+    def __init__(self, class_id, object_id, confidence, rect_params):
+        self.class_id = class_id
+        self.object_id = object_id
+        self.confidence = confidence
+        self.rect_params = rect_params
+        self.text_params = ReplayTextParams()
+
+
+class ReplayFrameMeta:
+    __slots__ = ("source_id", "frame_num", "batch_id", "buf_pts", "source_frame_width",
+                 "source_frame_height", "num_obj_meta", "obj_meta_list")
+
+    def __init__(self, source_id, frame_num, batch_id, buf_pts, width, height, objects):
+        self.source_id = source_id
+        self.frame_num = frame_num
+        self.batch_id = batch_id
+        self.buf_pts = buf_pts
+        self.source_frame_width = width
+        self.source_frame_height = height
+        self.num_obj_meta = len(objects)
+        self.obj_meta_list = _linked(objects)
+
+
+class ReplayBatchMeta:
+    __slots__ = ("frame_meta_list", "num_frames_in_batch", "frames")
+
+    def __init__(self, frames):
+        self.frames = frames
+        self.num_frames_in_batch = len(frames)
+        self.frame_meta_list = _linked(frames)
+
+
+class _GList:
+    """Node with the same data/next shape as the pyds GList wrappers"""
+    __slots__ = ("data", "next")
+
+    def __init__(self, data, next):
+        self.data = data
+        self.next = next
+
+
+def _linked(items):
+    head = None
+    for item in reversed(items):
+        head = _GList(item, head)
+    return head
+
+
+class ReplayBuffer:
+    __slots__ = ("pts", "duration")
+
+    def __init__(self, pts):
+        self.pts = pts
+        self.duration = Gst.CLOCK_TIME_NONE
+
+
+class ReplayProbeInfo:
+    __slots__ = ("buffer",)
+
+    def __init__(self, buffer):
+        self.buffer = buffer
+
+    def get_buffer(self):
+        return self.buffer
+
+
+class _PassthroughCast:
+    @staticmethod
+    def cast(data):
+        return data
+
+
+def make_replay_pyds(surface_size=None):
+    """A pyds stand-in resolving replay buffers to their recorded batch metadata"""
+    module = types.ModuleType("pyds")
+    module.batches = {}
+    module.NvDsFrameMeta = _PassthroughCast
+    module.NvDsObjectMeta = _PassthroughCast
+    module.NVBUF_MEM_CUDA_UNIFIED = 3
+    module.gst_buffer_get_nvds_batch_meta = module.batches.__getitem__
+    surfaces = {}
+
+    def get_nvds_buf_surface(buffer_hash, batch_id):
+        # Blank RGBA surface sized like the recorded source, so crop/encode stages can run
+        frame = module.batches[buffer_hash].frames[batch_id]
+        size = surface_size or (frame.source_frame_height, frame.source_frame_width)
+        if size not in surfaces:
+            import numpy as np
+            surfaces[size] = np.zeros((size[0], size[1], 4), np.uint8)
+        return surfaces[size]
+
+    module.get_nvds_buf_surface = get_nvds_buf_surface
+    module.unmap_nvds_buf_surface = lambda buffer_hash, batch_id: None
+    return module
+
+
+class MetadataRecorder:
+    """Buffer probe writing per-batch object metadata to a compact binary file"""
+
+    def __init__(self, path):
+        self.file = open(path, 'wb', buffering=1024 * 1024)
+        self.file.write(MAGIC)
+        self.start = None
+        self.batches = 0
+
+    def record_probe(self, pad, info, u_data):
+        gst_buffer = info.get_buffer()
+        if not gst_buffer:
+            return Gst.PadProbeReturn.OK
+
+        now = time.monotonic()
+        if self.start is None:
+            self.start = now
+        batch_meta = pyds.gst_buffer_get_nvds_batch_meta(hash(gst_buffer))
+        self.write_batch(now - self.start, gst_buffer.pts, batch_meta, pyds)
+        return Gst.PadProbeReturn.OK
+
+    def write_batch(self, arrival, pts, batch_meta, meta_module):
+        backend = backend_for(meta_module)
+        pack_object = OBJECT_STRUCT.pack
+        frames = []
+        for frame_meta in iter_frames(batch_meta, backend):
+            objects = []
+            for obj_meta in iter_objects(frame_meta, backend):
+                rect = obj_meta.rect_params
+                objects.append(pack_object(obj_meta.class_id, obj_meta.object_id, obj_meta.confidence,
+                                           rect.left, rect.top, rect.width, rect.height))
+            frames.append(FRAME_STRUCT.pack(frame_meta.source_id, frame_meta.frame_num, frame_meta.buf_pts,
+                                            frame_meta.source_frame_width, frame_meta.source_frame_height,
+                                            len(objects)) + b"".join(objects))
+
+        self.file.write(BATCH_STRUCT.pack(arrival, pts, len(frames)))
+        self.file.write(b"".join(frames))
+        self.batches += 1
+
+    def close(self):
+        self.file.close()
+
+
+def read_batches(path):
+    """Yield (arrival, pts, ReplayBatchMeta) from a recording"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if not data.startswith(MAGIC):
+        raise ValueError(f"{path} is not a metadata recording")
+    offset = len(MAGIC)
+    while offset < len(data):
+        arrival, pts, num_frames = BATCH_STRUCT.unpack_from(data, offset)
+        offset += BATCH_STRUCT.size
+        frames = []
+        for batch_id in range(num_frames):
+            source_id, frame_num, buf_pts, width, height, num_objects = FRAME_STRUCT.unpack_from(data, offset)
+            offset += FRAME_STRUCT.size
+            objects = []
+            for _ in range(num_objects):
+                class_id, object_id, confidence, left, top, w, h = OBJECT_STRUCT.unpack_from(data, offset)
+                offset += OBJECT_STRUCT.size
+                objects.append(ReplayObjectMeta(class_id, object_id, confidence, ReplayRectParams(left, top, w, h)))
+            frames.append(ReplayFrameMeta(source_id, frame_num, batch_id, buf_pts, width, height, objects))
+        yield arrival, pts, ReplayBatchMeta(frames)
+
+
+class MetadataReplaySource:
+    """Feeds a recording through unmodified pad-probe callbacks at any speed"""
+
+    def __init__(self, path, speed=None):
+        self.path = path
+        self.speed = speed
+        self.pyds = make_replay_pyds()
+        self.batches = 0
+
+    def bind(self, *modules):
+        """Point the modules' pyds global at the replay stand-in"""
+        for module in modules:
+            module.pyds = self.pyds
+
+    def install(self):
+        """Register the stand-in as pyds for modules that import it unconditionally"""
+        sys.modules["pyds"] = self.pyds
+
+    def run(self, probes, u_data=0):
+        """Call every probe once per recorded batch; speed=None replays as fast as possible"""
+        start = time.monotonic()
+        for arrival, pts, batch_meta in read_batches(self.path):
+            if self.speed:
+                delay = arrival / self.speed - (time.monotonic() - start)
+                if delay > 0:
+                    time.sleep(delay)
+            buffer = ReplayBuffer(pts)
+            key = hash(buffer)
+            self.pyds.batches[key] = batch_meta
+            info = ReplayProbeInfo(buffer)
+            try:
+                for probe in probes:
+                    probe(None, info, u_data)
+            finally:
+                del self.pyds.batches[key]
+            self.batches += 1
+        return self.batches
+
+
+def synthesize(path, num_batches=1000, num_sources=4, faces_per_frame=5, fps=30, seed=0):
+    """Write a synthetic recording with drifting face tracks, for CI runs without a camera"""
+    rng = random.Random(seed)
+    recorder = MetadataRecorder(path)
+    replay_pyds = make_replay_pyds()
+    interval = 1.0 / fps
+    tracks = [[(rng.uniform(0, 1700), rng.uniform(0, 900), rng.uniform(40, 200)) for _ in range(faces_per_frame)]
+              for _ in range(num_sources)]
+    for batch in range(num_batches):
+        frames = []
+        for source_id in range(num_sources):
+            objects = []
+            for index, (x, y, size) in enumerate(tracks[source_id]):
+                x = min(1900 - size, max(0.0, x + rng.uniform(-4, 4)))
+                y = min(1060 - size, max(0.0, y + rng.uniform(-4, 4)))
+                tracks[source_id][index] = (x, y, size)
+                objects.append(ReplayObjectMeta(rng.choice((0, 0, 0, 2)), source_id * 1000 + index,
+                                                rng.uniform(0.2, 0.99), ReplayRectParams(x, y, size, size)))
+            pts = int(batch * interval * Gst.SECOND)
+            frames.append(ReplayFrameMeta(source_id, batch, source_id, pts, 1920, 1080, objects))
+        recorder.write_batch(batch * interval, int(batch * interval * Gst.SECOND), ReplayBatchMeta(frames),
+                             replay_pyds)
+    recorder.close()
+    return num_batches
+
+
+# Left half of a 1920x1080 frame and its vertical centre line, on every synthetic camera
+DEMO_ZONES = {source_id: {"zones": {"left": [[0, 0], [960, 0], [960, 1080], [0, 1080]]},
+                          "lines": {"centre": [[960, 0], [960, 1080]]}}
+              for source_id in range(4)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded DeepStream metadata through probe code")
+    parser.add_argument("recording", help="file written by MetadataRecorder")
+    parser.add_argument("--speed", type=float, default=None, help="replay speed multiple (default: unpaced)")
+    parser.add_argument("--synthesize", type=int, metavar="BATCHES", help="write a synthetic recording first")
+    parser.add_argument("--zones", help="zone/line JSON for zone_analytics (default: left half and a centre line)")
+    args = parser.parse_args()
+
+    if args.synthesize:
+        synthesize(args.recording, args.synthesize)
+        print(f"Wrote {args.synthesize} synthetic batches to {args.recording}")
+
+    # The probes face_detection_pipeline puts after nvinfer, bound to the replay stand-in
+    import box_filter
+    import face_count_store
+    import zone_analytics
+    source = MetadataReplaySource(args.recording, args.speed)
+    source.bind(box_filter, face_count_store, zone_analytics)
+    boxes = box_filter.BoxFilter(class_thresholds={0: 0.4})
+    face_counts = face_count_store.FaceCountStore()
+    zones = zone_analytics.ZoneAnalytics(zone_analytics.load_zones(args.zones) if args.zones else DEMO_ZONES)
+    counts = {"frames": 0, "objects": 0, "faces": 0}
+
+    def counting_probe(pad, info, u_data):
+        batch_meta = source.pyds.gst_buffer_get_nvds_batch_meta(hash(info.get_buffer()))
+        for frame_meta in batch_meta.frames:
+            counts["frames"] += 1
+            counts["objects"] += frame_meta.num_obj_meta
+            counts["faces"] += sum(1 for _ in iter_objects(frame_meta, class_ids=0))
+        return Gst.PadProbeReturn.OK
+
+    start = time.perf_counter()
+    batches = source.run([boxes.filter_probe, face_counts.count_probe, zones.analytics_probe, counting_probe])
+    elapsed = time.perf_counter() - start
+    print(f"Replayed {batches} batches, {counts['frames']} frames, {counts['objects']} objects "
+          f"in {elapsed:.2f}s ({batches / elapsed:.0f} batches/sec)")
+    stats = boxes.stats()
+    print(f"Box filter: {stats['boxes_in']} boxes in, {stats['boxes_out']} kept; "
+          f"{counts['faces']} faces left for the probes downstream")
+    now = time.time()
+    for source_id in sorted(face_counts.sources):
+        rows = face_counts.query(source_id, now - 60, now, now=now)
+        print(f"Face counts, camera {source_id}: {sum(row[1] for row in rows)} faces in the last minute")
+    print("Zone analytics:")
+    print(zones.report())
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
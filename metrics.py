@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_PORT = 9101
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    pairs = []
+    for key, value in labels:
+        value = value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{key}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def _key(labels):
+    # Label values are strings on the wire; normalising here keeps 0 and "0" the same series
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+class Metric:
+    """One named gauge or counter with a value per label set"""
+
+    def __init__(self, name, kind, help_text, lock):
+        self.name = name
+        self.kind = kind
+        self.help = help_text
+        self.values = {}
+        self.lock = lock
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[_key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = _key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels):
+        with self.lock:
+            return self.values.get(_key(labels), 0)
+
+    def clear(self):
+        with self.lock:
+            self.values.clear()
+
+    def replace(self, series):
+        """Swap in [(value, labels)] as the only label sets, e.g. to drop threads that exited
+
+        The new values are built before taking the lock, so a scrape sees
+        either the old set or the new one, never an empty metric.
+        """
+        values = {_key(labels): value for value, labels in series}
+        with self.lock:
+            self.values = values
+
+
+class MetricsRegistry:
+    """Process-wide gauges and counters, readable as a dict or Prometheus text over HTTP"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = {}
+        self.server = None
+
+    def _metric(self, name, kind, help_text):
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = Metric(name, kind, help_text, self.lock)
+            elif metric.kind != kind:
+                raise ValueError(f"Metric {name} already registered as a {metric.kind}")
+            return metric
+
+    def gauge(self, name, help_text=""):
+        return self._metric(name, "gauge", help_text)
+
+    def counter(self, name, help_text=""):
+        return self._metric(name, "counter", help_text)
+
+    def snapshot(self):
+        """{name: {labels tuple: value}} copy of every metric"""
+        with self.lock:
+            return {name: dict(metric.values) for name, metric in self.metrics.items()}
+
+    def render(self):
+        """Prometheus text exposition format"""
+        lines = []
+        with self.lock:
+            for name, metric in sorted(self.metrics.items()):
+                if metric.help:
+                    lines.append(f"# HELP {name} {metric.help}")
+                lines.append(f"# TYPE {name} {metric.kind}")
+                for labels, value in sorted(metric.values.items()):
+                    lines.append(f"{name}{_format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port=DEFAULT_PORT, host="127.0.0.1"):
+        """Serve /metrics from a daemon thread
+
+        There is no authentication, so the default binds to loopback only;
+        pass another host only behind something that controls access.
+        """
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self.server.serve_forever, name="metrics-http", daemon=True).start()
+        return self.server
+
+    def shutdown(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+
+REGISTRY = MetricsRegistry()
+
+
+def main():
+    frames = REGISTRY.counter("frames_total", "Frames processed")
+    frames.inc(30, source="0")
+    REGISTRY.gauge("fps", "Frames per second").set(29.97, source="0")
+    print(REGISTRY.render(), end="")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+
+import re
+import sys
+import configparser
+import gi
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst
+
+
+def read_model_input_size(config_path):
+    """(width, height) of the network input from an nvinfer config, or None"""
+    parser = configparser.ConfigParser(strict=False, interpolation=None)
+    try:
+        parser.read(config_path)
+    except configparser.Error:
+        return None
+    if not parser.has_section("property"):
+        return None
+    for key in ("infer-dims", "input-dims", "uff-input-dims"):
+        if parser.has_option("property", key):
+            # All three are channel;height;width[;order]
+            dims = [int(v) for v in re.split(r"[;,]", parser.get("property", key)) if v.strip().isdigit()]
+            if len(dims) >= 3:
+                return dims[2], dims[1]
+    return None
+
+
+def derive_muxer_resolution(source_size, model_size=None, cap_to_model=False):
+    """Muxer output size that never upscales the source
+
+    With cap_to_model the frame is also shrunk (keeping aspect ratio) to the
+    smallest size that still covers the network input, since nvinfer would
+    scale it down to that anyway.
+    """
+    width, height = source_size
+    if cap_to_model and model_size:
+        scale = max(model_size[0] / width, model_size[1] / height)
+        if scale < 1.0:
+            width, height = width * scale, height * scale
+    # nvstreammux wants even dimensions
+    return max(2, int(round(width / 2)) * 2), max(2, int(round(height / 2)) * 2)
+
+
+def resolution_ladder(base, steps=(1.0, 0.75, 0.5), minimum=(320, 180)):
+    """Working resolutions from full size downwards, dropping duplicates and sizes below minimum"""
+    ladder = []
+    for step in steps:
+        size = (max(2, int(base[0] * step / 2) * 2), max(2, int(base[1] * step / 2) * 2))
+        if size[0] < minimum[0] or size[1] < minimum[1]:
+            break
+        if size not in ladder:
+            ladder.append(size)
+    return ladder or [base]
+
+
+class MuxerResolutionMatcher:
+    """Sets nvstreammux width/height from the caps negotiated on its upstream pads
+
+    The muxer only reads width/height when it negotiates its output, so
+    caps arriving once it is streaming (a source restarted at another
+    size) are reported but not applied.
+    """
+
+    def __init__(self, streammux, config_path=None, cap_to_model=False, on_resolved=None):
+        self.streammux = streammux
+        self.model_size = read_model_input_size(config_path) if config_path else None
+        self.cap_to_model = cap_to_model
+        self.on_resolved = on_resolved
+        self.source_sizes = {}
+        self.framerate = None
+        self.resolution = None
+
+    def attach(self, pad, source_id=0):
+        """Watch CAPS events on the pad feeding muxer sink_<source_id>"""
+        pad.add_probe(Gst.PadProbeType.EVENT_DOWNSTREAM, self.caps_event_probe, source_id)
+
+    def caps_event_probe(self, pad, info, source_id):
+        event = info.get_event()
+        if event is None or event.type != Gst.EventType.CAPS:
+            return Gst.PadProbeReturn.OK
+
+        structure = event.parse_caps().get_structure(0)
+        ok_width, width = structure.get_int("width")
+        ok_height, height = structure.get_int("height")
+        if not (ok_width and ok_height):
+            return Gst.PadProbeReturn.OK
+        ok_rate, num, den = structure.get_fraction("framerate")
+        if ok_rate and den and num:
+            self.framerate = max(self.framerate or 0.0, num / den)
+
+        self.source_sizes[source_id] = (width, height)
+        largest = max(self.source_sizes.values(), key=lambda size: size[0] * size[1])
+        resolution = derive_muxer_resolution(largest, self.model_size, self.cap_to_model)
+        if resolution != self.resolution and self.resolution is not None and self.streaming():
+            print(f"📐 Source {source_id} is now {width}x{height}; muxer stays at "
+                  f"{self.resolution[0]}x{self.resolution[1]} until the pipeline restarts")
+            return Gst.PadProbeReturn.OK
+        if resolution != self.resolution:
+            self.resolution = resolution
+            self.streammux.set_property("width", resolution[0])
+            self.streammux.set_property("height", resolution[1])
+            print(f"📐 Muxer resolution {resolution[0]}x{resolution[1]} "
+                  f"(source {largest[0]}x{largest[1]}, model input {self.model_size or 'unknown'})")
+            if self.on_resolved:
+                self.on_resolved(resolution, self.framerate)
+        return Gst.PadProbeReturn.OK
+
+    def streaming(self):
+        return self.streammux.get_static_pad("src").get_current_caps() is not None
+
+
+def scaled_caps(resolution):
+    return Gst.Caps.from_string(f"video/x-raw(memory:NVMM), width={resolution[0]}, height={resolution[1]}")
+
+
+class AdaptiveResolution:
+    """Steps the working resolution down the ladder under sustained overload and back up once load eases
+
+    The size is applied through the caps of a capsfilter after an
+    nvvideoconvert behind the muxer: changing them sends a reconfigure
+    upstream and the converter renegotiates on its next buffer, which
+    nvstreammux width/height on a running pipeline never does.
+
+    Throughput times pixel count estimates the pipeline's capacity in
+    pixels/second. A step up needs that estimate to carry the larger size
+    at expected fps plus `headroom`; otherwise a level that just failed is
+    retried only once the estimate is `capacity_seconds` old. A step up
+    that is overloaded again straight away doubles the wait before the next.
+    """
+
+    def __init__(self, capsfilter=None, ladder=None, overload_ratio=0.9, recover_ratio=0.98, headroom=0.1,
+                 overload_seconds=3.0, recover_seconds=10.0, max_recover_seconds=300.0, capacity_seconds=60.0):
+        self.capsfilter = capsfilter
+        self.ladder = ladder or []
+        self.overload_ratio = overload_ratio
+        self.recover_ratio = recover_ratio
+        self.headroom = headroom
+        self.overload_seconds = overload_seconds
+        self.base_recover_seconds = recover_seconds
+        self.recover_seconds = recover_seconds
+        self.max_recover_seconds = max_recover_seconds
+        self.capacity_seconds = capacity_seconds
+        self.level = 0
+        self.overloaded_since = None
+        self.healthy_since = None
+        self.last_step_up = None
+        self.last_update = None
+        # Pixels/second the pipeline sustained, and when that was measured below the expected fps
+        self.capacity = None
+        self.capacity_time = None
+        self.level_stats = {}
+        self.changes = []
+
+    def set_ladder(self, ladder):
+        self.ladder = ladder
+        self.level = 0
+        self.capacity = None
+
+    @property
+    def resolution(self):
+        return self.ladder[self.level] if self.ladder else None
+
+    def update(self, now, fps, expected_fps):
+        """Feed one throughput sample; returns the new resolution when it changed, else None"""
+        if self.last_update is not None and self.ladder:
+            stats = self.level_stats.setdefault(self.resolution, [0.0, 0.0])
+            elapsed = now - self.last_update
+            stats[0] += elapsed
+            stats[1] += fps * elapsed
+        self.last_update = now
+        if not self.ladder or not expected_fps:
+            return None
+
+        pixel_rate = fps * self.resolution[0] * self.resolution[1]
+        if fps < expected_fps * self.recover_ratio:
+            # Below the source rate the throughput is the capacity
+            self.capacity, self.capacity_time = pixel_rate, now
+        elif self.capacity is not None:
+            # At the source rate it is only a lower bound
+            self.capacity = max(self.capacity, pixel_rate)
+
+        if fps < expected_fps * self.overload_ratio:
+            self.healthy_since = None
+            if self.overloaded_since is None:
+                self.overloaded_since = now
+                # Overloaded again soon after stepping up: wait longer before the next attempt
+                if self.last_step_up is not None and now - self.last_step_up < self.recover_seconds:
+                    self.recover_seconds = min(self.recover_seconds * 2, self.max_recover_seconds)
+            if now - self.overloaded_since >= self.overload_seconds and self.level < len(self.ladder) - 1:
+                return self._step(now, self.level + 1, fps)
+        elif fps >= expected_fps * self.recover_ratio and self.level > 0:
+            self.overloaded_since = None
+            if self.healthy_since is None:
+                self.healthy_since = now
+            if now - self.healthy_since >= self.recover_seconds and self._fits(now, self.level - 1, expected_fps):
+                self.last_step_up = now
+                return self._step(now, self.level - 1, fps)
+        else:
+            self.overloaded_since = None
+            self.healthy_since = None
+            if self.last_step_up is not None and now - self.last_step_up >= self.recover_seconds:
+                self.recover_seconds = self.base_recover_seconds
+        return None
+
+    def _fits(self, now, level, expected_fps):
+        """Whether the capacity estimate carries `level` with headroom, or is too old to say"""
+        if self.capacity is None or now - self.capacity_time >= self.capacity_seconds:
+            return True
+        width, height = self.ladder[level]
+        return self.capacity / (width * height) >= expected_fps * (1.0 + self.headroom)
+
+    def _step(self, now, level, fps):
+        previous = self.resolution
+        self.level = level
+        self.overloaded_since = None
+        self.healthy_since = None
+        resolution = self.resolution
+        self.changes.append((now, previous, resolution, fps))
+        if self.capsfilter is not None:
+            self.capsfilter.set_property("caps", scaled_caps(resolution))
+        print(f"📐 Working resolution {previous[0]}x{previous[1]} -> {resolution[0]}x{resolution[1]} "
+              f"at {fps:.1f} fps")
+        return resolution
+
+    def report(self):
+        """Seconds spent and mean throughput at each working resolution"""
+        lines = []
+        for resolution in self.ladder:
+            seconds, frames = self.level_stats.get(resolution, (0.0, 0.0))
+            if seconds > 0:
+                lines.append(f"   {resolution[0]}x{resolution[1]}: {seconds:.0f}s at {frames / seconds:.1f} fps")
+        return "\n".join(lines)
+
+
+def simulate(duration=120.0, expected_fps=30.0):
+    """Simulated load: throughput scales with pixel count and capacity dips mid-run"""
+    adaptive = AdaptiveResolution(ladder=resolution_ladder((1920, 1080)))
+    for second in range(int(duration)):
+        capacity = 25e6 if 30 <= second < 70 else 80e6  # pixels/sec the pipeline can process
+        width, height = adaptive.resolution
+        fps = min(expected_fps, capacity / (width * height))
+        adaptive.update(float(second), fps, expected_fps)
+    print("Simulated run:")
+    print(adaptive.report())
+    return adaptive
+
+
+def main():
+    simulate()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
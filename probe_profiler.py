@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import time
+import functools
+import threading
+from collections import Counter
+import gi
+gi.require_version('Gst', '1.0')
+from gi.repository import GObject, GLib, Gst
+
+from display_branch import process_cpu_seconds
+
+
+def thread_comm(native_id):
+    try:
+        with open(f"/proc/self/task/{native_id}/comm") as f:
+            return f.read().strip()
+    except OSError:
+        return f"thread-{native_id}"
+
+
+class ProbeStats:
+    __slots__ = ("label", "calls", "wall_ns", "cpu_ns", "max_ns")
+
+    def __init__(self, label):
+        self.label = label
+        self.calls = 0
+        self.wall_ns = 0
+        self.cpu_ns = 0
+        self.max_ns = 0
+
+
+class ProbeProfiler:
+    """Times every pad-probe callback and samples the Python stacks of the threads running them
+
+    install() patches Gst.Pad.add_probe, so it has to run before the
+    pipeline's probes are added. Each probe pad is only ever called from
+    one streaming thread, so its counters are updated without a lock.
+    """
+
+    def __init__(self, sample_hz=97):
+        # Off the common frame rates, so sampling does not run in lockstep with the pipeline
+        self.sample_interval = 1.0 / sample_hz
+        self.stats = {}
+        self.threads = {}
+        self.stacks = Counter()
+        self.samples = 0
+        self.original_add_probe = None
+        self.started = None
+        self.elapsed = None
+        self.stop_event = threading.Event()
+        self.sampler = None
+
+    def install(self):
+        if self.original_add_probe is not None:
+            return
+        self.original_add_probe = original = Gst.Pad.add_probe
+        profiler = self
+
+        def add_probe(pad, mask, callback, *user_data):
+            return original(pad, mask, profiler.wrap(pad, callback), *user_data)
+
+        Gst.Pad.add_probe = add_probe
+
+    def uninstall(self):
+        if self.original_add_probe is not None:
+            Gst.Pad.add_probe = self.original_add_probe
+            self.original_add_probe = None
+
+    def wrap(self, pad, callback):
+        parent = pad.get_parent_element()
+        pad_name = f"{parent.get_name() if parent else '?'}:{pad.get_name()}"
+        name = getattr(callback, "__qualname__", repr(callback))
+        label = f"{name} @ {pad_name}"
+        stats = self.stats.setdefault(label, ProbeStats(label))
+        threads = self.threads
+
+        @functools.wraps(callback)
+        def timed(*args):
+            ident = threading.get_ident()
+            if ident not in threads:
+                threads[ident] = thread_comm(threading.get_native_id())
+            cpu = time.thread_time_ns()
+            start = time.perf_counter_ns()
+            try:
+                return callback(*args)
+            finally:
+                wall = time.perf_counter_ns() - start
+                stats.cpu_ns += time.thread_time_ns() - cpu
+                stats.wall_ns += wall
+                stats.calls += 1
+                if wall > stats.max_ns:
+                    stats.max_ns = wall
+
+        return timed
+
+    def _sample(self):
+        while not self.stop_event.wait(self.sample_interval):
+            frames = sys._current_frames()
+            self.samples += 1
+            for ident, comm in list(self.threads.items()):
+                frame = frames.get(ident)
+                if frame is None:
+                    # Not executing Python right now: in C, or waiting
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(comm)
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def start(self):
+        """Start the sampler and the measurement window; call once the pipeline is PLAYING"""
+        for stats in self.stats.values():
+            stats.calls = stats.wall_ns = stats.cpu_ns = stats.max_ns = 0
+        self.started = (time.monotonic(), process_cpu_seconds())
+        self.stop_event.clear()
+        self.sampler = threading.Thread(target=self._sample, name="probe-sampler", daemon=True)
+        self.sampler.start()
+
+    def stop(self):
+        if self.sampler is None:
+            return
+        self.stop_event.set()
+        self.sampler.join()
+        self.sampler = None
+        self.elapsed = (time.monotonic() - self.started[0], process_cpu_seconds() - self.started[1])
+
+    def collapsed(self):
+        """Brendan Gregg's collapsed-stack format, ready for flamegraph.pl or speedscope"""
+        return "".join(f"{stack} {count}\n" for stack, count in sorted(self.stacks.items()))
+
+    def cost_table(self):
+        wall, process_cpu = self.elapsed or (time.monotonic() - self.started[0],
+                                             process_cpu_seconds() - self.started[1])
+        lines = [f"Probe cost over {wall:.1f}s, process CPU {process_cpu:.2f}s, "
+                 f"{self.samples} stack samples",
+                 f"{'calls':>8} {'cpu ms':>9} {'wall ms':>9} {'mean µs':>9} {'max µs':>9} {'% proc':>7}  probe"]
+        probe_cpu = 0
+        for stats in sorted(self.stats.values(), key=lambda s: s.cpu_ns, reverse=True):
+            probe_cpu += stats.cpu_ns
+            mean = stats.wall_ns / stats.calls / 1e3 if stats.calls else 0.0
+            share = stats.cpu_ns / 1e9 / process_cpu * 100 if process_cpu > 0 else 0.0
+            lines.append(f"{stats.calls:>8} {stats.cpu_ns / 1e6:>9.1f} {stats.wall_ns / 1e6:>9.1f} "
+                         f"{mean:>9.1f} {stats.max_ns / 1e3:>9.1f} {share:>6.1f}%  {stats.label}")
+        if process_cpu > 0:
+            lines.append(f"All probes: {probe_cpu / 1e9 / process_cpu * 100:.1f}% of process CPU")
+        return "\n".join(lines)
+
+    def write(self, directory, pipeline=None):
+        """probes.folded, probe_costs.txt and, given the pipeline, pipeline.dot with negotiated caps
+
+        Call before the pipeline goes to NULL, while caps are still negotiated.
+        """
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, "probes.folded"), "w") as f:
+            f.write(self.collapsed())
+        with open(os.path.join(directory, "probe_costs.txt"), "w") as f:
+            f.write(self.cost_table() + "\n")
+        if pipeline is not None:
+            with open(os.path.join(directory, "pipeline.dot"), "w") as f:
+                f.write(Gst.debug_bin_to_dot_data(pipeline, Gst.DebugGraphDetails.ALL))
+        print(f"🔥 Probe profile written to {directory}/ (flamegraph.pl probes.folded > probes.svg)")
+
+
+def main():
+    # Two Python probes of very different cost on a CPU-only pipeline
+    profiler = ProbeProfiler()
+    profiler.install()
+    GObject.threads_init()
+    Gst.init(None)
+    pipeline = Gst.parse_launch(
+        "videotestsrc is-live=true ! video/x-raw,width=640,height=480,framerate=30/1 ! "
+        "identity name=inference ! queue ! fakesink name=sink sync=false")
+
+    def count_probe(pad, info, u_data):
+        return Gst.PadProbeReturn.OK
+
+    def checksum_probe(pad, info, u_data):
+        ok, mapinfo = info.get_buffer().map(Gst.MapFlags.READ)
+        if ok:
+            sum(mapinfo.data[::64])
+            info.get_buffer().unmap(mapinfo)
+        return Gst.PadProbeReturn.OK
+
+    pipeline.get_by_name("inference").get_static_pad("src").add_probe(Gst.PadProbeType.BUFFER, count_probe, 0)
+    pipeline.get_by_name("sink").get_static_pad("sink").add_probe(Gst.PadProbeType.BUFFER, checksum_probe, 0)
+
+    loop = GLib.MainLoop()
+    pipeline.set_state(Gst.State.PLAYING)
+    profiler.start()
+    GLib.timeout_add_seconds(5, loop.quit)
+    loop.run()
+    profiler.stop()
+    profiler.write("output/probe-profile", pipeline)
+    print(profiler.cost_table())
+    pipeline.set_state(Gst.State.NULL)
+    profiler.uninstall()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import threading
+
+import numpy as np
+import gi
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst
+
+try:
+    import pyds
+except ImportError:
+    pyds = None
+
+from face_crops import PGIE_CLASS_ID_FACE, UNTRACKED_OBJECT_ID
+from batch_meta_iter import backend_for, iter_frames, iter_objects
+
+# Jetson maps the NVMM surface for the CPU on each get_nvds_buf_surface and needs an explicit unmap
+IS_AARCH64 = os.uname().machine == 'aarch64'
+
+
+def result_label(result):
+    """(label, probability) of a model output; (label, probability) pairs pass through"""
+    if isinstance(result, tuple) and len(result) == 2:
+        return str(result[0]), float(result[1])
+    if isinstance(result, float):
+        return f"{result:.2f}", 1.0
+    return str(result), 1.0
+
+
+class ReinferencePolicy:
+    """Run on track start, then every K frames or when the box grows or quality improves"""
+
+    def __init__(self, interval_frames=30, min_size_gain=1.25, min_quality_gain=0.1):
+        self.interval_frames = interval_frames
+        self.min_size_gain = min_size_gain
+        self.min_quality_gain = min_quality_gain
+
+    def should_run(self, entry, frame_num, area, quality=None):
+        if entry is None:
+            return True
+        if self.interval_frames and frame_num - entry.frame_num >= self.interval_frames:
+            return True
+        if self.min_size_gain and area >= entry.area * self.min_size_gain:
+            return True
+        if (self.min_quality_gain and quality is not None and entry.quality is not None
+                and quality >= entry.quality + self.min_quality_gain):
+            return True
+        return False
+
+
+class TrackResult:
+    __slots__ = ("result", "frame_num", "area", "quality", "last_seen")
+
+    def __init__(self, result, frame_num, area, quality):
+        self.result = result
+        self.frame_num = frame_num
+        self.area = area
+        self.quality = quality
+        self.last_seen = frame_num
+
+
+class TrackResultCache:
+    """Secondary-model results keyed by (source_id, object_id), expired when a track goes stale"""
+
+    def __init__(self, max_age_frames=90):
+        self.max_age_frames = max_age_frames
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            return self.entries.get(key)
+
+    def put(self, key, entry):
+        with self.lock:
+            self.entries[key] = entry
+
+    def touch(self, key, frame_num):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                entry.last_seen = frame_num
+
+    def expire(self, source_id, frame_num):
+        with self.lock:
+            stale = [key for key, entry in self.entries.items()
+                     if key[0] == source_id and frame_num - entry.last_seen > self.max_age_frames]
+            for key in stale:
+                del self.entries[key]
+        return len(stale)
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class SecondaryInferenceStage:
+    """Runs a secondary model on face crops only when the re-inference policy asks for it
+
+    In the pipeline every face gets its result, fresh or cached, as
+    classifier meta (label from label_fn, component id unique_id), so
+    nvdsosd and downstream probes see it like an sgie's output.
+    on_results(source_id, frame_num, [(object_id, result)]) is called per
+    frame for consumers that want the raw outputs.
+    """
+
+    def __init__(self, model, policy=None, cache=None, unique_id=2, label_fn=result_label, on_results=None):
+        self.model = model
+        self.policy = policy if policy is not None else ReinferencePolicy()
+        self.cache = cache if cache is not None else TrackResultCache()
+        self.unique_id = unique_id
+        self.label_fn = label_fn
+        self.on_results = on_results
+        self.hits = 0
+        self.misses = 0
+        self.uncached = 0
+
+    def process_frame(self, source_id, frame_num, objects, get_frame):
+        """Results for (object_id, left, top, width, height, quality) objects, in the same order
+
+        A list rather than a dict by object id, as untracked faces all share
+        one id. get_frame is only called when at least one object needs
+        inference, so frames where every track hits the cache never touch
+        the surface.
+        """
+        results = [None] * len(objects)
+        pending = []
+        for index, (object_id, left, top, width, height, quality) in enumerate(objects):
+            area = width * height
+            if object_id == UNTRACKED_OBJECT_ID:
+                self.uncached += 1
+                pending.append((None, index, left, top, width, height, area, quality))
+                continue
+            key = (source_id, object_id)
+            entry = self.cache.get(key)
+            if self.policy.should_run(entry, frame_num, area, quality):
+                self.misses += 1
+                pending.append((key, index, left, top, width, height, area, quality))
+            else:
+                self.hits += 1
+                self.cache.touch(key, frame_num)
+                results[index] = entry.result
+
+        if pending:
+            frame = get_frame()
+            frame_h, frame_w = frame.shape[:2]
+            crops = []
+            for _, _, left, top, width, height, _, _ in pending:
+                x0 = max(0, int(left))
+                y0 = max(0, int(top))
+                x1 = min(frame_w, int(left + width))
+                y1 = min(frame_h, int(top + height))
+                crops.append(frame[y0:y1, x0:x1])
+            # One batched call per frame instead of one call per face
+            outputs = self.model(crops)
+            for (key, index, _, _, _, _, area, quality), output in zip(pending, outputs):
+                if key is not None:
+                    self.cache.put(key, TrackResult(output, frame_num, area, quality))
+                results[index] = output
+
+        self.cache.expire(source_id, frame_num)
+        return results
+
+    def sgie_probe(self, pad, info, u_data):
+        """Buffer probe running the secondary model on faces from RGBA NVMM frames"""
+        gst_buffer = info.get_buffer()
+        if not gst_buffer:
+            return Gst.PadProbeReturn.OK
+
+        backend = backend_for(pyds)
+        batch_meta = backend.batch_meta(gst_buffer)
+        for frame_meta in iter_frames(batch_meta, backend):
+            obj_metas = []
+            objects = []
+            for obj_meta in iter_objects(frame_meta, backend, PGIE_CLASS_ID_FACE):
+                rect = obj_meta.rect_params
+                obj_metas.append(obj_meta)
+                objects.append((obj_meta.object_id, rect.left, rect.top, rect.width, rect.height,
+                                obj_meta.confidence))
+            if not objects:
+                continue
+
+            batch_id = frame_meta.batch_id
+            mapped = False
+
+            def get_frame():
+                nonlocal mapped
+                frame = pyds.get_nvds_buf_surface(hash(gst_buffer), batch_id)
+                mapped = True
+                return frame
+
+            try:
+                results = self.process_frame(frame_meta.source_id, frame_meta.frame_num, objects, get_frame)
+            finally:
+                if IS_AARCH64 and mapped:
+                    pyds.unmap_nvds_buf_surface(hash(gst_buffer), batch_id)
+            for obj_meta, result in zip(obj_metas, results):
+                self.attach_result(batch_meta, obj_meta, result)
+            if self.on_results:
+                self.on_results(frame_meta.source_id, frame_meta.frame_num,
+                                [(obj_meta.object_id, result) for obj_meta, result in zip(obj_metas, results)])
+
+        return Gst.PadProbeReturn.OK
+
+    def attach_result(self, batch_meta, obj_meta, result):
+        """Add a result to the object as classifier meta with a single label"""
+        label, probability = self.label_fn(result)
+        classifier_meta = pyds.nvds_acquire_classifier_meta_from_pool(batch_meta)
+        classifier_meta.unique_component_id = self.unique_id
+        label_info = pyds.nvds_acquire_label_info_meta_from_pool(batch_meta)
+        label_info.result_class_id = 0
+        label_info.result_label = label
+        label_info.result_prob = probability
+        pyds.nvds_add_label_info_meta_to_classifier(classifier_meta, label_info)
+        pyds.nvds_add_classifier_meta_to_object(obj_meta, classifier_meta)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "uncached": self.uncached,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "tracks": len(self.cache),
+        }
+
+
+class CountingModel:
+    """Stub CPU model returning mean crop intensity and recording how often it is called"""
+
+    def __init__(self):
+        self.calls = 0
+        self.items = 0
+
+    def __call__(self, crops):
+        self.calls += 1
+        self.items += len(crops)
+        return [float(crop.mean()) if crop.size else 0.0 for crop in crops]
+
+
+def main():
+    rng = np.random.default_rng(0)
+    frame = rng.integers(0, 255, size=(480, 640, 4), dtype=np.uint8)
+    model = CountingModel()
+    stage = SecondaryInferenceStage(model, ReinferencePolicy(interval_frames=30))
+    num_frames = 300
+    num_tracks = 8
+    for frame_num in range(num_frames):
+        objects = []
+        for track in range(num_tracks):
+            size = 40 + frame_num // 10
+            objects.append((track, 60 * track, 100, size, size, 0.5))
+        stage.process_frame(0, frame_num, objects, lambda: frame)
+
+    stats = stage.stats()
+    print(f"Faces seen: {num_frames * num_tracks}, model items: {model.items} in {model.calls} calls")
+    print(f"Cache hits: {stats['hits']}, misses: {stats['misses']} (hit rate {stats['hit_rate']:.1%})")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,10 +1,14 @@
 #!/usr/bin/env python3
 
+import os
 import sys
 import gi
 gi.require_version('Gst', '1.0')
 from gi.repository import GObject, Gst
 import signal
+from source_watchdog import SourceWatchdog, build_source_bin
+from display_branch import DisplayBranch
+from push_timeout_tuner import MuxerTimeoutControl
 
 class SimpleFaceDisplay:
     def __init__(self):
@@ -13,6 +17,9 @@ class SimpleFaceDisplay:
         self.pipeline = None
         self.loop = None
         self.frame_count = 0
+        self.watchdog = SourceWatchdog()
+        self.display = None
+        self.mux_timeout = None
         
     def create_pipeline(self):
         print("Creating simple face detection pipeline with display...")
@@ -53,48 +60,48 @@ class SimpleFaceDisplay:
         streammux.set_property("width", 640)
         streammux.set_property("height", 480)
         streammux.set_property("batch-size", 1)
-        streammux.set_property("batched-push-timeout", 4000000)
+        # Sets batched-push-timeout just above the measured batch fill time instead of a fixed 4 s
+        self.mux_timeout = MuxerTimeoutControl(streammux)
         
         pgie.set_property("config-file-path", 
             "/opt/nvidia/deepstream/deepstream/samples/configs/deepstream-app/config_infer_primary.txt")
         
         sink.set_property("sync", False)
         
+        # Source chain lives in its own bin so the watchdog can restart it alone
+        source_bin = build_source_bin("source-bin-0", [source, caps_filter, videoconvert1, nvvideoconvert, caps_nvmm])
+        if not source_bin:
+            return False
+        
         # Add elements to pipeline
-        elements = [source, caps_filter, videoconvert1, nvvideoconvert, caps_nvmm,
-                   streammux, pgie, nvvideoconvert2, nvosd, nvvideoconvert3, 
-                   caps_display, videoconvert2, sink]
+        elements = [source_bin, streammux, pgie]
         for element in elements:
             self.pipeline.add(element)
         
-        # Link elements
-        source.link(caps_filter)
-        caps_filter.link(videoconvert1)
-        videoconvert1.link(nvvideoconvert)
-        nvvideoconvert.link(caps_nvmm)
-        
         # Link to streammux
         sinkpad = streammux.get_request_pad("sink_0")
-        srcpad = caps_nvmm.get_static_pad("src")
+        srcpad = source_bin.get_static_pad("src")
         srcpad.link(sinkpad)
-        
-        # Link rest of pipeline
+        self.mux_timeout.watch_input(0, srcpad)
+        self.mux_timeout.attach()
+        self.watchdog.watch(0, source_bin)
+        
+        # Link rest of pipeline; OSD and window only run while a viewer is attached
+        # (SIGUSR1 attaches, SIGUSR2 detaches)
+        self.display = DisplayBranch(self.pipeline, [nvvideoconvert2, nvosd, nvvideoconvert3,
+                                                      caps_display, videoconvert2, sink],
+                                     attached=bool(os.environ.get("DISPLAY")))
         streammux.link(pgie)
-        pgie.link(nvvideoconvert2)
-        nvvideoconvert2.link(nvosd)
-        nvosd.link(nvvideoconvert3)
-        nvvideoconvert3.link(caps_display)
-        caps_display.link(videoconvert2)
-        videoconvert2.link(sink)
+        pgie.link(self.display.tee)
         
         # Add probe for detection info
-        osdsinkpad = nvosd.get_static_pad("sink")
-        osdsinkpad.add_probe(Gst.PadProbeType.BUFFER, self.osd_sink_pad_buffer_probe, 0)
+        pgiesrcpad = pgie.get_static_pad("src")
+        pgiesrcpad.add_probe(Gst.PadProbeType.BUFFER, self.pgie_src_pad_buffer_probe, 0)
         
         print("Pipeline created successfully")
         return True
         
-    def osd_sink_pad_buffer_probe(self, pad, info, u_data):
+    def pgie_src_pad_buffer_probe(self, pad, info, u_data):
         self.frame_count += 1
         if self.frame_count % 30 == 0:  # Print every 30 frames
             print(f"Processing frame {self.frame_count}")
@@ -117,6 +124,10 @@ class SimpleFaceDisplay:
             
         # Run main loop
         self.loop = GObject.MainLoop()
+        self.watchdog.start()
+        self.mux_timeout.start()
+        self.display.start()
+        self.display.toggle_on_signals()
         
         def signal_handler(sig, frame):
             print(f"\nStopping pipeline... Processed {self.frame_count} frames")
@@ -132,7 +143,17 @@ class SimpleFaceDisplay:
             print(f"\nKeyboard interrupt received. Processed {self.frame_count} frames")
         
         # Cleanup
+        self.mux_timeout.stop()
+        self.watchdog.stop()
+        display_report = self.display.report()
         self.pipeline.set_state(Gst.State.NULL)
+        print("CPU by display mode:")
+        print(display_report)
+        print("⏱️  Muxer batching:")
+        print(self.mux_timeout.report())
+        if self.watchdog.incidents:
+            print("Source incidents:")
+            print(self.watchdog.report())
         print("Pipeline stopped")
         return True
         
@@ -142,6 +163,9 @@ class SimpleFaceDisplay:
             print("End-of-stream")
             self.loop.quit()
         elif t == Gst.MessageType.ERROR:
+            # Errors inside a source bin restart that source only
+            if self.watchdog.handle_error(message) or self.display.handle_error(message):
+                return
             err, debug = message.parse_error()
             print(f"Error: {err}")
             if debug:
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import cv2
+import gi
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst
+
+try:
+    import pyds
+except ImportError:
+    pyds = None
+
+from batch_meta_iter import backend_for, iter_frames, iter_objects
+
+PGIE_CLASS_ID_FACE = 0
+DEFAULT_PORT = 8090
+# Jetson maps the NVMM surface for the CPU on each get_nvds_buf_surface and needs an explicit unmap
+IS_AARCH64 = os.uname().machine == 'aarch64'
+
+
+class SnapshotSlot:
+    """Latest frame of one source in two buffers: the probe fills the back one, readers use the front
+
+    A swap is a pointer exchange under the lock. Readers pin the front
+    buffer while encoding; if the back buffer is still pinned by a slow
+    reader the probe skips that frame rather than wait.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.encode_lock = threading.Lock()
+        self.buffers = [None, None]
+        self.pins = [0, 0]
+        self.front = 0
+        self.version = 0
+        self.captured_at = None
+        self.boxes = []
+        # (version, draw_boxes) -> JPEG bytes, only ever for the current version
+        self.encoded = {}
+        self.last_request = 0.0
+
+    def store(self, frame, boxes, now):
+        """Copy a frame into the back buffer and publish it; returns False when skipped"""
+        with self.lock:
+            back = 1 - self.front
+            if self.pins[back]:
+                return False
+        buffer = self.buffers[back]
+        if buffer is None or buffer.shape != frame.shape:
+            buffer = self.buffers[back] = np.empty_like(frame)
+        np.copyto(buffer, frame)
+        with self.lock:
+            self.front = back
+            self.version += 1
+            self.captured_at = now
+            self.boxes = boxes
+            self.encoded.clear()
+        return True
+
+    def jpeg(self, draw_boxes, quality):
+        """Encoded latest frame; concurrent callers for the same frame share one encode"""
+        self.last_request = time.monotonic()
+        with self.encode_lock:
+            with self.lock:
+                if self.version == 0:
+                    return None, None
+                version = self.version
+                cached = self.encoded.get((version, draw_boxes))
+                if cached is not None:
+                    return cached, self.captured_at
+                front = self.front
+                self.pins[front] += 1
+                frame = self.buffers[front]
+                boxes = self.boxes
+                captured_at = self.captured_at
+            try:
+                image = cv2.cvtColor(frame, cv2.COLOR_RGBA2BGR)
+            finally:
+                # The conversion made a private copy; the probe may reuse the buffer now
+                with self.lock:
+                    self.pins[front] -= 1
+            if draw_boxes:
+                for left, top, width, height, confidence in boxes:
+                    x0, y0 = int(left), int(top)
+                    cv2.rectangle(image, (x0, y0), (int(left + width), int(top + height)), (0, 255, 0), 2)
+                    cv2.putText(image, f"{confidence:.2f}", (x0, max(12, y0 - 4)),
+                                cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
+            ok, encoded = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+            if not ok:
+                return None, None
+            data = encoded.tobytes()
+            with self.lock:
+                # A newer frame may have arrived meanwhile; only cache if this is still current
+                if self.version == version:
+                    self.encoded[(version, draw_boxes)] = data
+            return data, captured_at
+
+
+class SnapshotService:
+    """Latest frame per source with JPEG encoding only on request, served over HTTP"""
+
+    def __init__(self, jpeg_quality=85, idle_fps=1.0, active_fps=15.0, active_seconds=10.0):
+        self.jpeg_quality = jpeg_quality
+        # Copying full frames costs memory bandwidth; copy often only while someone is looking
+        self.idle_interval = 1.0 / idle_fps
+        self.active_interval = 1.0 / active_fps
+        self.active_seconds = active_seconds
+        self.slots = {}
+        self.lock = threading.Lock()
+        self.stored = 0
+        self.skipped = 0
+        self.server = None
+
+    def slot(self, source_id):
+        with self.lock:
+            slot = self.slots.get(source_id)
+            if slot is None:
+                slot = self.slots[source_id] = SnapshotSlot()
+            return slot
+
+    def wants_frame(self, source_id, now):
+        slot = self.slot(source_id)
+        if slot.captured_at is None:
+            return True
+        active = now - slot.last_request < self.active_seconds
+        return now - slot.captured_at >= (self.active_interval if active else self.idle_interval)
+
+    def update(self, source_id, frame, boxes, now=None):
+        now = time.monotonic() if now is None else now
+        if self.slot(source_id).store(frame, boxes, now):
+            self.stored += 1
+        else:
+            self.skipped += 1
+
+    def snapshot(self, source_id, draw_boxes=False):
+        """(JPEG bytes, monotonic capture time) for the latest frame, or (None, None)"""
+        with self.lock:
+            slot = self.slots.get(source_id)
+        if slot is None:
+            return None, None
+        return slot.jpeg(draw_boxes, self.jpeg_quality)
+
+    def snapshot_probe(self, pad, info, u_data):
+        """Buffer probe on an RGBA NVMM pad (osd sink pad) keeping the latest frame per source"""
+        gst_buffer = info.get_buffer()
+        if not gst_buffer:
+            return Gst.PadProbeReturn.OK
+
+        now = time.monotonic()
+        backend = backend_for(pyds)
+        batch_meta = backend.batch_meta(gst_buffer)
+        for frame_meta in iter_frames(batch_meta, backend):
+            if not self.wants_frame(frame_meta.source_id, now):
+                continue
+            boxes = []
+            for obj_meta in iter_objects(frame_meta, backend, PGIE_CLASS_ID_FACE):
+                rect = obj_meta.rect_params
+                boxes.append((rect.left, rect.top, rect.width, rect.height, obj_meta.confidence))
+            frame = pyds.get_nvds_buf_surface(hash(gst_buffer), frame_meta.batch_id)
+            try:
+                self.update(frame_meta.source_id, frame, boxes, now)
+            finally:
+                if IS_AARCH64:
+                    pyds.unmap_nvds_buf_surface(hash(gst_buffer), frame_meta.batch_id)
+
+        return Gst.PadProbeReturn.OK
+
+    def serve(self, port=DEFAULT_PORT, host="127.0.0.1"):
+        """GET /snapshot/<source_id>.jpg[?boxes=1] and GET /snapshots, from a daemon thread
+
+        There is no authentication, so the default binds to loopback only;
+        pass another host only behind something that controls access.
+        """
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                if url.path == "/snapshots":
+                    now = time.monotonic()
+                    with service.lock:
+                        ages = {source_id: now - slot.captured_at
+                                for source_id, slot in service.slots.items() if slot.captured_at is not None}
+                    body = "".join(f"{source_id} {age:.2f}s\n" for source_id, age in sorted(ages.items())).encode()
+                    self._reply(200, "text/plain", body)
+                    return
+                if not (url.path.startswith("/snapshot/") and url.path.endswith(".jpg")):
+                    self.send_error(404)
+                    return
+                try:
+                    source_id = int(url.path[len("/snapshot/"):-len(".jpg")])
+                except ValueError:
+                    self.send_error(400, "source id must be an integer")
+                    return
+                draw_boxes = parse_qs(url.query).get("boxes", ["0"])[0] in ("1", "true", "yes")
+                data, captured_at = service.snapshot(source_id, draw_boxes)
+                if data is None:
+                    self.send_error(404, f"no frame yet for source {source_id}")
+                    return
+                self._reply(200, "image/jpeg", data,
+                            {"X-Frame-Age": f"{time.monotonic() - captured_at:.3f}", "Cache-Control": "no-store"})
+
+            def _reply(self, status, content_type, body, headers=None):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self.server.serve_forever, name="snapshot-http", daemon=True).start()
+        return self.server
+
+    def shutdown(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def stats(self):
+        return {"stored": self.stored, "skipped": self.skipped, "sources": len(self.slots)}
+
+
+def benchmark(requests=200, clients=16, width=1920, height=1080):
+    """Many concurrent requests for the same frame against one encode per frame"""
+    rng = np.random.default_rng(0)
+    frame = rng.integers(0, 255, size=(height, width, 4), dtype=np.uint8)
+    service = SnapshotService()
+    service.update(0, frame, [(100.0, 100.0, 200.0, 240.0, 0.9)])
+    encode_calls = []
+    original = cv2.imencode
+
+    def counting(*args, **kwargs):
+        encode_calls.append(1)
+        return original(*args, **kwargs)
+
+    cv2.imencode = counting
+    try:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=clients) as pool:
+            sizes = list(pool.map(lambda _: len(service.snapshot(0, draw_boxes=True)[0]), range(requests)))
+        elapsed = time.perf_counter() - start
+        # A new frame invalidates the cached JPEG: exactly one more encode
+        service.update(0, frame, [])
+        with ThreadPoolExecutor(max_workers=clients) as pool:
+            list(pool.map(lambda _: service.snapshot(0, draw_boxes=True), range(requests)))
+    finally:
+        cv2.imencode = original
+
+    copy_start = time.perf_counter()
+    for _ in range(30):
+        service.update(0, frame, [])
+    copy_ms = (time.perf_counter() - copy_start) / 30 * 1000
+    print(f"{requests} requests from {clients} clients in {elapsed * 1000:.0f} ms, "
+          f"{len(encode_calls)} JPEG encodes for 2 frames ({sizes[0] / 1024:.0f} KiB each)")
+    print(f"Frame store (copy into back buffer + swap): {copy_ms:.2f} ms per {width}x{height} frame")
+
+
+def main():
+    benchmark()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,371 @@
+#!/usr/bin/env python3
+
+import os
+import gc
+import sys
+import csv
+import time
+import argparse
+from collections import Counter
+import gi
+gi.require_version('Gst', '1.0')
+from gi.repository import GObject, GLib, Gst
+
+try:
+    import pyds
+except ImportError:
+    pyds = None
+
+from batch_meta_iter import backend_for
+from capacity_planner import DEFAULT_CONFIG, cpu_pipeline, gpu_pipeline, gpu_sources
+from thread_telemetry import read_rss
+
+# NvDsBatchMeta pools holding the DeepStream metadata attached to each batch
+META_POOLS = ("frame_meta_pool", "obj_meta_pool", "display_meta_pool", "user_meta_pool")
+
+
+def stages_pipeline(streams, width, height, fps, config_path):
+    """gpu_pipeline with face_detection_pipeline's post-inference chain: RGBA NVMM frames into nvdsosd"""
+    # get_nvds_buf_surface needs CUDA unified memory on dGPU
+    memory_type = "" if os.uname().machine == "aarch64" else " nvbuf-memory-type=3"
+    return (f"nvstreammux name=mux batch-size={streams} width={width} height={height} live-source=1 "
+            f"batched-push-timeout={int(1e6 / fps)} ! nvinfer name=infer config-file-path={config_path} "
+            f"batch-size={streams} ! nvvideoconvert{memory_type} ! video/x-raw(memory:NVMM),format=RGBA ! "
+            f"nvdsosd name=osd ! fakesink name=sink sync=false {gpu_sources(streams, width, height, fps)}")
+
+
+class ProbeStages:
+    """The probe stages of face_detection_pipeline, attached to a soak pipeline by element name
+
+    Box filter, face counts and webhook events go on the nvinfer src pad;
+    crops, hard examples and snapshots read RGBA frames on the osd sink
+    pad. Webhook events are delivered to a local stand-in and a snapshot
+    of every source is encoded on each sample, so those paths soak too.
+    """
+
+    def __init__(self, output_dir):
+        from box_filter import BoxFilter
+        from face_count_store import FaceCountStore
+        from face_crops import FaceCropStage, ThumbnailCache
+        from hard_examples import HardExampleSampler
+        from snapshot_service import SnapshotService
+        from webhook_delivery import StandInServer, WebhookDelivery
+
+        self.box_filter = BoxFilter(class_thresholds={0: 0.4})
+        self.face_counts = FaceCountStore(path=os.path.join(output_dir, "face_counts.npz"))
+        self.server = StandInServer()
+        self.webhook = WebhookDelivery(f"http://127.0.0.1:{self.server.port}/events",
+                                       spool_dir=os.path.join(output_dir, "webhook-spool"))
+        self.crops = FaceCropStage(cache=ThumbnailCache(spill_dir=os.path.join(output_dir, "crops")))
+        face_threshold = self.box_filter.class_thresholds.get(0, self.box_filter.default_threshold)
+        self.hard_examples = HardExampleSampler(out_dir=os.path.join(output_dir, "hard_examples"),
+                                                borderline=(face_threshold, 0.6))
+        self.snapshots = SnapshotService()
+        self.snapshots_encoded = 0
+
+    def attach(self, pipeline):
+        infer_pad = pipeline.get_by_name("infer").get_static_pad("src")
+        for probe in (self.box_filter.filter_probe, self.face_counts.count_probe, self.webhook.event_probe):
+            infer_pad.add_probe(Gst.PadProbeType.BUFFER, probe, 0)
+        osd_pad = pipeline.get_by_name("osd").get_static_pad("sink")
+        for probe in (self.crops.crop_probe, self.hard_examples.sample_probe, self.snapshots.snapshot_probe):
+            osd_pad.add_probe(Gst.PadProbeType.BUFFER, probe, 0)
+        self.face_counts.start_autosave(60)
+
+    def exercise(self):
+        """Encode the latest snapshot of every source, as a viewer polling them would"""
+        with self.snapshots.lock:
+            source_ids = list(self.snapshots.slots)
+        for source_id in source_ids:
+            data, _ = self.snapshots.snapshot(source_id, draw_boxes=True)
+            if data is not None:
+                self.snapshots_encoded += 1
+
+    def close(self):
+        self.crops.close()
+        self.hard_examples.close()
+        self.face_counts.stop()
+        self.webhook.close()
+        self.server.close()
+
+    def report(self):
+        box_filter = self.box_filter.stats()
+        crops = self.crops.stats()
+        hard = self.hard_examples.stats()
+        return "\n".join([
+            f"   box filter      {box_filter['boxes_out']} of {box_filter['boxes_in']} boxes kept",
+            f"   crops           {crops['encoded']} encoded, {crops['dropped']} dropped",
+            f"   hard examples   {hard['saved']} saved, {hard['dropped']} dropped, {hard['samples']} kept",
+            f"   snapshots       {self.snapshots.stats()['stored']} stored, {self.snapshots_encoded} encoded",
+            f"   webhook         {self.server.received} events received by the stand-in",
+        ])
+
+
+def enable_buffer_tracking():
+    """Count live GstBuffers with the leaks tracer; must run before Gst.init"""
+    os.environ.setdefault("GST_TRACERS", "leaks(filters=GstBuffer)")
+
+
+def leaks_tracer():
+    if not hasattr(Gst, "tracing_get_active_tracers"):
+        return None
+    for tracer in Gst.tracing_get_active_tracers():
+        if tracer.__gtype__.name == "GstLeaksTracer":
+            return tracer
+    return None
+
+
+def fit_slope(points):
+    """Least-squares slope and R² of [(x, y)]"""
+    n = len(points)
+    if n < 3:
+        return None, None
+    mean_x = sum(x for x, _ in points) / n
+    mean_y = sum(y for _, y in points) / n
+    sxx = sum((x - mean_x) ** 2 for x, _ in points)
+    sxy = sum((x - mean_x) * (y - mean_y) for x, y in points)
+    syy = sum((y - mean_y) ** 2 for _, y in points)
+    if sxx == 0:
+        return None, None
+    slope = sxy / sxx
+    r2 = sxy * sxy / (sxx * syy) if syy else 1.0
+    return slope, r2
+
+
+class SoakTest:
+    """Runs a pipeline for hours, sampling memory, live objects and throughput, then fits trends
+
+    Each series gets a least-squares slope per hour over the samples after
+    warm-up; the run fails when a slope is beyond its limit. Slopes are
+    only judged once they explain a fair part of the variance, so noise
+    around a flat line does not fail a run.
+    """
+
+    SERIES = ("rss_mb", "python_objects", "live_buffers", "meta_in_use", "fps")
+
+    def __init__(self, description, stages=None, hours=4.0, interval=60.0, warmup=300.0, min_r2=0.5,
+                 max_rss_mb_per_hour=5.0, max_objects_per_hour=2000.0, max_buffers_per_hour=10.0,
+                 max_meta_per_hour=10.0, max_fps_decay_pct_per_hour=1.0, output_dir="output/soak"):
+        self.description = description
+        self.stages = stages
+        self.duration = hours * 3600.0
+        self.interval = interval
+        self.warmup = warmup
+        self.min_r2 = min_r2
+        self.limits = {
+            "rss_mb": max_rss_mb_per_hour,
+            "python_objects": max_objects_per_hour,
+            "live_buffers": max_buffers_per_hour,
+            "meta_in_use": max_meta_per_hour,
+        }
+        self.max_fps_decay_pct_per_hour = max_fps_decay_pct_per_hour
+        self.output_dir = output_dir
+        self.pipeline = None
+        self.loop = None
+        self.tracer = None
+        self.frames = 0
+        self.meta_in_use = None
+        self.samples = []
+        self.started = None
+        self.last = None
+        self.baseline_types = None
+        self.error = None
+
+    def sink_probe(self, pad, info, u_data):
+        self.frames += 1
+        if pyds is not None and self.frames % 30 == 0:
+            gst_buffer = info.get_buffer()
+            batch_meta = backend_for(pyds).batch_meta(gst_buffer) if gst_buffer else None
+            if batch_meta is not None:
+                # Elements taken out of each meta pool and not yet returned
+                self.meta_in_use = sum(getattr(getattr(batch_meta, pool, None), "num_full_elements", 0) or 0
+                                       for pool in META_POOLS)
+        return Gst.PadProbeReturn.OK
+
+    def live_buffers(self):
+        if self.tracer is None:
+            return None
+        try:
+            info = self.tracer.emit("get-live-objects")
+            return len(info.get_value("live-objects-list"))
+        except (TypeError, AttributeError):
+            return None
+
+    def sample(self):
+        now = time.monotonic()
+        elapsed = now - self.started
+        fps = (self.frames - self.last[1]) / (now - self.last[0])
+        self.last = (now, self.frames)
+        gc.collect()
+        objects = gc.get_objects()
+        if self.baseline_types is None and elapsed >= self.warmup:
+            self.baseline_types = Counter(type(obj).__name__ for obj in objects)
+        row = {
+            "elapsed_s": round(elapsed, 1),
+            "rss_mb": read_rss() / 2**20,
+            "python_objects": len(objects),
+            "live_buffers": self.live_buffers(),
+            "meta_in_use": self.meta_in_use,
+            "fps": fps,
+        }
+        del objects
+        if self.stages:
+            self.stages.exercise()
+        self.samples.append(row)
+        print(f"⏱️  {elapsed / 3600:5.2f}h  rss {row['rss_mb']:7.1f} MiB  objects {row['python_objects']:>8}  "
+              f"buffers {row['live_buffers'] if row['live_buffers'] is not None else '-':>6}  fps {fps:6.1f}")
+        if elapsed >= self.duration:
+            self.loop.quit()
+            return False
+        return True
+
+    def on_message(self, bus, message):
+        if message.type == Gst.MessageType.ERROR:
+            err, debug = message.parse_error()
+            self.error = f"{message.src.get_name()}: {err}"
+            self.loop.quit()
+        elif message.type == Gst.MessageType.EOS:
+            self.error = "unexpected end of stream"
+            self.loop.quit()
+
+    def run(self):
+        self.pipeline = Gst.parse_launch(self.description)
+        self.pipeline.get_by_name("sink").get_static_pad("sink").add_probe(
+            Gst.PadProbeType.BUFFER, self.sink_probe, 0)
+        if self.stages:
+            self.stages.attach(self.pipeline)
+        self.tracer = leaks_tracer()
+        if self.tracer is None:
+            print("⚠️  leaks tracer not active: live GstBuffer counts unavailable")
+        bus = self.pipeline.get_bus()
+        bus.add_signal_watch()
+        bus.connect("message", self.on_message)
+
+        self.loop = GLib.MainLoop()
+        self.pipeline.set_state(Gst.State.PLAYING)
+        self.started = time.monotonic()
+        self.last = (self.started, 0)
+        GLib.timeout_add(int(self.interval * 1000), self.sample)
+        try:
+            self.loop.run()
+        except KeyboardInterrupt:
+            print("Interrupted: judging the samples so far")
+        self.pipeline.set_state(Gst.State.NULL)
+        bus.remove_signal_watch()
+        if self.stages:
+            self.stages.close()
+        self.write_samples()
+        return self.judge()
+
+    def steady_samples(self):
+        return [row for row in self.samples if row["elapsed_s"] >= self.warmup]
+
+    def trends(self):
+        """{series: (slope per hour, R²)} over the samples after warm-up"""
+        steady = self.steady_samples()
+        trends = {}
+        for series in self.SERIES:
+            points = [(row["elapsed_s"] / 3600.0, row[series]) for row in steady if row[series] is not None]
+            trends[series] = fit_slope(points)
+        return trends
+
+    def judge(self):
+        """(passed, report lines)"""
+        trends = self.trends()
+        failures = []
+        lines = []
+        if self.error:
+            failures.append(f"pipeline error: {self.error}")
+        for series, (slope, r2) in trends.items():
+            if slope is None:
+                lines.append(f"   {series:<15} not enough samples")
+                continue
+            if series == "fps":
+                steady = self.steady_samples()
+                mean_fps = sum(row["fps"] for row in steady) / len(steady)
+                change = slope / mean_fps * 100 if mean_fps else 0.0
+                limit = -self.max_fps_decay_pct_per_hour
+                verdict = change < limit and r2 >= self.min_r2
+                lines.append(f"   {series:<15} {change:+9.2f} %/h   (R² {r2:.2f}, limit {limit:+.2f} %/h)")
+            else:
+                limit = self.limits[series]
+                verdict = slope > limit and r2 >= self.min_r2
+                lines.append(f"   {series:<15} {slope:+9.2f} /h    (R² {r2:.2f}, limit {limit:+.2f} /h)")
+            if verdict:
+                failures.append(f"{series} trend beyond its limit")
+                lines[-1] += "  FAIL"
+
+        if self.baseline_types is not None:
+            growth = Counter(type(obj).__name__ for obj in gc.get_objects())
+            growth.subtract(self.baseline_types)
+            top = [(name, count) for name, count in growth.most_common(5) if count > 0]
+            if top:
+                lines.append("   Python types growing since warm-up: " +
+                             ", ".join(f"{name} +{count}" for name, count in top))
+        lines.extend(f"❌ {failure}" for failure in failures)
+        if not failures:
+            lines.append("✅ No leak or throughput drift beyond the limits")
+        return not failures, lines
+
+    def write_samples(self):
+        if not self.samples:
+            return
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = os.path.join(self.output_dir, "samples.csv")
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(self.samples[0]))
+            writer.writeheader()
+            writer.writerows(self.samples)
+        print(f"Samples written to {path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Soak a pipeline on synthetic sources and fail on leaks or drift")
+    parser.add_argument("--mode", choices=("cpu", "gpu", "stages"), default="cpu",
+                        help="stages: gpu with face_detection_pipeline's probe stages attached")
+    parser.add_argument("--streams", type=int, default=4)
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument("--hours", type=float, default=4.0)
+    parser.add_argument("--interval", type=float, default=60.0, help="seconds between samples")
+    parser.add_argument("--warmup", type=float, default=300.0, help="seconds ignored by the trend fit")
+    parser.add_argument("--max-rss-mb-per-hour", type=float, default=5.0)
+    parser.add_argument("--max-objects-per-hour", type=float, default=2000.0)
+    parser.add_argument("--max-buffers-per-hour", type=float, default=10.0)
+    parser.add_argument("--max-meta-per-hour", type=float, default=10.0)
+    parser.add_argument("--max-fps-decay-pct-per-hour", type=float, default=1.0)
+    parser.add_argument("--config", default=DEFAULT_CONFIG, help="gpu and stages modes: nvinfer config file")
+    parser.add_argument("-o", "--output-dir", default="output/soak")
+    args = parser.parse_args()
+    if args.mode == "stages" and pyds is None:
+        parser.error("--mode stages reads frames and metadata through pyds")
+
+    enable_buffer_tracking()
+    GObject.threads_init()
+    Gst.init(None)
+    stages = None
+    if args.mode == "stages":
+        description = stages_pipeline(args.streams, 1280, 720, args.fps, args.config)
+        stages = ProbeStages(args.output_dir)
+    elif args.mode == "gpu":
+        description = gpu_pipeline(args.streams, 1280, 720, args.fps, args.config)
+    else:
+        description = cpu_pipeline(args.streams, 1280, 720, args.fps, (640, 368), 2000)
+    soak = SoakTest(description, stages, hours=args.hours, interval=args.interval, warmup=args.warmup,
+                    max_rss_mb_per_hour=args.max_rss_mb_per_hour,
+                    max_objects_per_hour=args.max_objects_per_hour,
+                    max_buffers_per_hour=args.max_buffers_per_hour,
+                    max_meta_per_hour=args.max_meta_per_hour,
+                    max_fps_decay_pct_per_hour=args.max_fps_decay_pct_per_hour,
+                    output_dir=args.output_dir)
+    print(f"🧪 Soaking {args.streams} {args.mode} stream(s) for {args.hours:g}h, sampling every {args.interval:g}s")
+    passed, lines = soak.run()
+    print("Trends after warm-up:")
+    print("\n".join(lines))
+    if stages:
+        print("Probe stages:")
+        print(stages.report())
+    return 0 if passed else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+
+import sys
+import time
+import gi
+gi.require_version('Gst', '1.0')
+from gi.repository import GObject, GLib, Gst
+
+
+def build_source_bin(name, elements):
+    """Put a chain of source elements in a bin with a ghost "src" pad, so it can be restarted alone"""
+    source_bin = Gst.Bin.new(name)
+    for element in elements:
+        source_bin.add(element)
+    for upstream, downstream in zip(elements, elements[1:]):
+        if not upstream.link(downstream):
+            print(f"Unable to link {upstream.get_name()} -> {downstream.get_name()} in {name}")
+            return None
+    source_bin.add_pad(Gst.GhostPad.new("src", elements[-1].get_static_pad("src")))
+    return source_bin
+
+
+class Incident:
+    def __init__(self, source_id, reason, detected_at):
+        self.source_id = source_id
+        self.reason = reason
+        self.detected_at = detected_at
+        self.restarts = 0
+        self.recovered_at = None
+
+    @property
+    def time_to_recover(self):
+        return None if self.recovered_at is None else self.recovered_at - self.detected_at
+
+
+class WatchedSource:
+    def __init__(self, source_id, source_bin, pad):
+        self.source_id = source_id
+        self.bin = source_bin
+        self.pad = pad
+        self.last_buffer = None
+        self.incident = None
+        self.next_restart = 0.0
+        self.stall_until = 0.0
+
+
+class SourceWatchdog:
+    """Restarts a single source bin on stalls or errors scoped to it, and times each recovery"""
+
+    def __init__(self, stall_ms=2000, check_ms=250, backoff_ms=500, max_backoff_ms=10000):
+        self.stall_ms = stall_ms
+        self.check_ms = check_ms
+        self.backoff_ms = backoff_ms
+        self.max_backoff_ms = max_backoff_ms
+        self.sources = {}
+        self.incidents = []
+        self.timer_id = None
+
+    def watch(self, source_id, source_bin, pad=None):
+        """Track buffers on the bin's src pad (or the given pad) and scope errors to the bin"""
+        pad = pad or source_bin.get_static_pad("src")
+        watched = WatchedSource(source_id, source_bin, pad)
+        self.sources[source_id] = watched
+        pad.add_probe(Gst.PadProbeType.BUFFER, self.buffer_probe, watched)
+        return watched
+
+    def start(self):
+        now = time.monotonic()
+        for watched in self.sources.values():
+            # Grace period for the first buffer after startup
+            watched.last_buffer = now
+        self.timer_id = GLib.timeout_add(self.check_ms, self.check_stalls)
+
+    def stop(self):
+        if self.timer_id is not None:
+            GLib.source_remove(self.timer_id)
+            self.timer_id = None
+
+    def buffer_probe(self, pad, info, watched):
+        now = time.monotonic()
+        if now < watched.stall_until:
+            # Injected stall: swallow buffers as if the device stopped delivering
+            return Gst.PadProbeReturn.DROP
+        watched.last_buffer = now
+        incident = watched.incident
+        if incident is not None and incident.restarts > 0:
+            incident.recovered_at = now
+            watched.incident = None
+            print(f"✅ Source {watched.source_id} recovered from {incident.reason} "
+                  f"in {incident.time_to_recover * 1000:.0f} ms ({incident.restarts} restart(s))")
+        return Gst.PadProbeReturn.OK
+
+    def source_for(self, element):
+        for watched in self.sources.values():
+            if element is watched.bin or element.has_as_ancestor(watched.bin):
+                return watched
+        return None
+
+    def handle_error(self, message):
+        """Call from on_message for ERROR; returns True when the error was scoped to a source and handled"""
+        watched = self.source_for(message.src)
+        if watched is None:
+            return False
+        err, debug = message.parse_error()
+        print(f"⚠️  Source {watched.source_id} error from {message.src.get_name()}: {err}")
+        self._incident(watched, f"error: {err.message}")
+        return True
+
+    def check_stalls(self):
+        now = time.monotonic()
+        for watched in self.sources.values():
+            if watched.incident is None:
+                if watched.last_buffer is not None and (now - watched.last_buffer) * 1000 > self.stall_ms:
+                    print(f"⚠️  Source {watched.source_id} stalled: no buffers for "
+                          f"{(now - watched.last_buffer) * 1000:.0f} ms")
+                    self._incident(watched, "stall")
+            elif now >= watched.next_restart and (watched.last_buffer or 0) < watched.incident.detected_at:
+                # Still no buffers since the incident: restart again with backoff
+                self._restart(watched, now)
+        return True
+
+    def _incident(self, watched, reason):
+        now = time.monotonic()
+        if watched.incident is None:
+            watched.incident = Incident(watched.source_id, reason, now)
+            self.incidents.append(watched.incident)
+            watched.next_restart = now
+        # Restart from the main loop, never from the streaming thread that raised the error
+        GLib.idle_add(self._restart_idle, watched)
+
+    def _restart_idle(self, watched):
+        self._restart(watched, time.monotonic())
+        return False
+
+    def _restart(self, watched, now):
+        incident = watched.incident
+        if incident is None or now < watched.next_restart:
+            return
+        incident.restarts += 1
+        delay_ms = min(self.backoff_ms * 2 ** (incident.restarts - 1), self.max_backoff_ms)
+        watched.next_restart = now + max(delay_ms, self.stall_ms) / 1000.0
+        print(f"🔄 Restarting source {watched.source_id} (attempt {incident.restarts})")
+        watched.bin.set_state(Gst.State.NULL)
+        watched.bin.sync_state_with_parent()
+
+    def inject_error(self, source_id, element_name=None):
+        """Post an ERROR from an element inside the source bin, as a failing device would"""
+        watched = self.sources[source_id]
+        # Bin children are newest first, so the last child is the actual source element
+        element = watched.bin.get_by_name(element_name) if element_name else watched.bin.children[-1]
+        error = GLib.Error.new_literal(Gst.ResourceError.quark(), "Injected source failure",
+                                       int(Gst.ResourceError.FAILED))
+        element.post_message(Gst.Message.new_error(element, error, "injected by SourceWatchdog"))
+
+    def inject_stall(self, source_id, duration_ms):
+        """Drop the source's buffers for duration_ms"""
+        self.sources[source_id].stall_until = time.monotonic() + duration_ms / 1000.0
+
+    def report(self):
+        lines = []
+        for incident in self.incidents:
+            if incident.time_to_recover is None:
+                outcome = "not recovered"
+            else:
+                outcome = f"recovered in {incident.time_to_recover * 1000:.0f} ms"
+            lines.append(f"   source {incident.source_id}: {incident.reason}, {incident.restarts} restart(s), {outcome}")
+        return "\n".join(lines)
+
+
+class WatchdogDemo:
+    """Videotestsrc sources with injected errors and stalls; the other sources keep running"""
+
+    def __init__(self, num_sources=3, duration=12):
+        GObject.threads_init()
+        Gst.init(None)
+        self.num_sources = num_sources
+        self.duration = duration
+        self.pipeline = None
+        self.loop = None
+        self.watchdog = SourceWatchdog(stall_ms=1000)
+        self.frames = [0] * num_sources
+
+    def create_pipeline(self):
+        self.pipeline = Gst.Pipeline.new("watchdog-demo")
+        for source_id in range(self.num_sources):
+            source = Gst.ElementFactory.make("videotestsrc", f"test-source-{source_id}")
+            caps_filter = Gst.ElementFactory.make("capsfilter", f"caps-{source_id}")
+            sink = Gst.ElementFactory.make("fakesink", f"sink-{source_id}")
+            if not all([source, caps_filter, sink]):
+                print("Failed to create pipeline elements")
+                return False
+            source.set_property("is-live", True)
+            caps_filter.set_property("caps",
+                Gst.Caps.from_string("video/x-raw, width=320, height=240, framerate=30/1"))
+            sink.set_property("sync", False)
+
+            source_bin = build_source_bin(f"source-bin-{source_id}", [source, caps_filter])
+            self.pipeline.add(source_bin)
+            self.pipeline.add(sink)
+            source_bin.link(sink)
+            self.watchdog.watch(source_id, source_bin)
+            sink.get_static_pad("sink").add_probe(Gst.PadProbeType.BUFFER, self.count_probe, source_id)
+        return True
+
+    def count_probe(self, pad, info, source_id):
+        self.frames[source_id] += 1
+        return Gst.PadProbeReturn.OK
+
+    def on_message(self, bus, message):
+        if message.type == Gst.MessageType.ERROR:
+            if self.watchdog.handle_error(message):
+                return
+            err, debug = message.parse_error()
+            print(f"Error: {err}")
+            self.loop.quit()
+
+    def run(self):
+        if not self.create_pipeline():
+            return False
+        bus = self.pipeline.get_bus()
+        bus.add_signal_watch()
+        bus.connect("message", self.on_message)
+
+        self.pipeline.set_state(Gst.State.PLAYING)
+        self.loop = GObject.MainLoop()
+        self.watchdog.start()
+        GLib.timeout_add(3000, lambda: self.watchdog.inject_error(1) and False)
+        GLib.timeout_add(6000, lambda: self.watchdog.inject_stall(2 % self.num_sources, 2500) and False)
+        GLib.timeout_add(self.duration * 1000, self.loop.quit)
+        self.loop.run()
+
+        self.watchdog.stop()
+        self.pipeline.set_state(Gst.State.NULL)
+        print(f"Frames per source: {self.frames}")
+        print("Incidents:")
+        print(self.watchdog.report())
+        return all(incident.recovered_at is not None for incident in self.watchdog.incidents)
+
+
+def main():
+    demo = WatchdogDemo()
+    return 0 if demo.run() else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+
+# Imported first by the pipelines, before gi, so it must not pull in gi or pyds itself
+import os
+import sys
+import time
+import hashlib
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+from batch_meta_iter import backend_for, iter_frames, iter_objects
+
+_IMPORTED_AT = time.perf_counter()
+
+
+def process_age():
+    """Seconds since this process was started, read from /proc; None where unavailable"""
+    try:
+        with open("/proc/self/stat") as f:
+            # Field 22 (starttime) comes after the parenthesised command name
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return max(0.0, uptime - start_ticks / os.sysconf("SC_CLK_TCK"))
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class StartupProfiler:
+    """Wall-clock timeline of startup phases up to the first buffer and first detection"""
+
+    def __init__(self):
+        self.origin = _IMPORTED_AT
+        # Interpreter start-up and the imports before this module happened before origin
+        age = process_age()
+        self.interpreter = None if age is None else max(0.0, age - (time.perf_counter() - self.origin))
+        self.phases = []
+        self.events = []
+        self.lock = threading.Lock()
+        self.reported = False
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.phases.append((name, start - self.origin, time.perf_counter() - start))
+
+    def mark(self, name):
+        with self.lock:
+            self.events.append((name, time.perf_counter() - self.origin))
+
+    def first_buffer_probe(self, pad, info, u_data):
+        """Buffer probe on the nvinfer src pad; removes itself once the first face is seen"""
+        from gi.repository import Gst
+
+        if not self.reported:
+            self.mark("first buffer")
+            self.print_report()
+
+        gst_buffer = info.get_buffer()
+        if not gst_buffer:
+            return Gst.PadProbeReturn.OK
+        backend = backend_for(sys.modules.get("pyds"))
+        batch_meta = backend.batch_meta(gst_buffer)
+        # Boxes the box filter rejected stay in the metadata with class_id -1
+        if any(obj_meta.class_id >= 0 for frame_meta in iter_frames(batch_meta, backend)
+               for obj_meta in iter_objects(frame_meta, backend)):
+            self.mark("first detection")
+            print(f"⏱️  First detection {self.events[-1][1] * 1000:.0f} ms after start-up")
+            return Gst.PadProbeReturn.REMOVE
+        return Gst.PadProbeReturn.OK
+
+    def report(self):
+        lines = []
+        if self.interpreter is not None:
+            lines.append(f"   {'interpreter start-up':<34} {'':>9} {self.interpreter * 1000:>8.0f} ms")
+        for name, start, duration in sorted(self.phases, key=lambda phase: phase[1]):
+            lines.append(f"   {name:<34} +{start * 1000:>7.0f} ms {duration * 1000:>8.0f} ms")
+        for name, at in self.events:
+            lines.append(f"   {name:<34} +{at * 1000:>7.0f} ms")
+        return "\n".join(lines)
+
+    def print_report(self):
+        if self.reported:
+            return
+        self.reported = True
+        print("⏱️  Startup profile (phase, offset, duration):")
+        print(self.report())
+
+
+def plugin_fingerprint(plugin_dirs, version_file="/opt/nvidia/deepstream/deepstream/version"):
+    """Digest of every plugin file's name, size and mtime plus the DeepStream version"""
+    digest = hashlib.sha1()
+    try:
+        with open(version_file, 'rb') as f:
+            digest.update(f.read())
+    except OSError:
+        pass
+    for plugin_dir in plugin_dirs:
+        try:
+            entries = sorted(os.scandir(plugin_dir), key=lambda entry: entry.name)
+        except OSError:
+            continue
+        for entry in entries:
+            if entry.name.endswith(".so") and entry.is_file():
+                stat = entry.stat()
+                digest.update(f"{entry.path}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode())
+    return digest.hexdigest()
+
+
+def configure_registry_cache(path="output/gst-registry.bin", plugin_dirs=None):
+    """Keep the GStreamer registry somewhere persistent and skip the plugin rescan while it is fresh
+
+    Must run before Gst.init. The rescan loads every changed plugin on every
+    launch; it is only skipped when the plugin files match the fingerprint
+    stored next to the cache. A registry kept on a volume outlives the
+    image, so its own mtime says nothing about the plugins it describes.
+    """
+    if "GST_REGISTRY" in os.environ:
+        return os.environ["GST_REGISTRY"]
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    os.environ["GST_REGISTRY"] = path
+    if plugin_dirs is None:
+        plugin_dirs = [d for d in os.environ.get("GST_PLUGIN_PATH", "").split(os.pathsep) if d]
+        plugin_dirs += ["/opt/nvidia/deepstream/deepstream/lib/gst-plugins",
+                        f"/usr/lib/{os.uname().machine}-linux-gnu/gstreamer-1.0"]
+    fingerprint = plugin_fingerprint(plugin_dirs)
+    key_path = path + ".key"
+    try:
+        with open(key_path) as f:
+            cached = f.read().strip()
+    except OSError:
+        cached = None
+    if cached == fingerprint and os.path.exists(path):
+        os.environ.setdefault("GST_REGISTRY_UPDATE", "no")
+    else:
+        # Gst.init rescans and rewrites the registry for these plugins
+        try:
+            with open(key_path, 'w') as f:
+                f.write(fingerprint + "\n")
+        except OSError as e:
+            print(f"Unable to store registry fingerprint {key_path}: {e}")
+    return path
+
+
+class PendingElements:
+    """Elements being created on worker threads; result() waits for them"""
+
+    def __init__(self, futures):
+        self.futures = futures
+
+    def result(self):
+        elements = {}
+        for name, future in self.futures:
+            elements[name] = future.result()
+            if not elements[name]:
+                sys.stderr.write(f" Unable to create {name} \n")
+        return elements
+
+
+def make_elements(specs, workers=4):
+    """Start creating (factory, name) elements on worker threads
+
+    The first make of a DeepStream factory loads its plugin and CUDA
+    libraries with the GIL released, so the caller can import Python
+    modules meanwhile. GStreamer serialises the plugin loads themselves.
+    """
+    from gi.repository import Gst
+
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="element-factory")
+    futures = [(name, pool.submit(Gst.ElementFactory.make, factory, name)) for factory, name in specs]
+    pool.shutdown(wait=False)
+    return PendingElements(futures)
+
+
+def main():
+    profiler = StartupProfiler()
+    with profiler.phase("import gi"):
+        import gi
+        gi.require_version('Gst', '1.0')
+        from gi.repository import Gst
+    with profiler.phase("Gst.init + registry"):
+        configure_registry_cache()
+        Gst.init(None)
+    specs = [("videotestsrc", "source"), ("capsfilter", "caps"), ("videoconvert", "convert"),
+             ("queue", "queue"), ("fakesink", "sink")]
+    with profiler.phase("element creation"):
+        elements = make_elements(specs).result()
+    pipeline = Gst.Pipeline.new("startup-profile")
+    for factory, name in specs:
+        pipeline.add(elements[name])
+    for (_, upstream), (_, downstream) in zip(specs, specs[1:]):
+        elements[upstream].link(elements[downstream])
+    elements["source"].set_property("num-buffers", 1)
+    elements["sink"].get_static_pad("sink").add_probe(
+        Gst.PadProbeType.BUFFER, lambda pad, info: profiler.mark("first buffer") or Gst.PadProbeReturn.REMOVE)
+    with profiler.phase("state change to PLAYING"):
+        pipeline.set_state(Gst.State.PLAYING)
+        pipeline.get_state(5 * Gst.SECOND)
+    pipeline.get_bus().timed_pop_filtered(5 * Gst.SECOND, Gst.MessageType.EOS | Gst.MessageType.ERROR)
+    pipeline.set_state(Gst.State.NULL)
+    profiler.print_report()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
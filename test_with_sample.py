@@ -5,6 +5,9 @@ import gi
 gi.require_version('Gst', '1.0')
 from gi.repository import GObject, Gst
 import signal
+from muxer_resolution import MuxerResolutionMatcher
+from source_watchdog import SourceWatchdog, build_source_bin
+from push_timeout_tuner import MuxerTimeoutControl
 
 class DeepStreamTest:
     def __init__(self):
@@ -13,6 +16,9 @@ class DeepStreamTest:
         self.pipeline = None
         self.loop = None
         self.frame_count = 0
+        self.matcher = None
+        self.watchdog = SourceWatchdog()
+        self.mux_timeout = None
         
     def create_pipeline(self):
         print("Creating DeepStream test pipeline with sample video...")
@@ -42,31 +48,38 @@ class DeepStreamTest:
         caps_nvmm.set_property("caps", 
             Gst.Caps.from_string("video/x-raw(memory:NVMM)"))
         
-        streammux.set_property("width", 1920)
-        streammux.set_property("height", 1080)
-        streammux.set_property("batch-size", 1)
-        streammux.set_property("batched-push-timeout", 4000000)
-        
         # Use primary inference config
         config_path = "/opt/nvidia/deepstream/deepstream/samples/configs/deepstream-app/config_infer_primary.txt"
         pgie.set_property("config-file-path", config_path)
         
+        # Muxer size follows the test pattern caps instead of upscaling to 1080p
+        streammux.set_property("width", 640)
+        streammux.set_property("height", 480)
+        streammux.set_property("batch-size", 1)
+        # Sets batched-push-timeout just above the measured batch fill time instead of a fixed 4 s
+        self.mux_timeout = MuxerTimeoutControl(streammux)
+        self.matcher = MuxerResolutionMatcher(streammux, config_path)
+        
         sink.set_property("sync", False)
         
+        # Source chain lives in its own bin so the watchdog can restart it alone
+        source_bin = build_source_bin("source-bin-0", [source, caps_filter, nvvidconv, caps_nvmm])
+        if not source_bin:
+            return False
+        
         # Add elements to pipeline
-        elements = [source, caps_filter, nvvidconv, caps_nvmm, streammux, pgie, nvvidconv2, nvosd, sink]
+        elements = [source_bin, streammux, pgie, nvvidconv2, nvosd, sink]
         for element in elements:
             self.pipeline.add(element)
         
-        # Link elements
-        source.link(caps_filter)
-        caps_filter.link(nvvidconv)
-        nvvidconv.link(caps_nvmm)
-        
         # Link to streammux
         sinkpad = streammux.get_request_pad("sink_0")
-        srcpad = caps_nvmm.get_static_pad("src")
+        srcpad = source_bin.get_static_pad("src")
         srcpad.link(sinkpad)
+        self.matcher.attach(srcpad)
+        self.mux_timeout.watch_input(0, srcpad)
+        self.mux_timeout.attach()
+        self.watchdog.watch(0, source_bin)
         
         # Link rest of pipeline
         streammux.link(pgie)
@@ -104,6 +117,8 @@ class DeepStreamTest:
             
         # Run main loop
         self.loop = GObject.MainLoop()
+        self.watchdog.start()
+        self.mux_timeout.start()
         
         def signal_handler(sig, frame):
             print(f"\n🎉 TEST COMPLETE! Processed {self.frame_count} frames successfully!")
@@ -121,7 +136,14 @@ class DeepStreamTest:
             print(f"\n✅ Test completed! Processed {self.frame_count} frames")
         
         # Cleanup
+        self.mux_timeout.stop()
+        self.watchdog.stop()
         self.pipeline.set_state(Gst.State.NULL)
+        print("⏱️  Muxer batching:")
+        print(self.mux_timeout.report())
+        if self.watchdog.incidents:
+            print("Source incidents:")
+            print(self.watchdog.report())
         print("Pipeline stopped")
         return True
         
@@ -131,6 +153,9 @@ class DeepStreamTest:
             print("End-of-stream")
             self.loop.quit()
         elif t == Gst.MessageType.ERROR:
+            # Errors inside a source bin restart that source only
+            if self.watchdog.handle_error(message):
+                return
             err, debug = message.parse_error()
             print(f"Error: {err}")
             if debug:
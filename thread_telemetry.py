@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import time
+import threading
+import tracemalloc
+import gi
+gi.require_version('Gst', '1.0')
+from gi.repository import GObject, GLib, Gst
+
+from metrics import REGISTRY
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+
+def read_thread_cpu(pid="self"):
+    """{tid: (comm, utime + stime seconds)} for every thread of the process"""
+    threads = {}
+    task_dir = f"/proc/{pid}/task"
+    try:
+        tids = os.listdir(task_dir)
+    except OSError:
+        return threads
+    for tid in tids:
+        try:
+            with open(f"{task_dir}/{tid}/stat") as f:
+                stat = f.read()
+        except OSError:
+            # Thread exited between listdir and open
+            continue
+        comm = stat[stat.index("(") + 1:stat.rindex(")")]
+        fields = stat[stat.rindex(")") + 2:].split()
+        # utime and stime are fields 14 and 15 of stat, 12 and 13 after the command name
+        threads[int(tid)] = (comm, (int(fields[11]) + int(fields[12])) / CLOCK_TICKS)
+    return threads
+
+
+def read_rss(pid="self"):
+    with open(f"/proc/{pid}/statm") as f:
+        return int(f.read().split()[1]) * PAGE_SIZE
+
+
+class ThreadTelemetry:
+    """Per streaming-thread CPU, attributed to the elements and pads running on each thread
+
+    Which thread a src pad pushes from is sampled, not counted: each pad
+    gets a probe that records the thread of one buffer and removes itself,
+    and every sample re-arms the probes to notice restarted sources.
+    """
+
+    def __init__(self, pipeline, interval=5.0, top_n=5, trace_python=False, registry=REGISTRY):
+        self.pipeline = pipeline
+        self.interval = interval
+        self.top_n = top_n
+        self.trace_python = trace_python
+        self.lock = threading.Lock()
+        # tid -> task pad that owns the thread ("queue0:src"), from STREAM_STATUS
+        self.owners = {}
+        # tid -> element names whose pads pushed buffers on that thread
+        self.elements = {}
+        self.pad_threads = {}
+        # (pad, element) for every src pad, and the pads whose probe has not fired yet
+        self.pads = []
+        self.armed = set()
+        self.previous = {}
+        self.previous_time = None
+        self.hottest = []
+        self._stop = threading.Event()
+        self._sampler = None
+        self.cpu_metric = registry.gauge("thread_cpu_percent", "CPU use of one thread over the last interval")
+        self.element_metric = registry.gauge("element_cpu_percent",
+                                             "CPU of the threads an element runs on, split evenly between them")
+        self.rss_metric = registry.gauge("process_rss_bytes", "Resident set size")
+        self.alloc_metric = registry.gauge("python_alloc_bytes", "Python heap from tracemalloc")
+
+    def attach(self):
+        """Watch streaming-thread creation and tag every src pad with the thread it pushes from"""
+        bus = self.pipeline.get_bus()
+        bus.enable_sync_message_emission()
+        bus.connect("sync-message::stream-status", self.on_stream_status)
+        for element in self._iterate(self.pipeline.iterate_recurse()):
+            for pad in self._iterate(element.iterate_src_pads()):
+                self.pads.append((pad, element))
+        self._arm()
+
+    def _arm(self):
+        with self.lock:
+            pads = [(pad, element) for pad, element in self.pads if pad not in self.armed]
+            self.armed.update(pad for pad, _ in pads)
+        for pad, element in pads:
+            pad.add_probe(Gst.PadProbeType.BUFFER | Gst.PadProbeType.BUFFER_LIST, self.thread_probe, element)
+
+    @staticmethod
+    def _iterate(iterator):
+        items = []
+        while True:
+            result, item = iterator.next()
+            if result == Gst.IteratorResult.OK:
+                items.append(item)
+            elif result == Gst.IteratorResult.RESYNC:
+                iterator.resync()
+                items = []
+            else:
+                return items
+
+    def on_stream_status(self, bus, message):
+        # ENTER is posted from the new streaming thread itself, so the native id is the thread's own
+        status, owner = message.parse_stream_status()
+        if status == Gst.StreamStatusType.ENTER:
+            src = message.src
+            label = f"{src.get_parent().get_name()}:{src.get_name()}" if isinstance(src, Gst.Pad) else owner.get_name()
+            with self.lock:
+                self.owners[threading.get_native_id()] = label
+
+    def thread_probe(self, pad, info, element):
+        tid = threading.get_native_id()
+        with self.lock:
+            self.armed.discard(pad)
+            previous = self.pad_threads.get(pad)
+            if previous != tid:
+                # The first buffer, or a restarted source pushing from a new thread
+                name = element.get_name()
+                self.pad_threads[pad] = tid
+                if previous is not None:
+                    self.elements.get(previous, set()).discard(name)
+                self.elements.setdefault(tid, set()).add(name)
+        return Gst.PadProbeReturn.REMOVE
+
+    def label(self, tid, comm):
+        with self.lock:
+            owner = self.owners.get(tid)
+            elements = sorted(self.elements.get(tid, ()))
+        name = owner or comm
+        return f"{name} [{', '.join(elements)}]" if elements else name
+
+    def sample(self):
+        """Take one CPU/RSS/heap sample; returns [(cpu %, tid, label)] hottest first"""
+        self._arm()
+        now = time.monotonic()
+        current = read_thread_cpu()
+        rows = []
+        if self.previous_time is not None:
+            elapsed = now - self.previous_time
+            for tid, (comm, cpu) in current.items():
+                if tid in self.previous:
+                    rows.append(((cpu - self.previous[tid][1]) / elapsed * 100.0, tid, self.label(tid, comm)))
+        self.previous = current
+        self.previous_time = now
+        rows.sort(reverse=True)
+
+        element_cpu = {}
+        for percent, tid, label in rows:
+            with self.lock:
+                elements = self.elements.get(tid, ())
+            for element in elements:
+                element_cpu[element] = element_cpu.get(element, 0.0) + percent / len(elements)
+        # Replaced whole, so threads that exited disappear from the series
+        self.cpu_metric.replace((round(percent, 2), {"tid": tid, "thread": label}) for percent, tid, label in rows)
+        self.element_metric.replace((round(percent, 2), {"element": element})
+                                    for element, percent in element_cpu.items())
+
+        self.rss_metric.set(read_rss())
+        if self.trace_python:
+            current_bytes, peak_bytes = tracemalloc.get_traced_memory()
+            self.alloc_metric.set(current_bytes, kind="current")
+            self.alloc_metric.set(peak_bytes, kind="peak")
+            # Peak per interval rather than since start
+            tracemalloc.reset_peak()
+        self.hottest = rows[:self.top_n]
+        return rows
+
+    def summary(self):
+        lines = [f"🔥 Hottest threads (RSS {read_rss() / 2**20:.0f} MiB):"]
+        for percent, tid, label in self.hottest:
+            lines.append(f"   {percent:5.1f}%  {tid:>7}  {label}")
+        return "\n".join(lines)
+
+    def start(self):
+        if self.trace_python and not tracemalloc.is_tracing():
+            tracemalloc.start(1)
+        self.sample()
+
+        def loop():
+            while not self._stop.wait(self.interval):
+                self.sample()
+                print(self.summary())
+
+        self._sampler = threading.Thread(target=loop, name="thread-telemetry", daemon=True)
+        self._sampler.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+            self._sampler = None
+        if self.trace_python and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+
+def main():
+    # Two branches on their own queue threads, one doing much more work than the other
+    GObject.threads_init()
+    Gst.init(None)
+    pipeline = Gst.parse_launch(
+        "videotestsrc is-live=true pattern=snow ! video/x-raw,width=1920,height=1080,framerate=30/1 ! "
+        "tee name=t "
+        "t. ! queue name=heavy-queue ! videoconvert name=heavy-convert ! video/x-raw,format=Y444 ! "
+        "videoscale name=heavy-scale ! video/x-raw,width=1280,height=720 ! fakesink sync=false "
+        "t. ! queue name=light-queue ! fakesink name=light-sink sync=false")
+    telemetry = ThreadTelemetry(pipeline, interval=2.0, trace_python=True)
+    telemetry.attach()
+    REGISTRY.serve()
+    print("Metrics on http://localhost:9101/metrics")
+
+    loop = GLib.MainLoop()
+    pipeline.set_state(Gst.State.PLAYING)
+    telemetry.start()
+    GLib.timeout_add_seconds(7, loop.quit)
+    loop.run()
+    telemetry.stop()
+    pipeline.set_state(Gst.State.NULL)
+    REGISTRY.shutdown()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
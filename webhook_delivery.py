@@ -0,0 +1,469 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import time
+import queue
+import random
+import argparse
+import threading
+import http.client
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+import gi
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst
+
+try:
+    import pyds
+except ImportError:
+    pyds = None
+
+from batch_meta_iter import backend_for, iter_frames, iter_objects
+from metrics import REGISTRY
+
+PGIE_CLASS_ID_FACE = 0
+
+
+class PermanentError(Exception):
+    """The endpoint rejected the batch itself (4xx); retrying would not help"""
+
+
+class WebhookDelivery:
+    """Delivers detection events in batches over pooled keep-alive connections
+
+    emit() only appends to a bounded queue and never blocks. A batcher
+    thread cuts batches by count or age and hands them to a small pool of
+    senders, each with its own persistent connection. Failed batches are
+    retried with exponential backoff and then spooled to disk; spooled
+    batches are replayed oldest first once the endpoint answers again,
+    one at a time through the sender pool, so the batcher itself never
+    waits on the network. The spool is tracked in memory (size and event
+    count per file, oldest first), so the directory is only listed once,
+    at startup.
+    """
+
+    def __init__(self, url, batch_size=100, batch_seconds=1.0, pool_size=4, max_queue=10000,
+                 max_retries=5, backoff_seconds=0.5, max_backoff_seconds=30.0, timeout=5.0,
+                 spool_dir="output/webhook-spool", max_spool_bytes=512 * 2**20, latency_window=10000,
+                 registry=REGISTRY):
+        parsed = urlparse(url)
+        self.https = parsed.scheme == "https"
+        self.host = parsed.hostname
+        self.port = parsed.port or (443 if self.https else 80)
+        self.path = parsed.path or "/"
+        self.batch_size = batch_size
+        self.batch_seconds = batch_seconds
+        self.pool_size = pool_size
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.timeout = timeout
+        self.spool_dir = spool_dir
+        self.max_spool_bytes = max_spool_bytes
+
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.local = threading.local()
+        self.executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="webhook-sender")
+        # Batches handed to senders and not yet finished; beyond this the batcher spools instead
+        self.in_flight = threading.BoundedSemaphore(pool_size * 2)
+        self.lock = threading.Lock()
+        self.endpoint_down = False
+        self.next_replay = 0.0
+        self.replay_delay = backoff_seconds
+        self.active = 0
+        self.replaying = False
+        # Delivery latency of the most recent events only; the process runs for weeks
+        self.latencies = deque(maxlen=latency_window)
+        self._stop = threading.Event()
+        self._batcher = threading.Thread(target=self._run, name="webhook-batcher", daemon=True)
+
+        self.events_metric = registry.counter("webhook_events_total", "Detection events by outcome")
+        self.batches_metric = registry.counter("webhook_batches_total", "Webhook POSTs by outcome")
+        self.spool_metric = registry.gauge("webhook_spool_bytes", "Bytes of undelivered batches on disk")
+        os.makedirs(spool_dir, exist_ok=True)
+        # Spool file name -> (bytes, events), oldest first; batches left by an earlier run are replayed too
+        self.spooled = OrderedDict()
+        self.spool_bytes = 0
+        self._load_spool()
+        self._batcher.start()
+
+    # Producer side: safe to call from a streaming thread
+
+    def emit(self, event):
+        """Queue one event (a JSON-serialisable dict); drops and counts it when the queue is full"""
+        try:
+            self.queue.put_nowait((time.monotonic(), event))
+            return True
+        except queue.Full:
+            self.events_metric.inc(outcome="dropped")
+            return False
+
+    def event_probe(self, pad, info, u_data):
+        """Buffer probe on the nvinfer src pad emitting one event per frame with faces"""
+        gst_buffer = info.get_buffer()
+        if not gst_buffer:
+            return Gst.PadProbeReturn.OK
+        now = time.time()
+        backend = backend_for(pyds)
+        batch_meta = backend.batch_meta(gst_buffer)
+        for frame_meta in iter_frames(batch_meta, backend):
+            faces = []
+            for obj_meta in iter_objects(frame_meta, backend, PGIE_CLASS_ID_FACE):
+                rect = obj_meta.rect_params
+                faces.append([round(rect.left), round(rect.top), round(rect.width), round(rect.height),
+                              round(obj_meta.confidence, 3)])
+            if faces:
+                self.emit({"source_id": frame_meta.source_id, "frame_num": frame_meta.frame_num,
+                           "timestamp": now, "faces": faces})
+        return Gst.PadProbeReturn.OK
+
+    # Batcher
+
+    def _run(self):
+        batch = []
+        deadline = None
+        while not (self._stop.is_set() and self.queue.empty() and not batch):
+            timeout = 0.1 if deadline is None else max(0.0, min(0.1, deadline - time.monotonic()))
+            try:
+                item = self.queue.get(timeout=timeout)
+                if not batch:
+                    deadline = time.monotonic() + self.batch_seconds
+                batch.append(item)
+            except queue.Empty:
+                pass
+            now = time.monotonic()
+            if batch and (len(batch) >= self.batch_size or now >= deadline or self._stop.is_set()):
+                self._dispatch(batch)
+                batch = []
+                deadline = None
+            self._start_replay(now)
+
+    def _dispatch(self, batch):
+        if self.endpoint_down or not self.in_flight.acquire(blocking=False):
+            # Endpoint known down or senders saturated: straight to disk, never wait
+            self._spool([event for _, event in batch])
+            self.events_metric.inc(len(batch), outcome="spooled")
+            return
+        with self.lock:
+            self.active += 1
+        self.executor.submit(self._deliver, batch)
+
+    def _deliver(self, batch):
+        try:
+            body = json.dumps([event for _, event in batch]).encode()
+            try:
+                self._post_with_retry(body)
+            except PermanentError:
+                self.events_metric.inc(len(batch), outcome="rejected")
+                return
+            except OSError:
+                self._mark_down()
+                self._spool([event for _, event in batch])
+                self.events_metric.inc(len(batch), outcome="spooled")
+                return
+            now = time.monotonic()
+            with self.lock:
+                self.latencies.extend(now - emitted for emitted, _ in batch)
+            self.events_metric.inc(len(batch), outcome="delivered")
+        finally:
+            with self.lock:
+                self.active -= 1
+            self.in_flight.release()
+
+    # HTTP
+
+    def _connection(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn_class = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+            conn = self.local.conn = conn_class(self.host, self.port, timeout=self.timeout)
+        return conn
+
+    def _post(self, body):
+        conn = self._connection()
+        try:
+            conn.request("POST", self.path, body, {"Content-Type": "application/json",
+                                                   "Connection": "keep-alive"})
+            response = conn.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException) as e:
+            # Drop the broken connection; the next attempt opens a fresh one
+            conn.close()
+            self.local.conn = None
+            raise ConnectionError(str(e)) from e
+        if response.will_close:
+            conn.close()
+            self.local.conn = None
+        if 200 <= response.status < 300:
+            self.batches_metric.inc(outcome="ok")
+            return
+        self.batches_metric.inc(outcome=str(response.status))
+        if response.status == 429 or response.status >= 500:
+            raise ConnectionError(f"HTTP {response.status}")
+        raise PermanentError(f"HTTP {response.status}")
+
+    def _post_with_retry(self, body):
+        delay = self.backoff_seconds
+        for attempt in range(self.max_retries + 1):
+            try:
+                self._post(body)
+                with self.lock:
+                    self.endpoint_down = False
+                return
+            except ConnectionError:
+                if attempt == self.max_retries or self._stop.is_set():
+                    raise
+                # Full jitter keeps many senders from retrying in lockstep
+                time.sleep(random.uniform(0, delay))
+                delay = min(delay * 2, self.max_backoff_seconds)
+
+    def _mark_down(self):
+        with self.lock:
+            if not self.endpoint_down:
+                print(f"⚠️  Webhook endpoint {self.host}:{self.port} unreachable, spooling to {self.spool_dir}")
+            self.endpoint_down = True
+            self.next_replay = time.monotonic() + self.replay_delay
+
+    # Spool
+
+    def _load_spool(self):
+        try:
+            names = sorted(name for name in os.listdir(self.spool_dir) if name.endswith(".json"))
+        except OSError:
+            names = []
+        for name in names:
+            try:
+                size = os.path.getsize(os.path.join(self.spool_dir, name))
+            except OSError:
+                continue
+            self.spooled[name] = (size, self._spooled_events(name))
+            self.spool_bytes += size
+        self._trim_spool()
+
+    def _spooled_events(self, name):
+        """Events in a spool file, from its name; files from older versions are read"""
+        parts = name[:-len(".json")].split("-")
+        if len(parts) == 3 and parts[2].isdigit():
+            return int(parts[2])
+        try:
+            with open(os.path.join(self.spool_dir, name)) as f:
+                return len(json.load(f))
+        except (OSError, ValueError):
+            return 0
+
+    def _spool(self, events):
+        name = f"{time.time_ns():020d}-{threading.get_native_id()}-{len(events)}.json"
+        path = os.path.join(self.spool_dir, name)
+        try:
+            with open(path + ".tmp", "w") as f:
+                json.dump(events, f)
+            os.replace(path + ".tmp", path)
+            size = os.path.getsize(path)
+        except OSError as e:
+            print(f"Unable to spool {len(events)} webhook events: {e}")
+            self.events_metric.inc(len(events), outcome="dropped")
+            return
+        with self.lock:
+            self.spooled[name] = (size, len(events))
+            self.spool_bytes += size
+        self._trim_spool()
+
+    def _trim_spool(self):
+        stale = []
+        with self.lock:
+            # Oldest spooled batches go first when the disk budget is exceeded
+            while self.spool_bytes > self.max_spool_bytes and self.spooled:
+                name, (size, events) = self.spooled.popitem(last=False)
+                self.spool_bytes -= size
+                stale.append((name, events))
+            total = self.spool_bytes
+        for name, events in stale:
+            try:
+                os.remove(os.path.join(self.spool_dir, name))
+            except OSError:
+                pass
+            self.events_metric.inc(events, outcome="spool_evicted")
+        self.spool_metric.set(total)
+
+    def _unspool(self, name):
+        with self.lock:
+            entry = self.spooled.pop(name, None)
+            if entry is not None:
+                self.spool_bytes -= entry[0]
+            total = self.spool_bytes
+        try:
+            os.remove(os.path.join(self.spool_dir, name))
+        except OSError:
+            pass
+        self.spool_metric.set(total)
+
+    def _start_replay(self, now):
+        """Hand the oldest spooled batch to a sender once the endpoint may be back"""
+        with self.lock:
+            if not self.spooled or self.replaying or (self.endpoint_down and now < self.next_replay):
+                return
+        if not self.in_flight.acquire(blocking=False):
+            return
+        with self.lock:
+            name = next(iter(self.spooled), None)
+            if name is None:
+                self.in_flight.release()
+                return
+            self.replaying = True
+            self.active += 1
+        self.executor.submit(self._replay, name)
+
+    def _replay(self, name):
+        try:
+            try:
+                with open(os.path.join(self.spool_dir, name), "rb") as f:
+                    body = f.read()
+            except OSError:
+                # Trimmed meanwhile or removed by hand; the next replay takes the following file
+                self._unspool(name)
+                return
+            try:
+                self._post(body)
+            except PermanentError:
+                self._unspool(name)
+                return
+            except OSError:
+                with self.lock:
+                    self.endpoint_down = True
+                    self.next_replay = time.monotonic() + self.replay_delay
+                    self.replay_delay = min(self.replay_delay * 2, self.max_backoff_seconds)
+                return
+            with self.lock:
+                self.endpoint_down = False
+                self.replay_delay = self.backoff_seconds
+            self._unspool(name)
+            self.events_metric.inc(len(json.loads(body)), outcome="replayed")
+        finally:
+            with self.lock:
+                self.replaying = False
+                self.active -= 1
+            self.in_flight.release()
+
+    # Shutdown and reporting
+
+    def idle(self):
+        """Nothing queued, in flight or spooled"""
+        with self.lock:
+            return self.queue.empty() and self.active == 0 and not self.spooled
+
+    def close(self, timeout=10.0):
+        """Flush queued events; anything still undelivered ends up in the spool"""
+        self._stop.set()
+        self._batcher.join(timeout)
+        self.executor.shutdown(wait=True)
+
+    def latency_percentiles(self, percentiles=(50, 95, 99)):
+        with self.lock:
+            latencies = sorted(self.latencies)
+        if not latencies:
+            return {}
+        return {p: latencies[min(len(latencies) - 1, int(len(latencies) * p / 100))] for p in percentiles}
+
+
+class StandInServer:
+    """Local incident-service stand-in; fails with 503 while `down` is set"""
+
+    def __init__(self, port=0):
+        server = self
+        self.received = 0
+        self.requests = 0
+        self.down = False
+        self.lock = threading.Lock()
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if server.down:
+                    self.send_response(503)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                events = json.loads(body)
+                with server.lock:
+                    server.received += len(events)
+                    server.requests += 1
+                self.send_response(204)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.port = self.httpd.server_address[1]
+        threading.Thread(target=self.httpd.serve_forever, name="stand-in-http", daemon=True).start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def load_test(events=20000, rate=5000, outage=(1.0, 2.0), batch_size=100, pool_size=4,
+              spool_dir="output/webhook-loadtest-spool"):
+    """Emit events at `rate`/s with an endpoint outage window; report throughput and latency"""
+    server = StandInServer()
+    delivery = WebhookDelivery(f"http://127.0.0.1:{server.port}/events", batch_size=batch_size,
+                               batch_seconds=0.05, pool_size=pool_size, max_retries=2,
+                               backoff_seconds=0.05, max_backoff_seconds=0.5, spool_dir=spool_dir)
+    start = time.monotonic()
+    slowest_emit = 0.0
+    for i in range(events):
+        t = time.monotonic() - start
+        server.down = outage is not None and outage[0] <= t < outage[1]
+        before = time.perf_counter()
+        delivery.emit({"source_id": i % 8, "frame_num": i, "timestamp": time.time(), "faces": [[10, 10, 40, 48, 0.9]]})
+        slowest_emit = max(slowest_emit, time.perf_counter() - before)
+        if rate:
+            target = (i + 1) / rate
+            if target > t:
+                time.sleep(target - t)
+    emitted_for = time.monotonic() - start
+    server.down = False
+
+    # Wait for the queue and spool to drain
+    drain_deadline = time.monotonic() + 30
+    while time.monotonic() < drain_deadline:
+        if server.received >= events or delivery.idle():
+            break
+        time.sleep(0.05)
+    elapsed = time.monotonic() - start
+    delivery.close()
+    server.close()
+
+    latencies = delivery.latency_percentiles()
+    print(f"Emitted {events} events in {emitted_for:.2f}s (slowest emit() {slowest_emit * 1e6:.0f} us)")
+    print(f"Delivered {server.received} in {server.requests} POSTs, {server.received / elapsed:.0f} events/s overall")
+    if latencies:
+        print("Delivery latency (direct sends): " +
+              ", ".join(f"p{p} {v * 1000:.1f} ms" for p, v in latencies.items()))
+    outcomes = REGISTRY.snapshot().get("webhook_events_total", {})
+    print("Outcomes: " + ", ".join(f"{dict(labels)['outcome']} {count}" for labels, count in sorted(outcomes.items())))
+    return server.received
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Webhook delivery load test against a local stand-in server")
+    parser.add_argument("--events", type=int, default=20000)
+    parser.add_argument("--rate", type=float, default=5000, help="events per second, 0 for as fast as possible")
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--pool-size", type=int, default=4)
+    parser.add_argument("--no-outage", action="store_true", help="keep the endpoint up for the whole run")
+    args = parser.parse_args()
+    load_test(args.events, args.rate, None if args.no_outage else (1.0, 2.0), args.batch_size, args.pool_size)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())